@@ -0,0 +1,150 @@
+"""Measures how much concurrent queries hold up an event loop, with and without the async manager.
+
+Builds a synthetic chat.db and runs a mix of searches and dumps concurrently from an asyncio
+loop while a ticker coroutine records how late each of its 1ms sleeps wakes up. Calling the
+synchronous MessagesDbManager from coroutines stalls the loop for as long as each query takes;
+AsyncMessagesDbManager should keep the worst stall around a batch handoff. Sentiment is
+scored without the cache, like a first run.
+
+    $ python benchmarks/bench_async.py --messages 100000
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import click
+from messages.async_messages_db_manager import AsyncMessagesDbManager
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+
+from synthetic_db import SyntheticConfig, generate
+
+TICK_SECONDS = 0.001
+SEARCH_TEXTS = ["dinner", "love", "late", "birthday"]
+GET_NAMES = ["Ann", "Bob", "Cy", "Dana"]
+
+
+async def measure_loop_lag(queries: Callable[[], Awaitable[int]]) -> Dict[str, float]:
+    """Runs queries while ticking, returns rows, seconds and the tick delays in ms."""
+    delays: List[float] = []
+    done = asyncio.Event()
+
+    async def tick() -> None:
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            delays.append((time.perf_counter() - start - TICK_SECONDS) * 1000)
+
+    ticker = asyncio.ensure_future(tick())
+    start = time.perf_counter()
+    num_rows = await queries()
+    seconds = time.perf_counter() - start
+    done.set()
+    await ticker
+    return {
+        "rows": num_rows,
+        "seconds": seconds,
+        "median_lag_ms": statistics.median(delays) if delays else 0.0,
+        "max_lag_ms": max(delays) if delays else 0.0,
+    }
+
+
+def blocking_queries(manager: MessagesDbManager) -> Callable[[], Awaitable[int]]:
+    """The synchronous manager called straight from coroutines."""
+
+    async def search(text: str) -> int:
+        return sum(1 for _ in manager.search_messages_by_text(text))
+
+    async def get(name: str) -> int:
+        rows, _ = manager.get_messages(get_name=name)
+        return sum(1 for _ in rows)
+
+    async def queries() -> int:
+        counts = await asyncio.gather(
+            *[search(x) for x in SEARCH_TEXTS], *[get(x) for x in GET_NAMES]
+        )
+        return sum(counts)
+
+    return queries
+
+
+def async_queries(manager: AsyncMessagesDbManager) -> Callable[[], Awaitable[int]]:
+    async def search(text: str) -> int:
+        num_rows = 0
+        async for _ in manager.search_messages_by_text(text):
+            num_rows += 1
+        return num_rows
+
+    async def get(name: str) -> int:
+        rows, _ = await manager.get_messages(get_name=name)
+        num_rows = 0
+        async for _ in rows:
+            num_rows += 1
+        return num_rows
+
+    async def queries() -> int:
+        counts = await asyncio.gather(
+            *[search(x) for x in SEARCH_TEXTS], *[get(x) for x in GET_NAMES]
+        )
+        return sum(counts)
+
+    return queries
+
+
+async def run_all(db_path: str, address_book_path: str, workers: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    manager = MessagesDbManager(
+        client=MessagesDbClient(db_path=db_path, address_book_path=address_book_path),
+        use_sentiment_cache=False,
+    )
+    # Load VADER and the contacts before measuring
+    sum(1 for _ in manager.search_messages_by_text("", limit_number=1))
+    results["blocking"] = await measure_loop_lag(blocking_queries(manager))
+    manager.close()
+
+    async with AsyncMessagesDbManager(
+        workers=workers,
+        use_sentiment_cache=False,
+        db_path=db_path,
+        address_book_path=address_book_path,
+    ) as async_manager:
+        async for _ in async_manager.search_messages_by_text("", limit_number=1):
+            pass
+        results[f"async, {workers} worker(s)"] = await measure_loop_lag(
+            async_queries(async_manager)
+        )
+    return results
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000, show_default=True)
+@click.option("--workers", "workers", type=int, default=2, show_default=True)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, workers: int, as_json: bool) -> None:
+    """Benchmarks event loop stalls while queries run concurrently."""
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+        )
+        results = asyncio.run(run_all(db_path, address_book_path, workers))
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{'Mode':^22}| {'Rows':^9}| {'Seconds':^9}| {'Median lag (ms)':^16}| {'Max lag (ms)':^13}")
+    click.echo("-" * 76)
+    for mode, result in results.items():
+        click.echo(
+            f"{mode:^22}| {result['rows']:^9,}| {result['seconds']:^9.2f}"
+            f"| {result['median_lag_ms']:^16.2f}| {result['max_lag_ms']:^13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
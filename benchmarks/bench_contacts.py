@@ -0,0 +1,89 @@
+"""Measures loading the merged contact index, cold (reading every AddressBook) and cached.
+
+Builds a synthetic AddressBook and copies it under Sources/ as if the contacts came from
+several accounts, then loads the ContactIndex without its cache, with an empty cache (which
+also fills it) and from the filled cache, reporting the best time over a number of runs.
+
+    $ python benchmarks/bench_contacts.py --contacts 5000 --sources 4
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import click
+from messages.contact_index import ADDRESS_BOOK_SOURCES_DIR, ContactIndex
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def best_ms(load: Callable[[], int], runs: int) -> float:
+    """Best wall time of load over runs, in ms."""
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        load()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+@click.command()
+@click.option("--contacts", "num_contacts", type=int, default=2000, show_default=True)
+@click.option(
+    "--sources",
+    "num_sources",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Per account AddressBooks under Sources/, besides the top level one.",
+)
+@click.option("--runs", "runs", type=int, default=10, show_default=True)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_contacts: int, num_sources: int, runs: int, as_json: bool) -> None:
+    """Benchmarks loading contacts from several AddressBooks, with and without the cache."""
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        _, address_book_dir = generate(
+            SyntheticConfig(num_messages=1000, num_contacts=num_contacts),
+            os.path.join(workdir, "data"),
+        )
+        (address_book_file,) = os.listdir(address_book_dir)
+        for idx in range(num_sources):
+            source_dir = os.path.join(address_book_dir, ADDRESS_BOOK_SOURCES_DIR, f"account-{idx}")
+            os.makedirs(source_dir)
+            shutil.copy(os.path.join(address_book_dir, address_book_file), source_dir)
+        cache_path = os.path.join(workdir, "contact_index.db")
+
+        def load_uncached() -> int:
+            return len(ContactIndex(address_book_dir, use_cache=False).names)
+
+        def load_into_empty_cache() -> int:
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            return len(ContactIndex(address_book_dir, cache_path).names)
+
+        def load_cached() -> int:
+            return len(ContactIndex(address_book_dir, cache_path).names)
+
+        results: Dict[str, float] = {
+            "uncached": best_ms(load_uncached, runs),
+            "empty cache": best_ms(load_into_empty_cache, runs),
+            "cached": best_ms(load_cached, runs),
+        }
+        num_names = load_cached()
+
+    if as_json:
+        click.echo(json.dumps({"names": num_names, "best_ms": results}))
+        return
+
+    click.echo(f"{num_names:,} numbers and emails from {num_sources + 1} AddressBooks")
+    click.echo(f"{'Load':^14}| {'Best (ms)':^10}")
+    click.echo("-" * 26)
+    for mode, milliseconds in results.items():
+        click.echo(f"{mode:^14}| {milliseconds:^10.2f}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,139 @@
+"""Measures `messages` latency cold (every run sets itself up) and warm (forwarded to `serve`).
+
+Builds a synthetic chat.db, then times a few subcommands run through the `messages` entry point
+in a fresh interpreter each time, first with MESSAGES_NO_DAEMON set and then with a daemon
+listening on a socket in a temp dir. We report the best and median wall time over a number of
+runs, plus the round trip to the daemon alone, without starting an interpreter.
+
+    $ python benchmarks/bench_daemon.py --messages 100000 --runs 20
+"""
+
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, List
+
+import click
+from messages.daemon import forward, is_running
+
+from synthetic_db import SyntheticConfig, generate
+
+# Lookups a script would run over and over
+DAEMON_COMMANDS: List[List[str]] = [
+    ["convos", "-t"],
+    ["contacts", "-t", "10"],
+    ["search", "dinner", "-l", "20"],
+    ["get", "-c", "Ann", "-l", "50"],
+]
+
+ENTRY_POINT = "from messages.daemon import main; main()"
+# How long `messages serve` gets to warm up before we give up on it
+SERVE_TIMEOUT_SECONDS = 60
+
+
+def time_runs(run: Callable[[], Any], runs: int) -> Dict[str, float]:
+    """Calls run runs times and returns timing stats in ms."""
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"best_ms": min(timings), "median_ms": statistics.median(timings)}
+
+
+def run_messages(args: List[str], env: Dict[str, str]) -> None:
+    subprocess.run(
+        [sys.executable, "-c", ENTRY_POINT, *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+
+
+def start_daemon(env: Dict[str, str], socket_path: str) -> "subprocess.Popen[bytes]":
+    """Starts `messages serve` and waits until it's listening."""
+    daemon = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-c", ENTRY_POINT, "serve"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVE_TIMEOUT_SECONDS
+    while not is_running(socket_path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            daemon.kill()
+            raise click.ClickException("messages serve didn't start")
+        time.sleep(0.05)
+    return daemon
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=50_000, show_default=True)
+@click.option("--runs", "runs", type=int, default=10, show_default=True, help="Runs per command.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, runs: int, as_json: bool) -> None:
+    """Benchmarks cold runs against runs forwarded to a warm `messages serve`."""
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+        )
+        socket_path = os.path.join(workdir, "messages.sock")
+        env = {
+            **os.environ,
+            "MESSAGES_DB_PATH": db_path,
+            "MESSAGES_ADDRESS_BOOK_PATH": address_book_path,
+            "MESSAGES_CACHE_DIR": os.path.join(workdir, "cache"),
+            "MESSAGES_SOCKET_PATH": socket_path,
+        }
+        cold_env = {**env, "MESSAGES_NO_DAEMON": "1"}
+        for args in DAEMON_COMMANDS:
+            command = " ".join(args)
+            results[command] = {
+                "cold": time_runs(lambda: run_messages(args, cold_env), runs)  # pylint: disable=cell-var-from-loop
+            }
+
+        daemon = start_daemon(env, socket_path)
+        try:
+            with open(os.devnull, "w", encoding="utf-8") as devnull:
+                for args in DAEMON_COMMANDS:
+                    command = " ".join(args)
+                    results[command]["warm"] = time_runs(
+                        lambda: run_messages(args, env), runs  # pylint: disable=cell-var-from-loop
+                    )
+                    # The interpreter start is most of what's left, this is the rest
+                    with redirect_stdout(devnull):
+                        results[command]["round trip"] = time_runs(
+                            lambda: forward(args, socket_path), runs  # pylint: disable=cell-var-from-loop
+                        )
+        finally:
+            # Like Ctrl-C, so it removes its socket
+            daemon.send_signal(signal.SIGINT)
+            daemon.wait()
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(
+        f"{'Command':<30}| {'Cold (ms)':^10}| {'Warm (ms)':^10}| {'Round trip (ms)':^16}| Speedup"
+    )
+    click.echo("-" * 82)
+    for command, stats in results.items():
+        click.echo(
+            f"{'messages ' + command:<30}| {stats['cold']['median_ms']:^10.1f}"
+            f"| {stats['warm']['median_ms']:^10.1f}| {stats['round trip']['median_ms']:^16.1f}"
+            f"| {stats['cold']['median_ms'] / stats['warm']['median_ms']:.1f}x"
+        )
+    click.echo("Times are medians.")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
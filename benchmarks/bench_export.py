@@ -0,0 +1,99 @@
+"""Measures `search --format ...` exports over growing histories.
+
+Exports every message (an empty search matches all of them) from synthetic chat.dbs of
+increasing size to /dev/null and reports throughput and the peak memory tracemalloc saw while
+exporting. Rows are streamed from the cursor to the serializer, so the peak should stay flat
+as the history grows. Sentiment is scored in process and not cached, like a first run.
+
+    $ python benchmarks/bench_export.py --messages 50000 --messages 200000
+"""
+
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import click
+from messages.export import EXPORT_FORMATS, export_rows, open_output
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+from messages.query_types import SearchWithSentimentType
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def export_all(manager: MessagesDbManager, output_format: str) -> Dict[str, float]:
+    """Exports every message to /dev/null, returns rows, seconds and peak MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open_output(os.devnull) as output:
+        num_rows = export_rows(
+            manager.search_messages_by_text(""), SearchWithSentimentType, output_format, output
+        )
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": num_rows, "seconds": seconds, "peak_mb": peak / 1024 / 1024}
+
+
+@click.command()
+@click.option(
+    "--messages",
+    "message_counts",
+    type=int,
+    multiple=True,
+    default=[20_000, 80_000],
+    show_default=True,
+    help="History sizes to export, repeat for more.",
+)
+@click.option(
+    "--format",
+    "output_formats",
+    type=click.Choice(EXPORT_FORMATS),
+    multiple=True,
+    default=EXPORT_FORMATS,
+    show_default=True,
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(message_counts: Tuple[int, ...], output_formats: Tuple[str, ...], as_json: bool) -> None:
+    """Benchmarks streaming exports over histories of different sizes."""
+    results: List[Dict[str, object]] = []
+    for num_messages in message_counts:
+        with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+            db_path, address_book_path = generate(
+                SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+            )
+            manager = MessagesDbManager(
+                client=MessagesDbClient(db_path=db_path, address_book_path=address_book_path),
+                use_sentiment_cache=False,
+            )
+            # Load VADER and build the contact index before measuring
+            for _ in manager.search_messages_by_text("", limit_number=1):
+                pass
+            for output_format in output_formats:
+                results.append(
+                    {
+                        "messages": num_messages,
+                        "format": output_format,
+                        **export_all(manager, output_format),
+                    }
+                )
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{'Messages':^10}| {'Format':^7}| {'Rows/s':^10}| {'Peak (MB)':^10}")
+    click.echo("-" * 42)
+    for result in results:
+        rows_per_second = result["rows"] / result["seconds"]  # type: ignore
+        click.echo(
+            f"{result['messages']:^10,}| {result['format']:^7}| {rows_per_second:^10,.0f}"
+            f"| {result['peak_mb']:^10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
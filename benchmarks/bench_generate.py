@@ -0,0 +1,84 @@
+"""Measures `messages generate` on a single, very long conversation.
+
+Builds synthetic chat.dbs where one contact holds every message and generates the prompt /
+completion file for them, reporting throughput and the peak memory tracemalloc saw. Pairs are
+written as they're completed, so the peak should stay flat as the conversation grows.
+
+    $ python benchmarks/bench_generate.py --messages 100000 --messages 500000
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import click
+from messages.messages_db_client import MessagesDbClient
+from messages.model_generator import ModelGenerator
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def generate_file(generator: ModelGenerator, number: str, workdir: str) -> Dict[str, float]:
+    """Generates the JSONL file for number, returns seconds, peak MB and pairs."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    filename = generator.save_results_to_file(
+        generator.generate_prompt_completion(search_number=number),
+        os.path.join(workdir, "bench"),
+    )
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(filename, encoding="utf-8") as f:
+        num_pairs = sum(1 for _ in f)
+    return {"seconds": seconds, "peak_mb": peak / 1024 / 1024, "pairs": num_pairs}
+
+
+@click.command()
+@click.option(
+    "--messages",
+    "message_counts",
+    type=int,
+    multiple=True,
+    default=[50_000, 200_000],
+    show_default=True,
+    help="Conversation lengths to generate for, repeat for more.",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(message_counts: Tuple[int, ...], as_json: bool) -> None:
+    """Benchmarks prompt / completion generation for one long conversation."""
+    results: List[Dict[str, float]] = []
+    for num_messages in message_counts:
+        with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+            db_path, address_book_path = generate(
+                SyntheticConfig(num_messages=num_messages, num_contacts=1, num_unknown_chats=0),
+                os.path.join(workdir, "data"),
+            )
+            with sqlite3.connect(db_path) as conn:
+                (number,) = conn.execute("SELECT chat_identifier FROM chat;").fetchone()
+            generator = ModelGenerator(
+                MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+            )
+            results.append(
+                {"messages": num_messages, **generate_file(generator, number, workdir)}
+            )
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{'Messages':^10}| {'Pairs':^10}| {'Msgs/s':^10}| {'Peak (MB)':^10}")
+    click.echo("-" * 45)
+    for result in results:
+        click.echo(
+            f"{result['messages']:^10,.0f}| {result['pairs']:^10,.0f}"
+            f"| {result['messages'] / result['seconds']:^10,.0f}| {result['peak_mb']:^10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,102 @@
+"""Measures `messages generate --top N` against running `generate -n` once per chat.
+
+Builds a synthetic chat.db and writes the JSONL files for its N busiest chats both ways: one
+query per chat (a full pass over chat.db each), and the single scan that's split per chat and
+optionally handed to a process pool.
+
+    $ python benchmarks/bench_generate_bulk.py --messages 200000 --top 50 --workers 4
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Dict, List, Tuple
+
+import click
+from messages.messages_db_client import MessagesDbClient
+from messages.model_generator import ModelGenerator
+
+from synthetic_db import SyntheticConfig, generate
+
+TOP_CHATS_QUERY = """
+SELECT chat.chat_identifier
+FROM chat JOIN chat_message_join ON chat.ROWID = chat_message_join.chat_id
+GROUP BY chat.chat_identifier
+ORDER BY COUNT(*) DESC
+LIMIT ?;
+"""
+
+
+def generate_one_by_one(generator: ModelGenerator, numbers: List[str], output_dir: str) -> float:
+    """Runs the single chat generation for each number, returns seconds."""
+    start = time.perf_counter()
+    for number in numbers:
+        generator.save_results_to_file(
+            generator.generate_prompt_completion(search_number=number), number, output_dir
+        )
+    return time.perf_counter() - start
+
+
+def generate_bulk(generator: ModelGenerator, top: int, output_dir: str, workers: int) -> float:
+    """Runs the bulk generation for the top chats, returns seconds."""
+    start = time.perf_counter()
+    for _ in generator.generate_for_top_chats(top, output_dir, workers):
+        pass
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=200_000, show_default=True)
+@click.option("--top", "top", type=int, default=25, show_default=True)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=int,
+    multiple=True,
+    default=[1, 4],
+    show_default=True,
+    help="Process counts to run the bulk mode with, repeat for more.",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, top: int, worker_counts: Tuple[int, ...], as_json: bool) -> None:
+    """Benchmarks one scan for many chats against one query per chat."""
+    results: List[Dict[str, object]] = []
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages, num_contacts=top),
+            os.path.join(workdir, "data"),
+        )
+        with sqlite3.connect(db_path) as conn:
+            numbers = [x for (x,) in conn.execute(TOP_CHATS_QUERY, [top])]
+        generator = ModelGenerator(
+            MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+        )
+        # The generators echo every file, keep that out of the report
+        with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+            results.append(
+                {"mode": "one by one", "seconds": generate_one_by_one(generator, numbers, workdir)}
+            )
+            for workers in worker_counts:
+                results.append(
+                    {
+                        "mode": f"bulk, {workers} worker(s)",
+                        "seconds": generate_bulk(generator, top, workdir, workers),
+                    }
+                )
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{num_messages:,} messages, top {len(numbers)} chats")
+    click.echo(f"{'Mode':^22}| {'Seconds':^10}")
+    click.echo("-" * 34)
+    for result in results:
+        click.echo(f"{result['mode']:^22}| {result['seconds']:^10.2f}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,123 @@
+"""Measures query throughput from several threads sharing one MessagesDbClient.
+
+Builds a synthetic chat.db, then has 1, 2, 4, ... threads each run a mix of searches and dumps
+through the same client, reading every row. The same mix is run through a shared
+MessagesDbManager as well, which adds sentiment (scored once, then read from the sentiment
+cache) and the stats cache on top of the client. With a pool of one connection the threads take
+turns for each whole query, like the single connection the client used to have. With a
+connection per thread they run side by side: sqlite releases the GIL while it steps a
+statement, so throughput should grow with the threads up to the number of cores.
+
+    $ python benchmarks/bench_pool.py --messages 100000 --threads 8
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List
+
+import click
+from messages import utils
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+
+from synthetic_db import SyntheticConfig, generate
+
+SEARCH_TEXTS = ["dinner", "love", "late", "birthday"]
+GET_NAMES = ["Ann", "Bob", "Cy", "Dana"]
+
+
+def query_mix(client: MessagesDbClient) -> List[Callable[[], Iterator[Any]]]:
+    return [
+        *[lambda x=text: client.search_messages_by_text(x) for text in SEARCH_TEXTS],
+        *[lambda x=name: client.get_messages(get_name=x) for name in GET_NAMES],
+    ]
+
+
+def manager_query_mix(manager: MessagesDbManager) -> List[Callable[[], Iterator[Any]]]:
+    return [
+        *[lambda x=text: manager.search_messages_by_text(x) for text in SEARCH_TEXTS],
+        *[lambda x=name: manager.get_messages(get_name=x)[0] for name in GET_NAMES],
+        lambda: iter(manager.message_stats()),
+    ]
+
+
+def queries_per_second(
+    queries: List[Callable[[], Iterator[Any]]], num_threads: int, rounds: int
+) -> float:
+    """Every thread runs the query mix rounds times, returns queries finished per second."""
+
+    def run_thread() -> int:
+        num_queries = 0
+        for _ in range(rounds):
+            for query in queries:
+                sum(1 for _ in query())
+                num_queries += 1
+        return num_queries
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        start = time.perf_counter()
+        num_queries = sum(executor.map(lambda _: run_thread(), range(num_threads)))
+        seconds = time.perf_counter() - start
+    return num_queries / seconds
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000, show_default=True)
+@click.option("--threads", "max_threads", type=int, default=8, show_default=True)
+@click.option("--rounds", "rounds", type=int, default=2, show_default=True, help="Query mixes per thread.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, max_threads: int, rounds: int, as_json: bool) -> None:
+    """Benchmarks concurrent searches and dumps with one shared connection and with a pool,
+    through the client alone and through a manager."""
+    thread_counts = [1]
+    while thread_counts[-1] * 2 <= max_threads:
+        thread_counts.append(thread_counts[-1] * 2)
+
+    results: Dict[str, Dict[int, Dict[str, float]]] = {"client": {}, "manager": {}}
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+        )
+        # Keep the sentiment and stats caches out of the real cache dir
+        utils.CACHE_DIR = os.path.join(workdir, "cache")
+        for num_threads in thread_counts:
+            for by_threads in results.values():
+                by_threads[num_threads] = {}
+            for mode, pool_size in (("shared", 1), ("pooled", num_threads)):
+                client = MessagesDbClient(
+                    db_path=db_path, address_book_path=address_book_path, pool_size=pool_size
+                )
+                # Load the contacts and warm every connection's page cache first
+                queries_per_second(query_mix(client), num_threads, 1)
+                results["client"][num_threads][mode] = queries_per_second(
+                    query_mix(client), num_threads, rounds
+                )
+                manager = MessagesDbManager(client=client)
+                # The first round also fills the sentiment and stats caches
+                queries_per_second(manager_query_mix(manager), num_threads, 1)
+                results["manager"][num_threads][mode] = queries_per_second(
+                    manager_query_mix(manager), num_threads, rounds
+                )
+                manager.close()
+
+    if as_json:
+        click.echo(json.dumps({"cpus": os.cpu_count(), "queries_per_second": results}))
+        return
+
+    click.echo(f"{os.cpu_count()} CPU(s)")
+    for entry_point, by_threads in results.items():
+        click.echo(f"\nThrough the {entry_point}")
+        click.echo(f"{'Threads':^9}| {'Shared (q/s)':^13}| {'Pooled (q/s)':^13}| Speedup")
+        click.echo("-" * 46)
+        for num_threads, result in by_threads.items():
+            click.echo(
+                f"{num_threads:^9}| {result['shared']:^13.1f}| {result['pooled']:^13.1f}"
+                f"| {result['pooled'] / result['shared']:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,122 @@
+"""Measures how fast Printer renders a large message dump to a pipe.
+
+Compares the per row click.echo renderer Printer used to have (quadratic wrapping included)
+with the current buffered one, both writing the same rows to /dev/null. No chat.db involved,
+the rows are built up front so only rendering is timed.
+
+    $ python benchmarks/bench_printer.py --rows 100000
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, List
+
+import click
+from messages.printer import Printer, buffered_output
+from messages.query_types import SearchWithSentimentType
+from messages.sentiment_classifier import OverallSentiment
+from messages.utils import cleanse_message
+
+TEXTS = [
+    "ok",
+    "on my way",
+    "love you",
+    "I hate mondays, " * 12,
+    "lol " * 60,
+]
+
+
+def legacy_split_text_shorter(text: str, column_start_pos: int, column_length: int) -> str:
+    num_lines = len(text) // column_length
+    line_builder = ""
+    for idx in range(num_lines + 1):
+        init_padding = " " * column_start_pos if idx != 0 else ""
+        line_content = text[idx * column_length : (idx + 1) * column_length]
+        rest_of_line_padding = " " * (column_length - len(line_content))
+        line_builder += init_padding + line_content + rest_of_line_padding + "|\n"
+    return line_builder[:-2]
+
+
+def legacy_print(results: Iterable[SearchWithSentimentType]) -> None:
+    """Printer.print_generic_message_data as it used to be, one click.echo per row."""
+    for idx, result in enumerate(results):
+        message_text = cleanse_message(result.message_text)
+        if len(message_text) > 75:
+            message_text = legacy_split_text_shorter(message_text, 71, 75)
+        name = result.full_name if result.full_name is not None else ""
+        click.echo(
+            f"{idx+1:^5}| "
+            + f"{result.message_date:^20}| "
+            + f"{name + ' (' + result.message_number + ')':^40}| "
+            + f"{message_text:<75}| "
+            + f"{result.sentiment:^10}| "
+            + f"{result.is_from_me:^9}"
+        )
+
+
+def buffered_print(results: Iterable[SearchWithSentimentType]) -> None:
+    with buffered_output(use_pager=False):
+        Printer.print_generic_message_data(results)
+
+
+def build_rows(num_rows: int) -> List[SearchWithSentimentType]:
+    return [
+        SearchWithSentimentType(
+            "2023-03-08 20:56:40",
+            TEXTS[idx % len(TEXTS)],
+            bool(idx % 2),
+            f"+1513490{idx % 10000:04d}",
+            OverallSentiment.NEUTRAL,
+            "Ann Lee",
+        )
+        for idx in range(num_rows)
+    ]
+
+
+def time_to_devnull(
+    render: Callable[[List[SearchWithSentimentType]], None],
+    rows: List[SearchWithSentimentType],
+) -> float:
+    """Renders rows with stdout pointed at /dev/null, returns the seconds taken."""
+    stdout_fd = os.dup(sys.stdout.fileno())
+    sys.stdout.flush()
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        os.dup2(devnull.fileno(), sys.stdout.fileno())
+        try:
+            start = time.perf_counter()
+            render(rows)
+            sys.stdout.flush()
+            return time.perf_counter() - start
+        finally:
+            os.dup2(stdout_fd, sys.stdout.fileno())
+            os.close(stdout_fd)
+
+
+@click.command()
+@click.option("--rows", "num_rows", type=int, default=100_000, show_default=True)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_rows: int, as_json: bool) -> None:
+    """Benchmarks rendering a message dump to a pipe."""
+    rows = build_rows(num_rows)
+    renderers: Dict[str, Callable[[List[SearchWithSentimentType]], None]] = {
+        "click.echo per row": legacy_print,
+        "buffered": buffered_print,
+    }
+    results = {name: time_to_devnull(render, rows) for name, render in renderers.items()}
+
+    if as_json:
+        click.echo(json.dumps({"rows": num_rows, "seconds": results}))
+        return
+
+    click.echo(f"{'Renderer':<20}| {'Seconds':^10}| {'Rows/s':^12}")
+    click.echo("-" * 46)
+    for name, seconds in results.items():
+        click.echo(f"{name:<20}| {seconds:^10.3f}| {num_rows / seconds:^12,.0f}")
+    speedup = results["click.echo per row"] / results["buffered"]
+    click.echo(f"Buffered rendering: {speedup:.2f}x faster")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
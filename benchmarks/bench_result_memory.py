@@ -0,0 +1,98 @@
+"""Measures how much memory a full `all_messages_sorted` dump takes per representation.
+
+Compares the row dataclasses query_types used to have, the current NamedTuple rows and
+MessageResultSet, all built from the same synthetic chat.db. Sizes are what tracemalloc sees
+allocated once the dump is held in memory, message text and guids included.
+
+    $ python benchmarks/bench_result_memory.py --messages 1000000
+"""
+
+import gc
+import json
+import os
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import click
+from messages.messages_db_client import MessagesDbClient
+from messages.query_types import AllMessageType
+from messages.result_set import MessageResultSet
+
+from synthetic_db import SyntheticConfig, generate
+
+
+@dataclass
+class LegacyAllMessageType:
+    """AllMessageType as it used to be defined, one dict backed object per row."""
+
+    message_guid: str
+    message_date: str
+    message_text: Optional[str]
+    is_from_me: bool
+    message_number: str
+    full_name: Optional[str] = None
+
+
+def measure(build: Callable[[], Any]) -> Dict[str, float]:
+    """Returns the memory still allocated by build()'s result, and the peak while building."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_rows = len(result)
+    del result
+    return {
+        "rows": num_rows,
+        "held_mb": current / 1024 / 1024,
+        "peak_mb": peak / 1024 / 1024,
+        "bytes_per_row": current / num_rows if num_rows else 0.0,
+    }
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=200_000, show_default=True)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, as_json: bool) -> None:
+    """Benchmarks memory held by a full message dump."""
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+        )
+        client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+        # Build the contact index up front so it isn't counted against the first measurement
+        for _ in client.all_messages_sorted(limit_number=1):
+            pass
+
+        builders: Dict[str, Callable[[], Any]] = {
+            "dataclass rows": lambda: [
+                LegacyAllMessageType(*x) for x in client.all_messages_sorted()
+            ],
+            "namedtuple rows": lambda: [
+                AllMessageType(*x) for x in client.all_messages_sorted()
+            ],
+            "MessageResultSet": lambda: MessageResultSet.from_rows(
+                client.all_messages_sorted(unix_dates=True)
+            ),
+        }
+        results = {name: measure(build) for name, build in builders.items()}
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{'Representation':<18}| {'Held (MB)':^11}| {'Peak (MB)':^11}| {'Bytes/row':^10}")
+    click.echo("-" * 56)
+    for name, stats in results.items():
+        click.echo(
+            f"{name:<18}| {stats['held_mb']:^11.1f}| {stats['peak_mb']:^11.1f}"
+            f"| {stats['bytes_per_row']:^10.0f}"
+        )
+    saving = 1 - results["MessageResultSet"]["held_mb"] / results["dataclass rows"]["held_mb"]
+    click.echo(f"MessageResultSet holds {saving:.0%} less than dataclass rows.")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
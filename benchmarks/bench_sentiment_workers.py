@@ -0,0 +1,100 @@
+"""Compares serial sentiment scoring against the process pool (`messages --workers N`).
+
+Scores a synthetic stream of messages the same way MessagesDbManager does (batches of
+SENTIMENT_BATCH_SIZE through SentimentAnalysisModel.analyze_batches), checks that every
+worker count produces exactly the serial results, and reports the speedup.
+
+    $ python benchmarks/bench_sentiment_workers.py --messages 200000 --workers 2 --workers 8
+"""
+
+import json
+import os
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import click
+from messages.messages_db_manager import SENTIMENT_BATCH_SIZE
+from messages.sentiment_classifier import SentimentAnalysisModel, SentimentResult
+from messages.utils import chunked
+
+VOCABULARY = (
+    "ok lol haha on my way love you miss you great game that was awful not bad "
+    "can't wait so good terrible day happy birthday congrats sorry see you soon "
+    "what time dinner tonight honestly the worst amazing news call me later"
+).split()
+
+
+def synthetic_messages(num_messages: int, seed: int) -> List[Optional[str]]:
+    """Mostly short, often repeated messages, roughly like a real history."""
+    rng = random.Random(seed)
+    messages: List[Optional[str]] = []
+    for _ in range(num_messages):
+        if rng.random() < 0.02:
+            messages.append(None)
+            continue
+        num_words = min(int(rng.expovariate(0.25)) + 1, 40)
+        messages.append(" ".join(rng.choice(VOCABULARY) for _ in range(num_words)))
+    return messages
+
+
+def score(
+    messages: List[Optional[str]], workers: int
+) -> Tuple[float, List[SentimentResult]]:
+    """Returns the wall time and results of scoring messages with workers processes."""
+    model = SentimentAnalysisModel(workers=workers)
+
+    def batches() -> Iterator[Tuple[int, List[Optional[str]]]]:
+        for idx, batch in enumerate(chunked(messages, SENTIMENT_BATCH_SIZE)):
+            yield (idx, batch)
+
+    start = time.perf_counter()
+    results: List[SentimentResult] = []
+    for _, scores in model.analyze_batches(batches()):
+        results.extend(scores)
+    elapsed = time.perf_counter() - start
+    model.shutdown()
+    return (elapsed, results)
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=int,
+    multiple=True,
+    help="Worker counts to compare against serial. Defaults to 2, 4 and the CPU count.",
+)
+@click.option("--seed", "seed", type=int, default=7)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(
+    num_messages: int, worker_counts: Tuple[int, ...], seed: int, as_json: bool
+) -> None:
+    """Benchmarks serial vs. process pool sentiment scoring."""
+    messages = synthetic_messages(num_messages, seed)
+    worker_counts = worker_counts or tuple(sorted({2, 4, os.cpu_count() or 1}))
+
+    serial_time, serial_results = score(messages, workers=1)
+    runs: Dict[int, Dict[str, float]] = {1: {"seconds": serial_time, "speedup": 1.0}}
+    for workers in worker_counts:
+        elapsed, results = score(messages, workers=workers)
+        if results != serial_results:
+            raise click.ClickException(f"Results with {workers} workers differ from serial")
+        runs[workers] = {"seconds": elapsed, "speedup": serial_time / elapsed}
+
+    if as_json:
+        click.echo(json.dumps({"messages": num_messages, "runs": runs}))
+        return
+
+    click.echo(f"Scored {num_messages:,} messages (results identical across runs)")
+    click.echo(f"{'Workers':^9}| {'Seconds':^10}| {'Speedup':^9}")
+    click.echo("-" * 31)
+    for workers, stats in runs.items():
+        click.echo(
+            f"{workers:^9}| {stats['seconds']:^10.2f}| {stats['speedup']:^9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
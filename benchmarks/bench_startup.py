@@ -0,0 +1,80 @@
+"""Measures CLI startup time so import-time regressions are visible.
+
+Each command is run in a fresh interpreter, the same way the `messages` entry point is,
+and we report the best and median wall time over a number of runs.
+
+    $ python benchmarks/bench_startup.py --runs 20
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import click
+
+# Subcommands that shouldn't need nltk or VADER
+STARTUP_COMMANDS: List[List[str]] = [
+    ["--help"],
+    ["search", "--help"],
+    ["convos", "-t"],
+]
+
+ENTRY_POINT = "from messages.cli import cli; cli()"
+
+
+def time_command(args: List[str], runs: int) -> Dict[str, float]:
+    """Runs `messages <args>` runs times and returns timing stats in ms."""
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", ENTRY_POINT, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"best_ms": min(timings), "median_ms": statistics.median(timings)}
+
+
+def heavy_modules_imported() -> List[str]:
+    """Lists heavy modules pulled in just by importing the CLI."""
+    code = (
+        "import sys, messages.cli; "
+        "print(','.join(m for m in ('nltk', 'numpy') if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    return [x for x in output.split(",") if x]
+
+
+@click.command()
+@click.option("--runs", "runs", type=int, default=10, help="Runs per command.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(runs: int, as_json: bool) -> None:
+    """Benchmarks `messages` startup."""
+    no_args: List[str] = []
+    results = {
+        " ".join(args): time_command(args, runs)
+        for args in [no_args] + STARTUP_COMMANDS
+    }
+    heavy_modules = heavy_modules_imported()
+    if as_json:
+        click.echo(json.dumps({"commands": results, "heavy_imports": heavy_modules}))
+        return
+
+    click.echo(f"{'Command':<25}| {'Best (ms)':^12}| {'Median (ms)':^12}")
+    click.echo("-" * 52)
+    for command, stats in results.items():
+        click.echo(
+            f"{'messages ' + command:<25}| {stats['best_ms']:^12.1f}| {stats['median_ms']:^12.1f}"
+        )
+    click.echo(f"Heavy modules imported at startup: {heavy_modules or 'none'}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,120 @@
+"""Measures repeated searches from one long-running client, with and without statement reuse.
+
+Every query text in messages/queries.py is fixed and user input is bound, so sqlite3's
+per-connection statement cache compiles each query once. This runs the same mix of searches
+and number lookups (different terms and limits every call) against a client with the cache
+enabled and one with it disabled, which is what every call used to cost when the SQL was
+formatted per call.
+
+    $ python benchmarks/bench_statement_cache.py --messages 200000 --repeats 50
+"""
+
+import json
+import os
+import statistics
+import tempfile
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Type
+
+import click
+from messages.messages_db_client import MessagesDbClient
+
+from synthetic_db import SyntheticConfig, generate
+
+SEARCH_TERMS = ["ok", "love", "on my way", "can't wait", 'he said "hi"', "100%", "dinner"]
+NUMBERS = ["201", "555", "0"]
+LIMITS = [1, 5, 20]
+
+
+class UncachedMessagesDbClient(MessagesDbClient):
+    """Recompiles every statement, like a client that builds new SQL text per call."""
+
+    STATEMENT_CACHE_SIZE = 0
+
+
+def run_calls(client: MessagesDbClient, repeats: int) -> List[float]:
+    """Runs every search / lookup repeats times and returns per call latencies in ms."""
+    calls: List[Callable[[], Iterator[Any]]] = []
+    for idx, term in enumerate(SEARCH_TERMS):
+        calls.append(
+            partial(
+                client.search_messages_by_text,
+                term,
+                limit_number=LIMITS[idx % len(LIMITS)],
+            )
+        )
+    for idx, number in enumerate(NUMBERS):
+        calls.append(
+            partial(
+                client.get_messages,
+                get_number=number,
+                limit_number=LIMITS[idx % len(LIMITS)],
+            )
+        )
+
+    # Warm up, this also builds the contact index
+    for call in calls:
+        for _ in call():
+            pass
+
+    timings: List[float] = []
+    for _ in range(repeats):
+        for call in calls:
+            start = time.perf_counter()
+            for _ in call():
+                pass
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    return {
+        "calls": len(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.mean(timings),
+        "total_ms": sum(timings),
+    }
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000, show_default=True)
+@click.option("--repeats", "repeats", type=int, default=20, help="Times each call is repeated.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(num_messages: int, repeats: int, as_json: bool) -> None:
+    """Benchmarks repeated searches with and without statement reuse."""
+    with tempfile.TemporaryDirectory(prefix="imessage-bench-") as workdir:
+        db_path, address_book_path = generate(
+            SyntheticConfig(num_messages=num_messages), os.path.join(workdir, "data")
+        )
+        client_types: Dict[str, Type[MessagesDbClient]] = {
+            "cached": MessagesDbClient,
+            "uncached": UncachedMessagesDbClient,
+        }
+        results = {
+            name: summarize(
+                run_calls(
+                    client_type(db_path=db_path, address_book_path=address_book_path),
+                    repeats,
+                )
+            )
+            for name, client_type in client_types.items()
+        }
+
+    if as_json:
+        click.echo(json.dumps(results))
+        return
+
+    click.echo(f"{'Statements':<12}| {'Calls':^8}| {'Median (ms)':^12}| {'Mean (ms)':^12}")
+    click.echo("-" * 50)
+    for name, stats in results.items():
+        click.echo(
+            f"{name:<12}| {stats['calls']:^8}| {stats['median_ms']:^12.3f}| {stats['mean_ms']:^12.3f}"
+        )
+    # Medians, the few calls that scan the whole history would drown out the compile time
+    speedup = results["uncached"]["median_ms"] / results["cached"]["median_ms"]
+    click.echo(f"Reusing compiled statements: {speedup:.2f}x faster per median call")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
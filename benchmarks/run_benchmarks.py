@@ -0,0 +1,206 @@
+"""Times every `messages` subcommand end to end against a synthetic (or given) chat.db.
+
+Each command runs in a fresh interpreter with MESSAGES_DB_PATH / MESSAGES_ADDRESS_BOOK_PATH
+pointing at the databases and an isolated MESSAGES_CACHE_DIR, so runs are reproducible on any
+machine, Linux included. Results are written as JSON so they can be tracked over time.
+
+    $ python benchmarks/run_benchmarks.py --messages 1000000 --output results.json
+    $ python benchmarks/run_benchmarks.py --db-path ~/Library/Messages/chat.db \\
+        --address-book-path ~/Library/Application\\ Support/AddressBook --runs 3
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, cast
+
+import click
+
+from synthetic_db import SyntheticConfig, generate
+
+ENTRY_POINT = "from messages.cli import cli; cli()"
+
+# A few contacts from the synthetic data; override with --contact / --number on real data
+DEFAULT_CONTACT = "Ann"
+DEFAULT_NUMBER = "555"
+DEFAULT_SEARCH_TEXT = "love"
+DEFAULT_DATE = "2020-06-15"
+
+
+def benchmark_commands(contact: str, number: str, text: str, date: str) -> Dict[str, List[str]]:
+    return {
+        "convos -t": ["convos", "-t"],
+        "contacts -t 10": ["contacts", "-t", "10"],
+        "contacts -l": ["contacts", "-l"],
+        "search": ["search", text],
+        "search -c": ["search", text, "-c", contact],
+        "get -c": ["get", "-c", contact],
+        "get -n": ["get", "-n", number],
+        "get -d": ["get", "-d", date],
+        "sentiment -c": ["sentiment", "-c", contact, "-p", "week"],
+        # Only the first run scans, the rest are answered from the stats cache
+        "stats": ["stats"],
+        "stats -c": ["stats", "-c", contact],
+        "generate -c": ["generate", "-c", contact],
+    }
+
+
+def profile_command(args: List[str], env: Dict[str, str], cwd: str) -> Optional[Dict[str, Any]]:
+    """Runs `messages --profile --profile-format json <args>` once and returns its report."""
+    completed = subprocess.run(
+        [sys.executable, "-c", ENTRY_POINT, "--profile", "--profile-format", "json", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        cwd=cwd,
+        text=True,
+        check=False,
+    )
+    # The report is the last thing written to stderr
+    lines = completed.stderr.strip().splitlines()
+    try:
+        return cast(Dict[str, Any], json.loads(lines[-1]))
+    except (IndexError, ValueError):
+        return None
+
+
+def time_command(args: List[str], runs: int, env: Dict[str, str], cwd: str) -> Dict[str, Any]:
+    """Runs `messages <args>` runs times and returns timing stats in seconds."""
+    timings: List[float] = []
+    returncode = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-c", ENTRY_POINT, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            cwd=cwd,
+            check=False,
+        )
+        timings.append(time.perf_counter() - start)
+        returncode = returncode or completed.returncode
+    return {
+        "args": args,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "max_s": max(timings),
+        "returncode": returncode,
+    }
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000, show_default=True)
+@click.option("--contacts", "num_contacts", type=int, default=500, show_default=True)
+@click.option("--skew", "skew", type=float, default=1.1, show_default=True)
+@click.option(
+    "--db-path",
+    "db_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Benchmark an existing chat.db instead of generating one.",
+)
+@click.option(
+    "--address-book-path",
+    "address_book_path",
+    type=click.Path(exists=True, file_okay=False),
+    help="AddressBook directory to use with --db-path.",
+)
+@click.option("--contact", "contact", type=str, default=DEFAULT_CONTACT, show_default=True)
+@click.option("--number", "number", type=str, default=DEFAULT_NUMBER, show_default=True)
+@click.option("--text", "text", type=str, default=DEFAULT_SEARCH_TEXT, show_default=True)
+@click.option("--date", "date", type=str, default=DEFAULT_DATE, show_default=True)
+@click.option("--runs", "runs", type=int, default=3, help="Runs per command.")
+@click.option(
+    "--output",
+    "output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write JSON results here.",
+)
+@click.option(
+    "--profile",
+    "profile",
+    is_flag=True,
+    default=False,
+    help="Also do one `messages --profile` run per command and keep its per-stage breakdown.",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Emit JSON.")
+def main(
+    num_messages: int,
+    num_contacts: int,
+    skew: float,
+    db_path: Optional[str],
+    address_book_path: Optional[str],
+    contact: str,
+    number: str,
+    text: str,
+    date: str,
+    runs: int,
+    output: Optional[str],
+    profile: bool,
+    as_json: bool,
+) -> None:
+    """Benchmarks every `messages` subcommand end to end."""
+    workdir = tempfile.mkdtemp(prefix="imessage-bench-")
+    try:
+        metadata: Dict[str, Any] = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": runs,
+        }
+        if db_path is None:
+            config = SyntheticConfig(
+                num_messages=num_messages, num_contacts=num_contacts, skew=skew
+            )
+            start = time.perf_counter()
+            db_path, address_book_path = generate(config, os.path.join(workdir, "data"))
+            metadata["synthetic"] = {
+                "messages": num_messages,
+                "contacts": num_contacts,
+                "skew": skew,
+                "generate_s": time.perf_counter() - start,
+            }
+        metadata["db_path"] = db_path
+
+        env = dict(os.environ)
+        env["MESSAGES_DB_PATH"] = db_path
+        if address_book_path is not None:
+            env["MESSAGES_ADDRESS_BOOK_PATH"] = address_book_path
+        env["MESSAGES_CACHE_DIR"] = os.path.join(workdir, "cache")
+        cwd = os.path.join(workdir, "cwd")
+        os.makedirs(cwd, exist_ok=True)
+
+        results = {
+            name: time_command(args, runs, env, cwd)
+            for name, args in benchmark_commands(contact, number, text, date).items()
+        }
+        if profile:
+            for stats in results.values():
+                stats["profile"] = profile_command(stats["args"], env, cwd)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"metadata": metadata, "commands": results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if as_json:
+        click.echo(json.dumps(report))
+        return
+
+    click.echo(f"{'Command':<25}| {'Min (s)':^10}| {'Median (s)':^11}| {'Exit':^5}")
+    click.echo("-" * 56)
+    for name, stats in results.items():
+        click.echo(
+            f"{'messages ' + name:<25}| {stats['min_s']:^10.3f}| {stats['median_s']:^11.3f}"
+            f"| {stats['returncode']:^5}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,322 @@
+"""Generates a synthetic chat.db and AddressBook so the tool can be benchmarked anywhere.
+
+The databases use the same table and column names as the real ones (the subset this tool
+reads, plus a few neighbours), with message volume per chat following a Zipf-like skew so a
+handful of contacts dominate the history, like a real one.
+
+    $ python benchmarks/synthetic_db.py --messages 1000000 --output-dir /tmp/synthetic
+    $ MESSAGES_DB_PATH=/tmp/synthetic/chat.db \\
+      MESSAGES_ADDRESS_BOOK_PATH=/tmp/synthetic/AddressBook messages contacts -t 10
+"""
+
+import os
+import random
+import sqlite3
+from dataclasses import dataclass
+from itertools import accumulate, islice
+from typing import Iterator, List, Optional, Tuple
+
+import click
+
+CHAT_DB_SCHEMA = """
+CREATE TABLE chat (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    guid TEXT UNIQUE NOT NULL,
+    style INTEGER,
+    chat_identifier TEXT,
+    service_name TEXT,
+    display_name TEXT
+);
+CREATE TABLE handle (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE,
+    id TEXT NOT NULL,
+    service TEXT NOT NULL
+);
+CREATE TABLE message (
+    ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    guid TEXT UNIQUE NOT NULL,
+    text TEXT,
+    handle_id INTEGER DEFAULT 0,
+    service TEXT,
+    date INTEGER,
+    date_read INTEGER,
+    is_from_me INTEGER DEFAULT 0,
+    cache_has_attachments INTEGER DEFAULT 0
+);
+CREATE TABLE chat_handle_join (
+    chat_id INTEGER REFERENCES chat (ROWID) ON DELETE CASCADE,
+    handle_id INTEGER REFERENCES handle (ROWID) ON DELETE CASCADE,
+    UNIQUE(chat_id, handle_id)
+);
+CREATE TABLE chat_message_join (
+    chat_id INTEGER REFERENCES chat (ROWID) ON DELETE CASCADE,
+    message_id INTEGER REFERENCES message (ROWID) ON DELETE CASCADE,
+    message_date INTEGER DEFAULT 0,
+    PRIMARY KEY (chat_id, message_id)
+);
+CREATE INDEX message_idx_date ON message(date);
+CREATE INDEX message_idx_handle ON message(handle_id, date);
+CREATE INDEX chat_message_join_idx_message_id_only ON chat_message_join(message_id);
+CREATE INDEX chat_message_join_idx_message_date_id_chat_id
+    ON chat_message_join(chat_id, message_date, message_id);
+"""
+
+ADDRESS_BOOK_SCHEMA = """
+CREATE TABLE ZABCDRECORD (
+    Z_PK INTEGER PRIMARY KEY,
+    Z_ENT INTEGER,
+    ZFIRSTNAME VARCHAR,
+    ZLASTNAME VARCHAR,
+    ZORGANIZATION VARCHAR
+);
+CREATE TABLE ZABCDPHONENUMBER (
+    Z_PK INTEGER PRIMARY KEY,
+    ZOWNER INTEGER,
+    ZLABEL VARCHAR,
+    ZFULLNUMBER VARCHAR
+);
+CREATE TABLE ZABCDEMAILADDRESS (
+    Z_PK INTEGER PRIMARY KEY,
+    ZOWNER INTEGER,
+    ZLABEL VARCHAR,
+    ZADDRESS VARCHAR
+);
+CREATE INDEX ZABCDPHONENUMBER_ZOWNER_INDEX ON ZABCDPHONENUMBER (ZOWNER);
+CREATE INDEX ZABCDEMAILADDRESS_ZOWNER_INDEX ON ZABCDEMAILADDRESS (ZOWNER);
+"""
+
+FIRST_NAMES = (
+    "Ann Bob Cy Dana Eli Fay Gus Hal Ida Jo Kim Lou Max Ned Oli Pam Quin Rae Sam Tess "
+    "Uma Vic Wes Xia Yara Zed"
+).split()
+LAST_NAMES = (
+    "Lee Smith Jones Brown Garcia Miller Davis Lopez Wilson Moore Taylor Clark Hall Young King"
+).split()
+# How the same number shows up when typed into Contacts
+PHONE_FORMATS = [
+    "+1 ({area}) {prefix}-{line}",
+    "({area}) {prefix}-{line}",
+    "{area}-{prefix}-{line}",
+    "1{area}{prefix}{line}",
+    "{area}{prefix}{line}",
+]
+# Short and repetitive, like real texting
+MESSAGE_TEXTS = [
+    "ok", "lol", "haha", "on my way", "sounds good", "love you", "miss you", "thanks!",
+    "can't wait", "what time?", "running late sorry", "that was awful", "not bad at all",
+    "happy birthday!!", "congrats, so proud of you", "call me later", "dinner tonight?",
+    "honestly the worst day", "amazing news", "see you soon", "yes", "no", "maybe",
+    'he said "hi"', "100% sure", "Liked “see you soon”", "Loved “thanks!”",
+]
+# chat.db dates are nanoseconds since 2001-01-01
+NANOSECONDS_PER_SECOND = 1_000_000_000
+HISTORY_START = 500_000_000 * NANOSECONDS_PER_SECOND  # Nov 2016
+HISTORY_SECONDS = 8 * 365 * 24 * 60 * 60
+INSERT_BATCH_SIZE = 10_000
+
+
+@dataclass
+class SyntheticConfig:
+    """Knobs for the generated databases."""
+
+    num_messages: int = 100_000
+    num_contacts: int = 500
+    # Chats that aren't saved contacts (unknown numbers, emails, group chats, short codes)
+    num_unknown_chats: int = 200
+    # Zipf exponent for messages per chat, higher is more skewed
+    skew: float = 1.1
+    # Fraction of messages without text (attachments, reactions, ...)
+    empty_text_rate: float = 0.03
+    seed: int = 42
+
+
+@dataclass
+class SyntheticChat:
+    chat_identifier: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    full_number: Optional[str] = None
+    email: Optional[str] = None
+
+
+def build_chats(config: SyntheticConfig, rng: random.Random) -> List[SyntheticChat]:
+    """Builds the chat handles, with AddressBook entries for the saved contacts."""
+    chats: List[SyntheticChat] = []
+    used_numbers = set()
+
+    def new_number() -> Tuple[str, str, str]:
+        while True:
+            parts = (
+                str(rng.randint(201, 989)),
+                str(rng.randint(200, 999)),
+                f"{rng.randint(0, 9999):04d}",
+            )
+            if parts not in used_numbers:
+                used_numbers.add(parts)
+                return parts
+
+    for idx in range(config.num_contacts):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES) if rng.random() > 0.1 else None
+        if idx % 10 == 9:
+            email = f"{first_name.lower()}.{idx}@example.com"
+            chats.append(SyntheticChat(email, first_name, last_name, email=email))
+            continue
+        area, prefix, line = new_number()
+        full_number = rng.choice(PHONE_FORMATS).format(area=area, prefix=prefix, line=line)
+        chats.append(
+            SyntheticChat(f"+1{area}{prefix}{line}", first_name, last_name, full_number)
+        )
+
+    for idx in range(config.num_unknown_chats):
+        kind = idx % 4
+        if kind == 0:
+            chats.append(SyntheticChat(f"chat{rng.randint(10**17, 10**18)}"))
+        elif kind == 1:
+            chats.append(SyntheticChat(f"{rng.randint(10000, 99999)}"))
+        elif kind == 2:
+            chats.append(SyntheticChat(f"stranger{idx}@example.com"))
+        else:
+            area, prefix, line = new_number()
+            chats.append(SyntheticChat(f"+1{area}{prefix}{line}"))
+
+    rng.shuffle(chats)
+    return chats
+
+
+def generate_messages(
+    config: SyntheticConfig, num_chats: int, rng: random.Random
+) -> Iterator[Tuple[int, str, Optional[str], int, int, int]]:
+    """Yields (chat ROWID, guid, text, handle ROWID, date, is_from_me) in date order."""
+    cum_weights = list(
+        accumulate(1 / (rank + 1) ** config.skew for rank in range(num_chats))
+    )
+    chat_ids = list(range(1, num_chats + 1))
+    mean_gap = HISTORY_SECONDS / max(config.num_messages, 1)
+    date = HISTORY_START
+    for idx in range(config.num_messages):
+        chat_id = rng.choices(chat_ids, cum_weights=cum_weights)[0]
+        date += int(rng.expovariate(1 / mean_gap) * NANOSECONDS_PER_SECOND) + 1
+        text = None if rng.random() < config.empty_text_rate else rng.choice(MESSAGE_TEXTS)
+        # Unique across seeds, like real guids, so two generated databases never share one
+        guid = f"SYNTH-{config.seed}-{idx:010d}"
+        yield (chat_id, guid, text, chat_id, date, rng.randint(0, 1))
+
+
+def generate(config: SyntheticConfig, output_dir: str) -> Tuple[str, str]:
+    """Writes chat.db and AddressBook/AddressBook-v22.abcddb under output_dir.
+    Returns (chat.db path, AddressBook directory)."""
+    rng = random.Random(config.seed)
+    address_book_dir = os.path.join(output_dir, "AddressBook")
+    os.makedirs(address_book_dir, exist_ok=True)
+    chat_db_path = os.path.join(output_dir, "chat.db")
+    address_book_path = os.path.join(address_book_dir, "AddressBook-v22.abcddb")
+    for path in (chat_db_path, address_book_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    chats = build_chats(config, rng)
+
+    conn = sqlite3.connect(chat_db_path)
+    conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+    conn.executescript(CHAT_DB_SCHEMA)
+    conn.executemany(
+        "INSERT INTO chat (ROWID, guid, style, chat_identifier, service_name) VALUES (?, ?, ?, ?, ?)",
+        [
+            (idx, f"iMessage;-;{chat.chat_identifier}", 45, chat.chat_identifier, "iMessage")
+            for idx, chat in enumerate(chats, start=1)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO handle (ROWID, id, service) VALUES (?, ?, ?)",
+        [(idx, chat.chat_identifier, "iMessage") for idx, chat in enumerate(chats, start=1)],
+    )
+    conn.executemany(
+        "INSERT INTO chat_handle_join (chat_id, handle_id) VALUES (?, ?)",
+        [(idx, idx) for idx in range(1, len(chats) + 1)],
+    )
+    messages = enumerate(generate_messages(config, len(chats), rng), start=1)
+    while True:
+        batch = list(islice(messages, INSERT_BATCH_SIZE))
+        if not batch:
+            break
+        conn.executemany(
+            "INSERT INTO message (ROWID, guid, text, handle_id, service, date, is_from_me) "
+            "VALUES (?, ?, ?, ?, 'iMessage', ?, ?)",
+            [
+                (rowid, guid, text, handle_id, date, is_from_me)
+                for rowid, (_, guid, text, handle_id, date, is_from_me) in batch
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO chat_message_join (chat_id, message_id, message_date) VALUES (?, ?, ?)",
+            [(chat_id, rowid, date) for rowid, (chat_id, _, _, _, date, _) in batch],
+        )
+    conn.commit()
+    conn.execute("ANALYZE;")
+    conn.close()
+
+    conn = sqlite3.connect(address_book_path)
+    conn.executescript(ADDRESS_BOOK_SCHEMA)
+    saved = [chat for chat in chats if chat.first_name is not None]
+    conn.executemany(
+        "INSERT INTO ZABCDRECORD (Z_PK, Z_ENT, ZFIRSTNAME, ZLASTNAME) VALUES (?, 22, ?, ?)",
+        [(idx, chat.first_name, chat.last_name) for idx, chat in enumerate(saved, start=1)],
+    )
+    conn.executemany(
+        "INSERT INTO ZABCDPHONENUMBER (ZOWNER, ZLABEL, ZFULLNUMBER) VALUES (?, '_$!<Mobile>!$_', ?)",
+        [
+            (idx, chat.full_number)
+            for idx, chat in enumerate(saved, start=1)
+            if chat.full_number is not None
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO ZABCDEMAILADDRESS (ZOWNER, ZLABEL, ZADDRESS) VALUES (?, '_$!<Home>!$_', ?)",
+        [
+            (idx, chat.email)
+            for idx, chat in enumerate(saved, start=1)
+            if chat.email is not None
+        ],
+    )
+    conn.commit()
+    conn.close()
+    return (chat_db_path, address_book_dir)
+
+
+@click.command()
+@click.option("--messages", "num_messages", type=int, default=100_000, show_default=True)
+@click.option("--contacts", "num_contacts", type=int, default=500, show_default=True)
+@click.option("--unknown-chats", "num_unknown_chats", type=int, default=200, show_default=True)
+@click.option("--skew", "skew", type=float, default=1.1, show_default=True)
+@click.option("--seed", "seed", type=int, default=42, show_default=True)
+@click.option(
+    "--output-dir",
+    "output_dir",
+    type=click.Path(file_okay=False),
+    required=True,
+    help="Where chat.db and AddressBook/ get written.",
+)
+def main(
+    num_messages: int,
+    num_contacts: int,
+    num_unknown_chats: int,
+    skew: float,
+    seed: int,
+    output_dir: str,
+) -> None:
+    """Generates a synthetic chat.db and AddressBook."""
+    config = SyntheticConfig(
+        num_messages=num_messages,
+        num_contacts=num_contacts,
+        num_unknown_chats=num_unknown_chats,
+        skew=skew,
+        seed=seed,
+    )
+    chat_db_path, address_book_dir = generate(config, output_dir)
+    click.echo(f"MESSAGES_DB_PATH={chat_db_path}")
+    click.echo(f"MESSAGES_ADDRESS_BOOK_PATH={address_book_dir}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -11,10 +11,11 @@ setup(
     package_dir={'': 'src'},
     install_requires=[
         'Click',
-        'nltk'
+        'nltk',
+        'importlib_metadata; python_version < "3.8"',
     ],
     entry_points='''
         [console_scripts]
-        messages=messages.cli:cli
+        messages=messages.daemon:main
     ''',
 )
\ No newline at end of file
@@ -0,0 +1,313 @@
+"""asyncio flavor of MessagesDbManager, for embedding in async services.
+
+Everything the manager does with sqlite (chat.db, the caches) happens on one dedicated thread
+that builds the manager, so all of its connections are created and used on that thread. The
+event loop only ever awaits that thread. Results are pulled off it in batches, so several
+queries in flight at once take turns batch by batch instead of one waiting for the others to
+finish. VADER runs in the manager's process pool (workers), off the sqlite thread and out of
+the GIL the loop needs.
+
+Cancelling a call aborts its statement if it's the one running, or drops it if it hasn't
+started yet. Statements are aborted from a sqlite progress handler rather than with interrupt():
+every stream shares the sqlite thread's connection, and interrupt() would fail all of their open
+statements, not just the running one. Breaking out of (or cancelling) an async for closes the
+underlying cursor.
+
+    async with AsyncMessagesDbManager() as manager:
+        async for row in manager.search_messages_by_text("dinner"):
+            ...
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+from types import TracebackType
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+from messages.query_types import (
+    ActivityStatsType,
+    AllContactType,
+    AllMessageType,
+    GetAllMessageWithSentimentType,
+    RunningSentimentStats,
+    SearchWithSentimentType,
+    SentimentSeriesType,
+    TotalCountType,
+)
+from messages.result_set import MessageResultSet
+
+T = TypeVar("T")
+
+# Rows handed from the sqlite thread to the loop at a time. Concurrent queries interleave at
+# this granularity.
+ASYNC_BATCH_SIZE = 500
+# Scoring in processes keeps VADER off the sqlite thread, see above
+DEFAULT_ASYNC_WORKERS = 2
+# sqlite VM instructions between checks for a cancelled call. Small enough that a cancelled
+# scan stops within a millisecond or so, large enough that checking doesn't slow queries down.
+CANCEL_CHECK_INSTRUCTIONS = 10_000
+
+
+class AsyncMessagesDbManager:
+    """MessagesDbManager's public methods as coroutines and async iterators.
+
+    client_options are passed to MessagesDbClient, which is built on the sqlite thread."""
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_ASYNC_WORKERS,
+        use_sentiment_cache: bool = True,
+        use_stats_cache: bool = True,
+        batch_size: int = ASYNC_BATCH_SIZE,
+        **client_options: Any,
+    ) -> None:
+        self.batch_size = batch_size
+        self._build_manager = lambda: MessagesDbManager(
+            client=MessagesDbClient(**client_options),
+            workers=workers,
+            use_sentiment_cache=use_sentiment_cache,
+            use_stats_cache=use_stats_cache,
+        )
+        self._manager: Optional[MessagesDbManager] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="messages-sqlite")
+        # The call currently running on the sqlite thread, and the one to abort, so cancelling
+        # only ever aborts the statement that belongs to the cancelled call
+        self._running_call: Optional[object] = None
+        self._cancelled_call: Optional[object] = None
+        self._running_call_lock = threading.Lock()
+
+    async def __aenter__(self) -> "AsyncMessagesDbManager":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Closes the manager on the sqlite thread and stops the thread."""
+        await self._run(lambda x: x.close())
+        self._executor.shutdown(wait=False)
+
+    async def total_distinct_convos(self) -> int:
+        """See MessagesDbManager.total_distinct_convos."""
+        return await self._run(lambda x: x.total_distinct_convos())
+
+    def total_messages_by_contact_or_number_sorted(
+        self, limit_number: Optional[int] = None
+    ) -> AsyncIterator[TotalCountType]:
+        """See MessagesDbManager.total_messages_by_contact_or_number_sorted."""
+        return self._iterate(lambda x: x.total_messages_by_contact_or_number_sorted(limit_number))
+
+    def all_contacts(self) -> AsyncIterator[AllContactType]:
+        """See MessagesDbManager.all_contacts."""
+        return self._iterate(lambda x: x.all_contacts())
+
+    def all_messages_sorted(self, limit_number: Optional[int] = None) -> AsyncIterator[AllMessageType]:
+        """See MessagesDbManager.all_messages_sorted."""
+        return self._iterate(lambda x: x.all_messages_sorted(limit_number))
+
+    async def all_messages_result_set(self, limit_number: Optional[int] = None) -> MessageResultSet:
+        """See MessagesDbManager.all_messages_result_set."""
+        return await self._run(lambda x: x.all_messages_result_set(limit_number))
+
+    def search_messages_by_text(
+        self,
+        search_text: str,
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        search_date: Optional[datetime] = None,
+        limit_number: Optional[int] = None,
+        before_number: Optional[int] = None,
+        after_number: Optional[int] = None,
+    ) -> AsyncIterator[SearchWithSentimentType]:
+        """See MessagesDbManager.search_messages_by_text."""
+        return self._iterate(
+            lambda x: x.search_messages_by_text(
+                search_text,
+                search_number,
+                search_name,
+                search_date,
+                limit_number,
+                before_number=before_number,
+                after_number=after_number,
+            )
+        )
+
+    async def sync_mirror(self) -> Tuple[int, int]:
+        """See MessagesDbManager.sync_mirror."""
+        return await self._run(lambda x: x.sync_mirror())
+
+    async def refresh_search_index(self, rebuild: bool = False) -> Tuple[int, int]:
+        """See MessagesDbManager.refresh_search_index."""
+        return await self._run(lambda x: x.refresh_search_index(rebuild=rebuild))
+
+    async def sentiment_cache_stats(self) -> List[Tuple[str, int]]:
+        """See MessagesDbManager.sentiment_cache_stats."""
+        return await self._run(lambda x: x.sentiment_cache_stats())
+
+    async def invalidate_sentiment_cache(self, all_versions: bool = False) -> int:
+        """See MessagesDbManager.invalidate_sentiment_cache."""
+        return await self._run(lambda x: x.invalidate_sentiment_cache(all_versions=all_versions))
+
+    async def get_messages(
+        self,
+        get_number: Optional[str] = None,
+        get_name: Optional[str] = None,
+        get_date: Optional[datetime] = None,
+        limit_number: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Tuple[AsyncIterator[GetAllMessageWithSentimentType], RunningSentimentStats]:
+        """Like MessagesDbManager.get_messages, the stats are complete once the iterator is."""
+        rows, running_stats = await self._run(
+            lambda x: x.get_messages(
+                get_number,
+                get_name,
+                get_date,
+                limit_number,
+                date_from=date_from,
+                date_to=date_to,
+            )
+        )
+        return self._iterate_rows(rows), running_stats
+
+    def sentiment_series(
+        self,
+        period: str = "month",
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> AsyncIterator[SentimentSeriesType]:
+        """See MessagesDbManager.sentiment_series."""
+        return self._iterate(
+            lambda x: x.sentiment_series(period, search_number, search_name, date_from, date_to)
+        )
+
+    async def message_stats(
+        self, search_number: Optional[str] = None, search_name: Optional[str] = None
+    ) -> List[ActivityStatsType]:
+        """See MessagesDbManager.message_stats."""
+        return await self._run(lambda x: x.message_stats(search_number, search_name))
+
+    async def generate_prompt_completion(
+        self,
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        limit_number: Optional[int] = None,
+        output_dir: str = ".",
+    ) -> str:
+        """See MessagesDbManager.generate_prompt_completion."""
+        return await self._run(
+            lambda x: x.generate_prompt_completion(
+                search_number, search_name, limit_number, output_dir
+            )
+        )
+
+    async def generate_prompt_completions_for_chats(
+        self, top_chats: Optional[int] = None, output_dir: str = "."
+    ) -> List[str]:
+        """See MessagesDbManager.generate_prompt_completions_for_chats."""
+        return await self._run(
+            lambda x: x.generate_prompt_completions_for_chats(top_chats, output_dir)
+        )
+
+    ### Private Methods ###
+    async def _run(self, call: Callable[[MessagesDbManager], T]) -> T:
+        """Runs call with the manager on the sqlite thread."""
+        call_token = object()
+
+        def run_on_sqlite_thread() -> T:
+            if self._manager is None:
+                self._manager = self._build_manager()
+                self._manager.client.set_progress_handler(
+                    self._should_abort, CANCEL_CHECK_INSTRUCTIONS
+                )
+            with self._running_call_lock:
+                self._running_call = call_token
+            try:
+                return call(self._manager)
+            finally:
+                with self._running_call_lock:
+                    self._running_call = None
+                    self._cancelled_call = None
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, run_on_sqlite_thread)
+        except asyncio.CancelledError:
+            # A call that hasn't started yet is simply dropped, one that's running is stopped
+            # the next time sqlite checks in with _should_abort
+            with self._running_call_lock:
+                if self._running_call is call_token:
+                    self._cancelled_call = call_token
+            raise
+
+    def _should_abort(self) -> int:
+        """sqlite's progress handler, only ever called on the sqlite thread while a statement
+        steps, which belongs to the running call."""
+        return int(self._cancelled_call is not None and self._cancelled_call is self._running_call)
+
+    async def _iterate(
+        self, open_rows: Callable[[MessagesDbManager], Iterable[T]]
+    ) -> AsyncIterator[T]:
+        """Opens an iterator on the sqlite thread (that's when the query runs) and streams it."""
+        rows = await self._run(lambda x: iter(open_rows(x)))
+        stream = self._iterate_rows(rows)
+        try:
+            async for row in stream:
+                yield row
+        finally:
+            await stream.aclose()
+
+    async def _iterate_rows(self, rows: Iterator[T]) -> AsyncGenerator[T, None]:
+        """Streams an opened iterator from the sqlite thread, batch_size rows at a time."""
+        try:
+            while True:
+                batch = await self._run(lambda _: list(islice(rows, self.batch_size)))
+                if not batch:
+                    return
+                for row in batch:
+                    yield row
+        finally:
+            # Closes the cursor once the batch in flight (if any) is done, on the thread that
+            # owns it. Submitted rather than awaited so this also works while being cancelled.
+            close = getattr(rows, "close", None)
+            if close is not None:
+                try:
+                    self._executor.submit(close)
+                except RuntimeError:
+                    # Already shut down, close() took the connection down with it
+                    pass
+
+
+if __name__ == "__main__":
+
+    async def main() -> None:
+        """Prints the number of conversations and the top 10 contacts."""
+        async with AsyncMessagesDbManager() as manager:
+            print(await manager.total_distinct_convos())
+            async for contact in manager.total_messages_by_contact_or_number_sorted(10):
+                print(contact)
+
+    asyncio.run(main())
@@ -7,24 +7,222 @@ What this command line tool should be able to do:
 4. Get total number of conversations had
 """
 
+from contextlib import redirect_stdout
 from datetime import datetime
+import json
 import sys
-from typing import Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, TypeVar
 
 import click
+from messages.daemon import SOCKET_PATH, is_running, serve as serve_forever
+from messages.export import COMPRESSIONS, EXPORT_FORMATS, export_rows, open_output
 from messages.messages_db_client import MessagesDbClient
 from messages.messages_db_manager import MessagesDbManager
-from messages.printer import Printer
+from messages.mirror import MIRROR_PATH
+from messages.printer import Printer, buffered_output
+from messages.profiler import PROFILER
+from messages.query_types import (
+    ActivityStatsType,
+    AllContactType,
+    GetAllMessageWithSentimentType,
+    SearchWithSentimentType,
+    SentimentSeriesType,
+    TotalCountType,
+)
+from messages.utils import PERIODS
+
+F = TypeVar("F", bound=Callable[..., Any])
+TABLE_FORMAT = "table"
+# Message columns that only mean something for search results with --before / --after
+CONTEXT_FIELDS = ("is_match", "context_group")
+
+# Built on first use by get_manager(). Opening chat.db, reading the contacts and loading
+# VADER are all deferred until a subcommand actually needs them, so `--help` stays instant.
+_manager: Optional[MessagesDbManager] = None
+# Options from the top level group that the client and manager get built with
+_client_options: Dict[str, Any] = {}
+_manager_options: Dict[str, Any] = {}
+# The options _manager was built with. Under `messages serve` every request sets them anew.
+_manager_built_with: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None
+
+
+def get_manager() -> MessagesDbManager:
+    """Returns the process wide manager, creating it if needed (or if the options changed)."""
+    global _manager, _manager_built_with  # pylint: disable=global-statement
+    options = (dict(_client_options), dict(_manager_options))
+    if _manager is None or options != _manager_built_with:
+        close_manager()
+        _manager = MessagesDbManager(
+            client=MessagesDbClient(**_client_options), **_manager_options
+        )
+        _manager_built_with = options
+    return _manager
+
+
+def close_manager() -> None:
+    """Closes the process wide manager, if one was built. The next get_manager() builds anew."""
+    global _manager, _manager_built_with  # pylint: disable=global-statement
+    if _manager is not None:
+        _manager.close()
+    _manager = None
+    _manager_built_with = None
+
+
+def run_command(argv: List[str]) -> int:
+    """Runs `messages <argv>` in this process and returns the exit code, for `messages serve`.
+    The manager stays warm across calls, except for --snapshot runs which each need a fresh copy."""
+    try:
+        cli.main(args=argv, prog_name="messages")
+    except SystemExit as ex:
+        return ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+    finally:
+        PROFILER.disable()
+        if _client_options.get("snapshot"):
+            close_manager()
+    return 0
+
 
-client = MessagesDbClient()
-manager = MessagesDbManager()
+def output_options(func: F) -> F:
+    """--format / --output / --compress, shared by every subcommand that returns rows."""
+    func = click.option(
+        "--compress",
+        "compression",
+        type=click.Choice(COMPRESSIONS),
+        help="Compress the output. Implied by an --output ending in .gz or .xz.",
+    )(func)
+    func = click.option(
+        "-o",
+        "--output",
+        "output_path",
+        type=click.Path(dir_okay=False, allow_dash=True),
+        help="Write to this file instead of stdout.",
+    )(func)
+    func = click.option(
+        "-f",
+        "--format",
+        "output_format",
+        type=click.Choice([TABLE_FORMAT] + EXPORT_FORMATS),
+        default=TABLE_FORMAT,
+        show_default=True,
+        help="Output format. jsonl, csv and tsv stream rows without building the table.",
+    )(func)
+    return func
+
+
+def print_or_export(
+    rows: Iterable[Any],
+    row_type: Type[Any],
+    print_table: Callable[[Any], None],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
+    without_fields: Sequence[str] = (),
+) -> None:
+    """Prints rows as a table or streams them out in one of the export formats."""
+    with open_output(output_path, compression) as output:
+        if output_format == TABLE_FORMAT:
+            with redirect_stdout(output):
+                print_table(rows)
+        else:
+            fields = [x for x in row_type._fields if x not in without_fields]
+            export_rows(rows, row_type, output_format, output, fields)
+
+
+def print_profile_report(profile_format: str) -> None:
+    """Prints the --profile report to stderr, as a table or as JSON."""
+    report = PROFILER.report()
+    if profile_format == "json":
+        click.echo(json.dumps(report), err=True)
+    else:
+        Printer.print_profile(report)
 
 
 @click.group()
-def cli() -> None:
+@click.option(
+    "-w",
+    "--workers",
+    "workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to score sentiment. Worth it for dumps with a lot of messages.",
+)
+@click.option(
+    "-m",
+    "--mirror",
+    "use_mirror",
+    is_flag=True,
+    default=False,
+    help=f"Read from the local mirror built by `messages sync` ({MIRROR_PATH}) instead of chat.db.",
+)
+@click.option(
+    "--db-path",
+    "db_path",
+    type=click.Path(dir_okay=False),
+    help="Path to chat.db. Defaults to $MESSAGES_DB_PATH or ~/Library/Messages/chat.db.",
+)
+@click.option(
+    "--address-book-path",
+    "address_book_path",
+    type=click.Path(file_okay=False),
+    help="Directory holding the AddressBook databases, including the per account ones under "
+    "Sources/. Defaults to $MESSAGES_ADDRESS_BOOK_PATH or ~/Library/Application Support/AddressBook.",
+)
+@click.option(
+    "--snapshot",
+    "snapshot",
+    is_flag=True,
+    default=False,
+    help="Work on a consistent copy of chat.db in a temp dir, so long analyses never contend "
+    "with Messages.app writing to it.",
+)
+@click.option(
+    "--profile",
+    "profile",
+    is_flag=True,
+    default=False,
+    help="Report where the time went (sqlite, building rows, VADER, printing) and how sqlite "
+    "planned each query. Printed to stderr once the subcommand finishes.",
+)
+@click.option(
+    "--profile-format",
+    "profile_format",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    show_default=True,
+    help="Format of the --profile report.",
+)
+@click.option(
+    "--pager/--no-pager",
+    "use_pager",
+    default=True,
+    show_default=True,
+    help="Page output through $PAGER when it's set and stdout is a terminal.",
+)
+def cli(
+    workers: int,
+    use_mirror: bool,
+    db_path: Optional[str],
+    address_book_path: Optional[str],
+    snapshot: bool,
+    profile: bool,
+    profile_format: str,
+    use_pager: bool,
+) -> None:
     """Main entry point for command line."""
     if len(sys.argv) == 1:
         cli.main(["--help"])
+    ctx = click.get_current_context()
+    if profile:
+        PROFILER.enable()
+        ctx.call_on_close(lambda: print_profile_report(profile_format))
+    # Entered after the profile callback so the pager is closed before the report is printed
+    ctx.with_resource(buffered_output(use_pager))
+    _client_options["use_mirror"] = use_mirror
+    _client_options["db_path"] = db_path
+    _client_options["address_book_path"] = address_book_path
+    _client_options["snapshot"] = snapshot
+    _manager_options["workers"] = workers
 
 
 @cli.command(no_args_is_help=True)
@@ -39,7 +237,7 @@ def cli() -> None:
 def convos(total_number: Optional[bool]) -> None:
     """Subcommand to analyze messages."""
     if total_number:
-        num_conversations = manager.total_distinct_convos()
+        num_conversations = get_manager().total_distinct_convos()
         click.echo(f"Total number of distinct conversations: {num_conversations}")
 
 
@@ -59,24 +257,148 @@ def convos(total_number: Optional[bool]) -> None:
     default=False,
     help="List all contacts.",
 )
+@output_options
 def contacts(
     top_n_contacts: Optional[int],
     should_list: Optional[bool],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
 ) -> None:
     """Subcommand to aggregate contact information."""
     if len(sys.argv) == 1:
         cli.main(["--help"])
     if top_n_contacts:
-        total_results = manager.total_messages_by_contact_or_number_sorted(
+        total_results = get_manager().total_messages_by_contact_or_number_sorted(
             top_n_contacts
         )
-        Printer.print_total_messages_data(total_results)
+        print_or_export(
+            total_results,
+            TotalCountType,
+            Printer.print_total_messages_data,
+            output_format,
+            output_path,
+            compression,
+        )
         return
 
     if should_list:
-        contact_results = manager.all_contacts()
-        Printer.print_all_contacts(contact_results)
+        contact_results = get_manager().all_contacts()
+        print_or_export(
+            contact_results,
+            AllContactType,
+            Printer.print_all_contacts,
+            output_format,
+            output_path,
+            compression,
+        )
+        return
+
+
+@cli.command()
+def sync() -> None:
+    """Subcommand to sync chat.db into a compact local mirror.
+
+    Only messages newer than the last sync are copied. Run any subcommand with `messages --mirror`
+    to use the mirror instead of chat.db, e.g. for fast repeated queries or to work with a copy of
+    the mirror on another machine (point MESSAGES_MIRROR_PATH at it)."""
+    if _client_options.get("use_mirror"):
+        click.echo("The mirror is synced from chat.db, please run `messages sync` without --mirror.")
         return
+    try:
+        num_new, num_total = get_manager().sync_mirror()
+    except ValueError as ex:
+        raise click.ClickException(str(ex)) from ex
+    click.echo(
+        f"Synced {num_new:,} new messages. The mirror at {MIRROR_PATH} now holds {num_total:,} messages."
+    )
+
+
+@cli.command()
+@click.option(
+    "-r",
+    "--rebuild",
+    "rebuild",
+    is_flag=True,
+    default=False,
+    help="Drop the existing index and rebuild it from scratch.",
+)
+def index(rebuild: bool) -> None:
+    """Subcommand to build or refresh the full-text search index.
+
+    The index is optional and lives in a separate database in your cache dir, one per chat.db
+    (or mirror), chat.db is never written to. Once it exists, `search` uses it automatically and keeps it up to date, which
+    also enables "quoted phrase" and prefix* queries."""
+    num_new, num_total = get_manager().refresh_search_index(rebuild=rebuild)
+    click.echo(
+        f"Indexed {num_new:,} new messages. The search index now holds {num_total:,} messages."
+    )
+
+
+@cli.command()
+@click.option(
+    "-p",
+    "--prune",
+    "prune",
+    is_flag=True,
+    default=False,
+    help="Drop scores computed by older versions of the sentiment scorer.",
+)
+@click.option(
+    "--clear",
+    "clear",
+    is_flag=True,
+    default=False,
+    help="Drop every persisted score.",
+)
+def cache(prune: bool, clear: bool) -> None:
+    """Subcommand to inspect or invalidate the persisted sentiment scores.
+
+    Scores are cached per message so dumping the same history again doesn't rerun VADER.
+    They're tagged with the scorer version and only reused when it matches."""
+    if prune or clear:
+        num_removed = get_manager().invalidate_sentiment_cache(all_versions=clear)
+        click.echo(f"Removed {num_removed:,} cached sentiment scores.")
+
+    current_version = get_manager().sentiment_model.scorer_version()
+    for scorer_version, count in get_manager().sentiment_cache_stats():
+        suffix = " (current)" if scorer_version == current_version else ""
+        click.echo(f"{scorer_version}{suffix}: {count:,} cached scores")
+
+
+@cli.command()
+@click.option(
+    "-s",
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=SOCKET_PATH,
+    show_default=True,
+    help="Where to listen. Defaults to $MESSAGES_SOCKET_PATH or messages.sock in the cache dir.",
+)
+def serve(socket_path: str) -> None:
+    """Subcommand to keep chat.db, the contacts and VADER loaded and answer other `messages` runs.
+
+    While it's running, `messages <subcommand>` hands its arguments to it over a Unix socket and
+    prints what comes back, skipping the expensive setup. Runs fall back to working on their own
+    whenever it isn't (set MESSAGES_NO_DAEMON to always do so). Requests are served one at a
+    time with the daemon's environment, start it with the global options your runs use, as
+    others rebuild the manager. Output isn't paged. Stop it with Ctrl-C."""
+    if _client_options.get("snapshot"):
+        click.echo("A snapshot would go stale, please run `messages serve` without --snapshot.")
+        return
+    if is_running(socket_path):
+        raise click.ClickException(f"messages serve is already running on {socket_path}")
+    manager = get_manager()
+    # Pay for the contacts and VADER now rather than on the first request
+    for _ in manager.all_contacts():
+        pass
+    manager.sentiment_model.analyze_message("warming up")
+    click.echo(f"Serving on {socket_path}, Ctrl-C to stop.")
+    try:
+        serve_forever(run_command, socket_path)
+    except OSError as ex:
+        raise click.ClickException(str(ex)) from ex
 
 
 @cli.command(no_args_is_help=True)
@@ -106,16 +428,17 @@ def contacts(
     "-b",
     "--before-number",
     "before_number",
-    type=int,
-    help="Coming soon... The amount of texts to show before the matching result.",
+    type=click.IntRange(min=0),
+    help="The amount of texts from the same chat to show before each matching result.",
 )
 @click.option(
     "-a",
     "--after-number",
     "after_number",
-    type=int,
-    help="Coming soon...The amount of texts to show after the matching result.",
+    type=click.IntRange(min=0),
+    help="The amount of texts from the same chat to show after each matching result.",
 )
+@output_options
 def search(
     search_text: str,
     contact: Optional[str],
@@ -123,42 +446,46 @@ def search(
     limit_number: Optional[int],
     before_number: Optional[int],
     after_number: Optional[int],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
 ) -> None:
-    """Subcommand to search messages by name, contact, and/or text."""
-    click.echo(
-        f"Searching contact: {contact} or number: {number} with text: {search_text}"
-    )
+    """Subcommand to search messages by name, contact, and/or text.
+
+    If you've built the search index (see `index`), SEARCH_TEXT matches whole words,
+    "quoted text" matches a phrase and a trailing * matches a prefix, e.g. "on my" wa*.
+    Otherwise it's matched as a plain substring.
+
+    With --before-number / --after-number every match is shown along with the messages around
+    it in its chat, overlapping windows are merged and matches are marked with a *."""
     if contact and number:
         click.echo(
             f"Both contact ({contact}) and number ({number}) cannot be specified at the same time. Please only specify one."
         )
         return
 
-    if contact:
-        results = manager.search_messages_by_text(
-            search_text,
-            search_name=contact,
-            limit_number=limit_number,
-            before_number=before_number,
-            after_number=after_number,
-        )
-        Printer.print_search_data(results)
-        return
-
-    if number:
-        results = manager.search_messages_by_text(
-            search_text,
-            search_number=number,
-            limit_number=limit_number,
-            before_number=before_number,
-            after_number=after_number,
+    if output_format == TABLE_FORMAT:
+        click.echo(
+            f"Searching contact: {contact} or number: {number} with text: {search_text}"
         )
-        Printer.print_search_data(results)
-        return
-
-    # If no number, no contact, and no date, then we'll just search over all messages for the search_text
-    results = manager.search_messages_by_text(search_text)
-    Printer.print_search_data(results)
+    # If no number and no contact, then we'll just search over all messages for the search_text
+    results = get_manager().search_messages_by_text(
+        search_text,
+        search_number=number,
+        search_name=contact,
+        limit_number=limit_number,
+        before_number=before_number,
+        after_number=after_number,
+    )
+    print_or_export(
+        results,
+        SearchWithSentimentType,
+        Printer.print_search_data,
+        output_format,
+        output_path,
+        compression,
+        without_fields=() if before_number or after_number else CONTEXT_FIELDS,
+    )
 
 
 @cli.command(no_args_is_help=True)
@@ -183,6 +510,18 @@ def search(
     type=str,
     help="The date to retrieve all messages. Enter as YYYY-MM-DD",
 )
+@click.option(
+    "--from",
+    "date_from",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only retrieve messages on or after this date. Enter as YYYY-MM-DD",
+)
+@click.option(
+    "--to",
+    "date_to",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only retrieve messages on or before this date. Enter as YYYY-MM-DD",
+)
 @click.option(
     "-l",
     "--limit-number",
@@ -190,11 +529,17 @@ def search(
     type=int,
     help="The amount to limit the results by.",
 )
+@output_options
 def get(
     contact: Optional[str],
     number: Optional[str],
     tgt_date: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
     limit_number: Optional[int],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
 ) -> None:
     """Subcommand to get all messages for a certain name or contact. You need to specify either a number or a contact.
 
@@ -202,23 +547,159 @@ def get(
     sentiment on a score from -1.00 (negative) to 1.00 (positive).
 
     That being said, don't place too much value on that. It's just using VADER not some more complex OpenAI logic."""
-    if not contact and not number and not tgt_date:
+    if not contact and not number and not tgt_date and not date_from and not date_to:
         click.echo(
             "You must specify a contact name, contact number, or date to dump messages for."
         )
         return
 
+    if tgt_date and (date_from or date_to):
+        click.echo("Please specify either a single --date or a --from/--to range, not both.")
+        return
+
     tgt_date_obj: Optional[datetime] = None
     if tgt_date:
         tgt_date_obj = datetime.strptime(tgt_date, "%Y-%m-%d")
-    results, aggregated = manager.get_messages(
+    results, running_stats = get_manager().get_messages(
         get_name=contact,
         get_number=number,
         get_date=tgt_date_obj,
         limit_number=limit_number,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    def print_with_aggregate(rows: Iterable[GetAllMessageWithSentimentType]) -> None:
+        Printer.print_get_data(rows)
+        Printer.print_aggregate_sentiment(running_stats.to_aggregate())
+
+    print_or_export(
+        results,
+        GetAllMessageWithSentimentType,
+        print_with_aggregate,
+        output_format,
+        output_path,
+        compression,
+        without_fields=CONTEXT_FIELDS,
+    )
+
+
+@cli.command()
+@click.option(
+    "-c",
+    "--contact",
+    "contact",
+    type=str,
+    help="The name of the contact. Everyone if neither a contact nor a number is given.",
+)
+@click.option(
+    "-n",
+    "--number",
+    "number",
+    type=str,
+    help="The number of the contact.",
+)
+@click.option(
+    "-p",
+    "--period",
+    "period",
+    type=click.Choice(PERIODS),
+    default="month",
+    show_default=True,
+    help="Length of each point in the series. Weeks start on Monday.",
+)
+@click.option(
+    "--from",
+    "date_from",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only include messages on or after this date. Enter as YYYY-MM-DD",
+)
+@click.option(
+    "--to",
+    "date_to",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only include messages on or before this date. Enter as YYYY-MM-DD",
+)
+@output_options
+def sentiment(
+    contact: Optional[str],
+    number: Optional[str],
+    period: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
+) -> None:
+    """Subcommand to chart sentiment over time.
+
+    Averages the VADER compound score of every message per day, week or month, for one contact
+    or across all your conversations. Messages are scored as they're read and never kept around,
+    so this works on the full history."""
+    if contact and number:
+        click.echo(
+            f"Both contact ({contact}) and number ({number}) cannot be specified at the same time. Please only specify one."
+        )
+        return
+
+    results = get_manager().sentiment_series(
+        period,
+        search_number=number,
+        search_name=contact,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    print_or_export(
+        results,
+        SentimentSeriesType,
+        Printer.print_sentiment_series,
+        output_format,
+        output_path,
+        compression,
+    )
+
+
+@cli.command()
+@click.option(
+    "-c",
+    "--contact",
+    "contact",
+    type=str,
+    help="The name of the contact. Everyone if neither a contact nor a number is given.",
+)
+@click.option(
+    "-n",
+    "--number",
+    "number",
+    type=str,
+    help="The number of the contact.",
+)
+@output_options
+def stats(
+    contact: Optional[str],
+    number: Optional[str],
+    output_format: str,
+    output_path: Optional[str],
+    compression: Optional[str],
+) -> None:
+    """Subcommand to show message volume: sent vs received, by hour of the week and by month.
+
+    Counted inside sqlite, so even the full history is quick, and cached until new messages
+    arrive so running it again is instant. Hours and months are in your local timezone."""
+    if contact and number:
+        click.echo(
+            f"Both contact ({contact}) and number ({number}) cannot be specified at the same time. Please only specify one."
+        )
+        return
+
+    results = get_manager().message_stats(search_number=number, search_name=contact)
+    print_or_export(
+        results,
+        ActivityStatsType,
+        Printer.print_activity_stats,
+        output_format,
+        output_path,
+        compression,
     )
-    Printer.print_get_data(results)
-    Printer.print_aggregate_sentiment(aggregated)
 
 
 @cli.command(no_args_is_help=True)
@@ -243,14 +724,38 @@ def get(
     type=int,
     help="The amount to limit the results by. If empty, will scan full history.",
 )
+@click.option(
+    "-t",
+    "--top",
+    "top_chats",
+    type=click.IntRange(min=1),
+    help="Generate a file for each of the N chats with the most messages, in one scan.",
+)
+@click.option(
+    "--all",
+    "all_chats",
+    is_flag=True,
+    default=False,
+    help="Generate a file for every chat, in one scan.",
+)
+@click.option(
+    "-d",
+    "--output-dir",
+    "output_dir",
+    type=click.Path(exists=True, file_okay=False, writable=True),
+    default=".",
+    show_default=True,
+    help="Where the files are written to.",
+)
 def generate(
     contact: Optional[str],
     number: Optional[str],
     limit_number: Optional[int],
+    top_chats: Optional[int],
+    all_chats: bool,
+    output_dir: str,
 ) -> None:
-    """NOT COMPLETE YET.
-
-    Subcommand to generate a training file used for GPT3 to fine-tune a model for more flavored
+    """Subcommand to generate a training file used for GPT3 to fine-tune a model for more flavored
     chatbots in the natural voice of friends/families/anyone in your contacts. This is an expensive endpoint.
 
     This endpoint will first generate a data dump of all conversations with the specific name or contact. In order to handle multiple messages being sent back to back, those will be aggregated in one to have a call and response type behavior.
@@ -260,24 +765,39 @@ def generate(
     {"prompt": "<prompt text>", "completion": "<ideal generated text>"}
     {"prompt": "<prompt text>", "completion": "<ideal generated text>"}
 
-    will then get fed to OpenAI which will then get processed.
+    will then get fed to OpenAI which will then get processed. The file is written to the
+    output directory as pairs are built, so this works for conversations of any length.
+
+    With --top N or --all, the history is read once and a file is written for each chat as soon
+    as it's done, using --workers processes.
     """
+    if top_chats is not None or all_chats:
+        if contact or number or limit_number is not None:
+            click.echo(
+                "--top and --all generate files for many chats, they can't be combined with a contact, number or limit."
+            )
+            return
+        if top_chats is not None and all_chats:
+            click.echo("Only one of --top and --all can be specified.")
+            return
+        get_manager().generate_prompt_completions_for_chats(top_chats, output_dir)
+        return
+
     if not contact and not number:
         click.echo(
             "You must specify a contact name or a contact number to dump messages for."
         )
         return
 
-    if contact:
-        results, aggregated = manager.get_messages(
-            get_name=contact, limit_number=limit_number
+    if contact and number:
+        click.echo(
+            f"Both contact ({contact}) and number ({number}) cannot be specified at the same time. Please only specify one."
         )
-        Printer.print_get_data(results)
-        Printer.print_aggregate_sentiment(aggregated)
         return
 
-    results, aggregated = manager.get_messages(
-        get_number=number, limit_number=limit_number
+    get_manager().generate_prompt_completion(
+        search_number=number,
+        search_name=contact,
+        limit_number=limit_number,
+        output_dir=output_dir,
     )
-    Printer.print_get_data(results)
-    Printer.print_aggregate_sentiment(aggregated)
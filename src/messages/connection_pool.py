@@ -0,0 +1,155 @@
+"""A bounded pool of sqlite connections shared by the threads of one MessagesDbClient.
+
+A sqlite3 connection runs one statement at a time, so threads querying through a single one
+take turns for the whole query. The pool hands each thread its own connection instead, opening
+them on demand up to max_size and blocking further threads until one is returned.
+
+A thread that already holds a connection gets the same one back. Results are streamed, so one
+query's cursor can still be open while the same thread runs the next (the manager does this for
+sentiment, generate does it per chat), and sqlite is happy to have several cursors open on one
+connection. Reusing it means a thread never waits on the pool for a connection it holds itself.
+
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False))
+    with pool.connection() as conn:
+        conn.execute(...)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Connections per client. Reading chat.db is the only thing they do, so a few is plenty.
+DEFAULT_POOL_SIZE = int(os.getenv("MESSAGES_POOL_SIZE", "4"))
+# How long a thread waits for a connection before giving up, None waits forever
+DEFAULT_CHECKOUT_TIMEOUT = None
+
+
+class Lease:
+    """One thread's hold on a pooled connection. Every checkout on that thread shares it,
+    the connection goes back to the pool with the last checkin."""
+
+    def __init__(self, conn: sqlite3.Connection, owner: int) -> None:
+        self.conn = conn
+        self.owner = owner
+        self.depth = 0
+
+
+class ConnectionPool:
+    """Opens connections with connect, at most max_size at a time. connect has to open them
+    with check_same_thread=False, a connection moves between threads as it's reused."""
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: Optional[float] = DEFAULT_CHECKOUT_TIMEOUT,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError(f"A connection pool needs at least one connection, got {max_size}.")
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        # Most recently returned last, so the connection with the warmest page cache goes first
+        self._idle: List[sqlite3.Connection] = []
+        self._leases: Dict[int, Lease] = {}
+        self._num_open = 0
+        self._is_closed = False
+        self._available = threading.Condition(threading.Lock())
+
+    @property
+    def num_open(self) -> int:
+        """Connections currently open, idle or checked out."""
+        return self._num_open
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """A connection for the duration of the with block."""
+        lease = self.checkout()
+        try:
+            yield lease.conn
+        finally:
+            self.checkin(lease)
+
+    def checkout(self) -> Lease:
+        """A connection for this thread, its own if it already holds one. Has to be matched by
+        a checkin, which may happen on any thread (a streamed result is finished wherever
+        it's consumed)."""
+        owner = threading.get_ident()
+        with self._available:
+            lease = self._leases.get(owner)
+            if lease is None:
+                lease = Lease(self._take_connection(), owner)
+                self._leases[owner] = lease
+            lease.depth += 1
+            return lease
+
+    def checkin(self, lease: Lease) -> None:
+        """Gives back a checkout, the connection returns to the pool with the last one."""
+        with self._available:
+            lease.depth -= 1
+            if lease.depth > 0:
+                return
+            if self._leases.get(lease.owner) is lease:
+                del self._leases[lease.owner]
+            if self._is_closed:
+                self._num_open -= 1
+                lease.conn.close()
+            else:
+                self._idle.append(lease.conn)
+            self._available.notify()
+
+    def apply(self, call: Callable[[sqlite3.Connection], Any]) -> None:
+        """Calls call with every open connection, idle or checked out."""
+        with self._available:
+            for conn in self._idle:
+                call(conn)
+            for lease in self._leases.values():
+                call(lease.conn)
+
+    def interrupt(self) -> None:
+        """Aborts whatever statements are running on the checked out connections."""
+        with self._available:
+            for lease in self._leases.values():
+                lease.conn.interrupt()
+
+    def close(self) -> None:
+        """Closes the idle connections now and every other one as it's returned."""
+        with self._available:
+            self._is_closed = True
+            for conn in self._idle:
+                conn.close()
+            self._num_open -= len(self._idle)
+            self._idle.clear()
+            self._available.notify_all()
+
+    ### Private Methods ###
+    def _take_connection(self) -> sqlite3.Connection:
+        """An idle connection, a new one if there's room, otherwise waits for one to come back.
+        Called holding the lock."""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            if self._is_closed:
+                raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool.")
+            if self._idle:
+                return self._idle.pop()
+            if self._num_open < self.max_size:
+                # Connecting is quick, and doing it outside the lock would need another
+                # counter of connections being opened
+                conn = self.connect()
+                self._num_open += 1
+                return conn
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(
+                    f"No connection free after {self.timeout}s, all {self.max_size} are in use."
+                )
+            self._available.wait(remaining)
+
+
+if __name__ == "__main__":
+    pool = ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), 2)
+    with pool.connection() as outer, pool.connection() as inner:
+        print(outer is inner, pool.num_open)
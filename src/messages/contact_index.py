@@ -0,0 +1,217 @@
+"""Resolves chat handles (numbers and emails) to contact names.
+
+Contacts are spread over several AddressBook databases: one at the top of the AddressBook
+directory plus one per account under Sources/<account id>/. Every one of them is read and the
+records are merged into a single map from a normalized number / email to a full name. Numbers
+are compared on their trailing 10 digits. Numbers saved without an area code (e.g. "490-1945")
+are shorter than that, so they match any handle that ends in them instead, like the LIKE join
+this replaced did. Where several contacts share a number, one name is used: the first one for
+an exact match, the longest number for a suffix match.
+
+Reading all of those is far more work than the lookups need, so the merged map is stored in a
+sqlite database in the cache dir, along with the mtime and size of every database it was built
+from. A normal startup only stats those files and reads the map back."""
+
+import os
+import sqlite3
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from messages.profiler import PROFILER
+from messages.queries import (
+    ADDRESS_BOOK_EMAIL_ADDRESSES,
+    ADDRESS_BOOK_PHONE_NUMBERS,
+    CONTACT_CACHE_NAMES,
+    CONTACT_CACHE_SOURCES,
+    CREATE_CONTACT_CACHE,
+    DELETE_CONTACT_CACHE_NAMES,
+    DELETE_CONTACT_CACHE_SOURCES,
+    INSERT_CONTACT_CACHE_NAME,
+    INSERT_CONTACT_CACHE_SOURCE,
+)
+from messages.utils import (
+    CANONICAL_NUMBER_LENGTH,
+    canonical_number,
+    get_cache_dir,
+    read_only_uri,
+)
+
+CONTACT_CACHE_FILENAME = "contact_index.db"
+ADDRESS_BOOK_SUFFIX = ".abcddb"
+# Per account AddressBooks live in <root>/Sources/<account id>/
+ADDRESS_BOOK_SOURCES_DIR = "Sources"
+# sqlite keeps recent writes in here until they're checkpointed into the database itself
+WAL_SUFFIX = "-wal"
+
+
+class AddressBookSource(NamedTuple):
+    """An AddressBook database and what it looked like on disk, to tell if it changed."""
+
+    path: str
+    mtime_ns: int
+    size: int
+
+
+def contact_key(handle: Optional[str]) -> Optional[str]:
+    """Normalizes a chat handle or AddressBook entry so the two can be compared on equality:
+    the canonical number for phone numbers, the lowercased address for emails."""
+    if not handle:
+        return None
+    if "@" in handle:
+        return handle.strip().lower()
+    return canonical_number(handle)
+
+
+def discover_address_books(root: str) -> List[AddressBookSource]:
+    """Every AddressBook database under root, the top level one and one per account, sorted by
+    path. Returns an empty list if root doesn't exist."""
+    sources_dir = os.path.join(root, ADDRESS_BOOK_SOURCES_DIR)
+    directories = [root]
+    if os.path.isdir(sources_dir):
+        directories.extend(
+            x.path for x in os.scandir(sources_dir) if x.is_dir(follow_symlinks=False)
+        )
+
+    sources: List[AddressBookSource] = []
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.endswith(ADDRESS_BOOK_SUFFIX) and entry.is_file():
+                sources.append(_to_source(entry.path))
+    return sorted(sources)
+
+
+class ContactIndex:
+    """The merged contacts of every AddressBook database under root, cached on disk."""
+
+    def __init__(
+        self, root: str, cache_path: Optional[str] = None, use_cache: bool = True
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.cache_path = (
+            cache_path
+            if cache_path is not None
+            else os.path.join(get_cache_dir(), CONTACT_CACHE_FILENAME)
+        )
+        self.use_cache = use_cache
+        self._names: Optional[Dict[str, str]] = None
+        # (number, full name) for numbers saved without an area code, longest first
+        self._short_numbers: Optional[List[Tuple[str, str]]] = None
+
+    @property
+    def names(self) -> Dict[str, str]:
+        """Full name by contact_key. Loaded from the cache if none of the AddressBook databases
+        changed since it was built, otherwise rebuilt from all of them (and cached again)."""
+        if self._names is None:
+            with PROFILER.stage("contacts.load"):
+                self._names = self._load()
+        return self._names
+
+    def name_for(self, handle: Optional[str]) -> Optional[str]:
+        """The contact name for a chat handle, if it's in any AddressBook."""
+        key = contact_key(handle)
+        if key is None:
+            return None
+        full_name = self.names.get(key)
+        if full_name is None and key.isdigit():
+            full_name = next(
+                (name for number, name in self.short_numbers if key.endswith(number)), None
+            )
+        return full_name
+
+    @property
+    def short_numbers(self) -> List[Tuple[str, str]]:
+        """(number, full name) for the numbers shorter than a full one, longest first. Handles
+        that don't match a number exactly are matched on these as a suffix."""
+        if self._short_numbers is None:
+            self._short_numbers = sorted(
+                (
+                    (key, name)
+                    for key, name in self.names.items()
+                    if key.isdigit() and len(key) < CANONICAL_NUMBER_LENGTH
+                ),
+                key=lambda x: -len(x[0]),
+            )
+        return self._short_numbers
+
+    ### Private Methods ###
+    def _load(self) -> Dict[str, str]:
+        sources = discover_address_books(self.root)
+        if not self.use_cache:
+            return dict(self._read_sources(sources))
+
+        conn = sqlite3.connect(self.cache_path)
+        try:
+            conn.executescript(CREATE_CONTACT_CACHE)
+            cached_sources = [
+                AddressBookSource(*x) for x in conn.execute(CONTACT_CACHE_SOURCES, [self.root])
+            ]
+            if cached_sources == sources:
+                return dict(conn.execute(CONTACT_CACHE_NAMES, [self.root]))
+
+            names = dict(self._read_sources(sources))
+            with conn:
+                conn.execute(DELETE_CONTACT_CACHE_SOURCES, [self.root])
+                conn.execute(DELETE_CONTACT_CACHE_NAMES, [self.root])
+                conn.executemany(
+                    INSERT_CONTACT_CACHE_SOURCE, [(self.root, *x) for x in sources]
+                )
+                conn.executemany(
+                    INSERT_CONTACT_CACHE_NAME, [(self.root, *x) for x in names.items()]
+                )
+            return names
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _read_sources(sources: List[AddressBookSource]) -> Iterator[Tuple[str, str]]:
+        """(contact_key, full name) for every number and email in sources, first one wins when
+        the same key shows up in several records. The largest database goes first, it's the
+        one the rest of the tool used to read on its own."""
+        seen = set()
+        for source in sorted(sources, key=lambda x: (-x.size, x.path)):
+            for handle, full_name in _read_address_book(source.path):
+                key = contact_key(handle)
+                if key is not None and key not in seen:
+                    seen.add(key)
+                    yield key, full_name
+
+
+### Private Methods ###
+def _to_source(path: str) -> AddressBookSource:
+    """Folds the WAL into the mtime and size, since recent edits only touch that file."""
+    stat = os.stat(path)
+    mtime_ns, size = stat.st_mtime_ns, stat.st_size
+    try:
+        wal_stat = os.stat(path + WAL_SUFFIX)
+    except OSError:
+        return AddressBookSource(path, mtime_ns, size)
+    return AddressBookSource(path, max(mtime_ns, wal_stat.st_mtime_ns), size + wal_stat.st_size)
+
+
+def _read_address_book(path: str) -> List[Tuple[str, str]]:
+    """(number or email, full name) pairs from one AddressBook database. Anything that can't be
+    read (not an AddressBook, missing tables, locked) is skipped rather than failing startup."""
+    rows: List[Tuple[str, str]] = []
+    try:
+        conn = sqlite3.connect(read_only_uri(path), uri=True)
+    except sqlite3.Error:
+        return rows
+    try:
+        for query in (ADDRESS_BOOK_PHONE_NUMBERS, ADDRESS_BOOK_EMAIL_ADDRESSES):
+            try:
+                rows.extend(conn.execute(query))
+            except sqlite3.Error:
+                continue
+    finally:
+        conn.close()
+    return rows
+
+
+if __name__ == "__main__":
+    index = ContactIndex(
+        os.path.expanduser("~") + "/Library/Application Support/AddressBook"
+    )
+    print(f"{len(index.names):,} numbers and emails")
@@ -0,0 +1,200 @@
+"""`messages serve`: keeps one warm MessagesDbManager behind a Unix domain socket.
+
+Every `messages` run pays for starting Python, importing click and the rest of the package,
+opening chat.db, loading the contacts and, for anything with sentiment, VADER. The daemon pays
+for all of that once. The `messages` entry point (main below) only needs the standard library:
+it hands its arguments to the daemon when one is listening and writes out what comes back, or
+imports the CLI and runs the command itself when there's none.
+
+One request per connection. The request is a single JSON line, {"argv": [...], "cwd": "..."}.
+The response is a series of frames, each a one byte kind, a 4 byte big-endian length and the
+payload: stdout ("o") and stderr ("e") output as it's produced, then the exit code ("x")."""
+
+import io
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import traceback
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, TextIO
+
+from messages.utils import CACHE_DIR
+
+SOCKET_PATH = os.getenv("MESSAGES_SOCKET_PATH", os.path.join(CACHE_DIR, "messages.sock"))
+# Set to anything to always run in process, even with a daemon listening
+NO_DAEMON_ENV = "MESSAGES_NO_DAEMON"
+# The one subcommand that's never forwarded
+SERVE_COMMAND = "serve"
+
+FRAME_HEADER = struct.Struct(">cI")
+STDOUT_FRAME = b"o"
+STDERR_FRAME = b"e"
+EXIT_FRAME = b"x"
+# Output is sent in frames of up to this many bytes
+FRAME_BUFFER_SIZE = 1 << 16
+
+
+def main() -> None:
+    """The `messages` entry point: forwards to the daemon if one's running, runs in process
+    otherwise."""
+    argv = sys.argv[1:]
+    exit_code = None
+    if not os.getenv(NO_DAEMON_ENV) and SERVE_COMMAND not in argv:
+        exit_code = forward(argv)
+    if exit_code is None:
+        # Only now pay for click and the rest of the package
+        from messages.cli import cli  # pylint: disable=import-outside-toplevel
+
+        cli()
+    sys.exit(exit_code)
+
+
+def forward(argv: List[str], socket_path: str = SOCKET_PATH) -> Optional[int]:
+    """Runs `messages <argv>` on the daemon at socket_path, writing its output to our stdout and
+    stderr. Returns the exit code, or None if no daemon is listening."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        # No daemon, or a stale socket left behind by one that was killed
+        conn.close()
+        return None
+
+    with conn, conn.makefile("rb") as response:
+        conn.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+        outputs: Dict[bytes, BinaryIO] = {
+            STDOUT_FRAME: sys.stdout.buffer,
+            STDERR_FRAME: sys.stderr.buffer,
+        }
+        try:
+            while True:
+                header = response.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    sys.stdout.flush()
+                    print("messages serve went away before answering.", file=sys.stderr)
+                    return 1
+                kind, length = FRAME_HEADER.unpack(header)
+                payload = response.read(length)
+                if kind == EXIT_FRAME:
+                    sys.stdout.flush()
+                    return int(payload)
+                outputs[kind].write(payload)
+                if kind == STDERR_FRAME:
+                    sys.stderr.flush()
+        except BrokenPipeError:
+            # `| head` had enough. Point stdout at /dev/null so the flush at exit doesn't fail
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 0
+
+
+def is_running(socket_path: str = SOCKET_PATH) -> bool:
+    """Whether a daemon is listening on socket_path."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        conn.close()
+    return True
+
+
+def serve(run: Callable[[List[str]], int], socket_path: str = SOCKET_PATH) -> None:
+    """Answers requests on socket_path until interrupted, one at a time, by calling run with the
+    request's arguments while stdout / stderr are routed back to the requester. run gets to keep
+    whatever it likes warm between requests."""
+    if is_running(socket_path):
+        raise OSError(f"messages serve is already running on {socket_path}")
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        os.remove(socket_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Other users get to see chat.db through this, so the socket is ours only
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                _handle(conn, run)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+### Private Methods ###
+class _FrameWriter(io.RawIOBase):
+    """Writes everything it's given to conn as frames of one kind."""
+
+    def __init__(self, conn: socket.socket, kind: bytes) -> None:
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.conn.sendall(FRAME_HEADER.pack(self.kind, len(data)) + bytes(data))
+        return len(data)
+
+
+def _frame_stream(conn: socket.socket, kind: bytes, line_buffering: bool = False) -> TextIO:
+    return io.TextIOWrapper(
+        io.BufferedWriter(_FrameWriter(conn, kind), FRAME_BUFFER_SIZE),
+        encoding="utf-8",
+        errors="replace",
+        line_buffering=line_buffering,
+    )
+
+
+def _handle(conn: socket.socket, run: Callable[[List[str]], int]) -> None:
+    with conn.makefile("rb") as request_file:
+        request = json.loads(request_file.readline() or "null")
+    if not request:
+        return
+    argv: List[str] = request["argv"]
+
+    original_stdout, original_stderr, original_argv = sys.stdout, sys.stderr, sys.argv
+    original_cwd = os.getcwd()
+    sys.stdout = _frame_stream(conn, STDOUT_FRAME)
+    # Progress and errors show up right away, like they would on a terminal
+    sys.stderr = _frame_stream(conn, STDERR_FRAME, line_buffering=True)
+    sys.argv = [original_argv[0], *argv]
+    exit_code = 1
+    try:
+        # Relative paths (--output, generate's files) are relative to the requester
+        os.chdir(request["cwd"])
+        exit_code = run(argv)
+    except Exception:  # pylint: disable=broad-except
+        try:
+            traceback.print_exc()
+        except OSError:
+            # The requester is gone, nothing to report to
+            pass
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except OSError:
+                pass
+        sys.stdout, sys.stderr, sys.argv = original_stdout, original_stderr, original_argv
+        os.chdir(original_cwd)
+
+    try:
+        conn.sendall(FRAME_HEADER.pack(EXIT_FRAME, len(str(exit_code))) + str(exit_code).encode())
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    print(f"Daemon {'is' if is_running() else 'is not'} running on {SOCKET_PATH}")
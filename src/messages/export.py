@@ -0,0 +1,155 @@
+"""Streams query results out in machine readable form (JSON lines, CSV or TSV).
+
+Rows are serialized one at a time as they come off the manager's iterators, nothing is held
+besides the current row and the output buffer, so memory use doesn't grow with the history.
+MASK_PII_DATA / MASK_MESSAGE_TEXT are honored the same way as in the printed tables."""
+
+import csv
+import gzip
+import io
+import json
+import lzma
+import sys
+from contextlib import contextmanager
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Type,
+)
+
+from messages.printer import MASK_MESSAGE_TEXT, MASK_PII_DATA
+from messages.utils import mask_name, mask_phone_number, scramble_string
+
+EXPORT_FORMATS = ["jsonl", "csv", "tsv"]
+COMPRESSIONS = ["gzip", "xz"]
+# Compression used when writing to a file with one of these suffixes
+COMPRESSION_BY_SUFFIX = {".gz": "gzip", ".xz": "xz"}
+STDOUT_PATH = "-"
+
+# Masking applied to each field, keyed by field name across all the row types
+FIELD_MASKS: Dict[str, Callable[[str], str]] = {}
+if MASK_PII_DATA:
+    FIELD_MASKS.update(
+        {
+            "message_number": mask_phone_number,
+            "contact_number": mask_phone_number,
+            "full_name": mask_name,
+            "contact_name": mask_name,
+        }
+    )
+if MASK_MESSAGE_TEXT:
+    FIELD_MASKS["message_text"] = scramble_string
+
+
+def compression_for(path: Optional[str], compression: Optional[str] = None) -> Optional[str]:
+    """The explicitly requested compression, otherwise the one implied by path's suffix."""
+    if compression is not None or path is None:
+        return compression
+    for suffix, suffix_compression in COMPRESSION_BY_SUFFIX.items():
+        if path.endswith(suffix):
+            return suffix_compression
+    return None
+
+
+@contextmanager
+def open_output(path: Optional[str] = None, compression: Optional[str] = None) -> Iterator[TextIO]:
+    """Opens path (stdout if None or "-") for writing text, compressed with gzip or xz if asked
+    for or if the suffix says so."""
+    compression = compression_for(path, compression)
+    if path is None or path == STDOUT_PATH:
+        if compression is None:
+            yield sys.stdout
+            sys.stdout.flush()
+            return
+        sys.stdout.flush()
+        raw_output: Any = sys.stdout.buffer
+    else:
+        raw_output = open(path, "wb")  # pylint: disable=consider-using-with
+
+    try:
+        binary_output = raw_output
+        if compression == "gzip":
+            binary_output = gzip.GzipFile(fileobj=raw_output, mode="wb")
+        elif compression == "xz":
+            binary_output = lzma.LZMAFile(raw_output, mode="wb")
+        with io.TextIOWrapper(binary_output, encoding="utf-8", newline="") as text_output:
+            yield text_output
+    finally:
+        # Closing the wrapper only finishes the compressed stream, the file itself is ours
+        if raw_output is sys.stdout.buffer:
+            raw_output.flush()
+        else:
+            raw_output.close()
+
+
+def export_rows(
+    rows: Iterable[NamedTuple],
+    row_type: Type[Any],
+    output_format: str,
+    output: TextIO,
+    fields: Optional[Sequence[str]] = None,
+) -> int:
+    """Writes rows of row_type (one of the NamedTuples in query_types) to output, only the given
+    fields if any. Returns the number of rows written."""
+    fields = list(row_type._fields if fields is None else fields)
+    positions = [row_type._fields.index(x) for x in fields]
+    masks = [(idx, FIELD_MASKS[x]) for idx, x in enumerate(fields) if x in FIELD_MASKS]
+
+    def to_values(row: NamedTuple) -> List[Any]:
+        values = [row[x] for x in positions]
+        for idx, mask in masks:
+            if values[idx]:
+                values[idx] = mask(values[idx])
+        return values
+
+    num_rows = 0
+    if output_format == "jsonl":
+        encode = json.JSONEncoder(ensure_ascii=False, default=_to_json).encode
+        write = output.write
+        for row in rows:
+            write(encode(dict(zip(fields, to_values(row)))))
+            write("\n")
+            num_rows += 1
+        return num_rows
+
+    writer = csv.writer(
+        output, delimiter="\t" if output_format == "tsv" else ",", lineterminator="\n"
+    )
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_to_cell(x) for x in to_values(row)])
+        num_rows += 1
+    return num_rows
+
+
+### Private Methods ###
+def _to_json(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return str(value)
+    raise TypeError(f"Can't export {type(value).__name__} to JSON")
+
+
+def _to_cell(value: Any) -> Any:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Enum):
+        return str(value)
+    return value
+
+
+if __name__ == "__main__":
+    from messages.query_types import TotalCountType
+
+    rows = [TotalCountType("+15134901940", 12, "Ann Lee"), TotalCountType("12345", 3)]
+    for export_format in EXPORT_FORMATS:
+        with open_output() as stdout:
+            export_rows(rows, TotalCountType, export_format, stdout)
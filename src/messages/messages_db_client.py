@@ -2,14 +2,42 @@
 It handles all of the sqlite3 connections."""
 
 import os
+import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
-from typing import Any, List, Optional, cast
-
-from datetime import datetime
+from datetime import date, datetime
 
+from messages.connection_pool import DEFAULT_POOL_SIZE, ConnectionPool
+from messages.contact_index import ContactIndex
+from messages.mirror import MIRROR_PATH, MessagesMirror
+from messages.profiler import PROFILER
 from messages.queries import (
+    ALL_HANDLE_CONTACTS,
     ALL_CONTACT_BY_NAME,
+    CHAT_IDENTIFIERS_BY_NAME,
+    CREATE_HANDLE_CONTACT_TABLE,
+    DISTINCT_CHAT_IDENTIFIERS,
+    INSERT_HANDLE_CONTACT,
+    NO_LIMIT,
     GET_BY_DATE_WITH_CONTACT,
     GET_BY_DATE_WITHOUT_CONTACT,
     GET_BY_NAME_AND_DATE_WITH_CONTACT,
@@ -20,14 +48,100 @@ from messages.queries import (
     TOTAL_COUNT_WITH_CONTACT_QUERY,
     ALL_MESSAGES_BY_DATE,
     ALL_MESSAGES_WITH_CONTACT_BY_DATE,
+    ALL_MESSAGES_BY_DATE_UNIX,
+    ALL_MESSAGES_WITH_CONTACT_BY_DATE_UNIX,
     SEARCH_BY_TEXT_WITH_CONTACT,
     SEARCH_BY_TEXT_WITHOUT_CONTACT,
     SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT,
     SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT,
     SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT,
+    SEARCH_BY_TEXT_WITH_CONTACT_FTS,
+    SEARCH_BY_TEXT_WITHOUT_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT_FTS,
     GET_BY_NUMBER_WITH_CONTACT,
     GET_BY_NUMBER_WITHOUT_CONTACT,
     GET_BY_NAME_WITH_CONTACT,
+    MESSAGE_MAX_ROWID,
+    LATEST_MESSAGE,
+    AGGREGATE_MESSAGES_BY_NUMBER_WITH_CONTACT,
+    AGGREGATE_MESSAGES_BY_NUMBER_WITHOUT_CONTACT,
+    AGGREGATE_MESSAGES_BY_NAME_WITH_CONTACT,
+    AGGREGATE_MESSAGES_BY_CHAT_WITH_CONTACT,
+    AGGREGATE_MESSAGES_BY_CHAT_WITHOUT_CONTACT,
+    STATS_ALL,
+    STATS_BY_NAME_WITH_CONTACT,
+    STATS_BY_NUMBER,
+)
+from messages.search_index import MessageSearchIndex, to_fts_query
+from messages.utils import (
+    backup_database,
+    local_date_window_to_apple_ns,
+    read_only_uri,
+)
+
+QueryParams = Union[Sequence[Any], Mapping[str, Any]]
+
+
+class ReadConnection(sqlite3.Connection):
+    """A pooled chat.db connection. TEMP tables and ATTACHes only exist on the connection
+    that made them, so each one remembers which of them it has been set up with."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.has_handle_contacts = False
+        self.has_search_index = False
+
+
+class SearchQueries(NamedTuple):
+    """One flavour of the search queries, for each way of narrowing down the chat."""
+
+    by_text_with_contact: str
+    by_text_without_contact: str
+    by_text_and_number_with_contact: str
+    by_text_and_number_without_contact: str
+    by_text_and_name_with_contact: str
+
+
+SEARCH_QUERIES = SearchQueries(
+    SEARCH_BY_TEXT_WITH_CONTACT,
+    SEARCH_BY_TEXT_WITHOUT_CONTACT,
+    SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT,
+    SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT,
+    SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT,
+)
+SEARCH_FTS_QUERIES = SearchQueries(
+    SEARCH_BY_TEXT_WITH_CONTACT_FTS,
+    SEARCH_BY_TEXT_WITHOUT_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS,
+    SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT_FTS,
+)
+# Matches plus the messages around them, see SEARCH_CONTEXT_TEMPLATE
+SEARCH_CONTEXT_QUERIES = SearchQueries(
+    SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT,
+    SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT,
+)
+SEARCH_CONTEXT_FTS_QUERIES = SearchQueries(
+    SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS,
+    SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT_FTS,
 )
 
 
@@ -53,37 +167,113 @@ class MessagesDbClient:
     """
 
     # Default messages sqlite3 path
-    MESSAGE_DB_PATH = os.path.expanduser("~") + "/Library/Messages/chat.db"
+    MESSAGE_DB_PATH = os.getenv(
+        "MESSAGES_DB_PATH", os.path.expanduser("~") + "/Library/Messages/chat.db"
+    )
     # Best guess for AddressBook parent path
-    ADDRESS_BOOK_DB_PARENT_PATH = (
-        os.path.expanduser("~") + "/Library/Application Support/AddressBook"
+    ADDRESS_BOOK_DB_PARENT_PATH = os.getenv(
+        "MESSAGES_ADDRESS_BOOK_PATH",
+        os.path.expanduser("~") + "/Library/Application Support/AddressBook",
     )
-
-    def __init__(self) -> None:
-        if not os.access(self.MESSAGE_DB_PATH, os.R_OK):
+    # Number of rows pulled from sqlite at a time when streaming results
+    QUERY_BATCH_SIZE = 1000
+    # Compiled statements kept per connection. Every query text is fixed (see queries.py), so
+    # this only needs to fit the handful of queries a session actually runs.
+    STATEMENT_CACHE_SIZE = 128
+    # We only ever read chat.db, mostly in big scans. Map it into memory, keep a larger page
+    # cache (negative means KiB) and keep sorts and the TEMP contact index off disk.
+    CONNECTION_PRAGMAS: Dict[str, Union[int, str]] = {
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+    }
+
+    def __init__(
+        self,
+        use_mirror: bool = False,
+        db_path: Optional[str] = None,
+        address_book_path: Optional[str] = None,
+        snapshot: bool = False,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        self.use_mirror = use_mirror
+        if db_path is not None:
+            self.db_path = db_path
+        else:
+            self.db_path = MIRROR_PATH if use_mirror else self.MESSAGE_DB_PATH
+        self.address_book_path = (
+            address_book_path
+            if address_book_path is not None
+            else self.ADDRESS_BOOK_DB_PARENT_PATH
+        )
+        if use_mirror and not os.path.isfile(self.db_path):
+            raise OSError(
+                f"No mirror found at {self.db_path}. Please run `messages sync` first."
+            )
+        if not os.access(self.db_path, os.R_OK):
             raise OSError(
-                f"Do not have access to the MESSAGE_DB_PATH {self.MESSAGE_DB_PATH}. "
+                f"Do not have access to the MESSAGE_DB_PATH {self.db_path}. "
                 "Please check permissions and ensure read access"
             )
-        self.conn = sqlite3.connect(self.MESSAGE_DB_PATH)
-        cursor = self.conn.cursor()
-        max_adb_file = self._get_address_book_filename()
-        self._cached_does_edb_table_exist: Optional[bool] = None
-        try:
-            cursor.execute("ATTACH ? AS adb;", [max_adb_file])
-            self.conn.commit()
-        except Exception as ex:
-            print(f"Exception {ex}")
-        finally:
-            cursor.close()
+        # Where the data comes from, db_path points at the copy when running on a snapshot
+        self.source_db_path = self.db_path
+        # Temp dir holding the copies when running on a snapshot, removed with the client
+        self.snapshot_dir: Optional[str] = None
+        self._remove_snapshot: Optional[weakref.finalize] = None
+        if snapshot:
+            self._take_snapshot()
+        # Every query checks a connection out for as long as its rows are being read, so
+        # threads sharing the client each get their own (see connection_pool.py)
+        # (handler, instructions) every connection gets, see set_progress_handler
+        self._progress_handler: Optional[Tuple[Callable[[], int], int]] = None
+        self.pool = ConnectionPool(self._connect, pool_size)
+        # Open the first one now, so a database we can't read fails here rather than mid-query
+        with self.pool.connection():
+            pass
+        # Contacts are only loaded (and the handle_contact table built) once a query needs them.
+        # The mirror already has its own handle_contact table with the names resolved.
+        self.contact_index = ContactIndex(self.address_book_path)
+        self._cached_does_edb_table_exist: Optional[bool] = True if use_mirror else None
+        self.search_index = MessageSearchIndex(source_db_path=self.source_db_path)
+        # chat.db's max ROWID as of the last refresh of the search index, None until it's in use
+        self._search_index_max_rowid: Optional[int] = None
+        # Loading the contacts and refreshing the search index happen once per client, whichever
+        # thread gets there first
+        self._setup_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Closes the connections, the ones still streaming results once they're done, and
+        removes the snapshot if there is one (streams already reading it keep their copy open)."""
+        self.pool.close()
+        if self._remove_snapshot is not None:
+            self._remove_snapshot()
+
+    def set_progress_handler(self, handler: Callable[[], int], num_instructions: int) -> None:
+        """Has sqlite call handler every num_instructions VM instructions on every connection,
+        open or opened later. A non-zero return aborts the statement stepping at the time with
+        sqlite3.OperationalError. Unlike interrupt(), every other statement open on that
+        connection carries on."""
+        self._progress_handler = (handler, num_instructions)
+        self.pool.apply(lambda conn: conn.set_progress_handler(handler, num_instructions))
+
+    def interrupt(self) -> None:
+        """Aborts every query that's running right now, they raise sqlite3.OperationalError."""
+        self.pool.interrupt()
 
     def total_distinct_convos(self) -> int:
         """Returns the number of distinct iMessage conversations"""
-        return cast(int, self._run_independent_query(TOTAL_DISTINCT_CONVO_QUERY)[0][0])
+        return cast(
+            int,
+            next(
+                self._run_independent_query(
+                    TOTAL_DISTINCT_CONVO_QUERY, needs_contacts=False
+                )
+            )[0],
+        )
 
     def total_messages_by_contact_or_number_sorted(
         self, limit_number: Optional[int] = None
-    ) -> List[Any]:
+    ) -> Iterator[Any]:
         """Returns the total number of messages per each contact"""
         return self._run_query_with_adb_if_avail(
             TOTAL_COUNT_WITH_CONTACT_QUERY,
@@ -91,13 +281,23 @@ class MessagesDbClient:
             limit_number,
         )
 
-    def all_contacts(self) -> List[Any]:
+    def all_contacts(self) -> Iterator[Any]:
         """Gets all contacts the user has texted."""
         return self._run_independent_query(ALL_CONTACT_BY_NAME)
 
-    def all_messages_sorted(self, limit_number: Optional[int] = None) -> List[Any]:
+    def all_messages_sorted(
+        self, limit_number: Optional[int] = None, unix_dates: bool = False
+    ) -> Iterator[Any]:
         """Returns all messages sorted based in chronological order.
-        This will be an expensive underlying query."""
+        This will be an expensive underlying query.
+
+        With unix_dates, message_date is unix seconds instead of a formatted local time."""
+        if unix_dates:
+            return self._run_query_with_adb_if_avail(
+                ALL_MESSAGES_WITH_CONTACT_BY_DATE_UNIX,
+                ALL_MESSAGES_BY_DATE_UNIX,
+                limit_number,
+            )
         return self._run_query_with_adb_if_avail(
             ALL_MESSAGES_WITH_CONTACT_BY_DATE, ALL_MESSAGES_BY_DATE, limit_number
         )
@@ -111,49 +311,79 @@ class MessagesDbClient:
         limit_number: Optional[int] = None,
         before_number: Optional[int] = None,
         after_number: Optional[int] = None,
-    ) -> List[Any]:
+    ) -> Iterator[Any]:
         """Returns all message content filtered on a certain string.
-        If you choose to pass in a phone number or a name, we will search on that as well"""
+        If you choose to pass in a phone number or a name, we will search on that as well.
+
+        With before_number / after_number, every match also comes with up to that many
+        messages before / after it in the same chat. Those rows have two extra columns,
+        is_match and context_group (overlapping windows share a group)."""
         if search_name is not None and search_number is not None:
             raise ValueError(
                 f"Both search_name {search_name} and search_number \
                 {search_number} are not allowed to be specified."
             )
 
-        if search_number is not None:
-            return self._run_query_with_adb_if_avail(
-                SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT.format(
-                    search_text=search_text, search_number=search_number
-                ),
-                SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT.format(
-                    search_text=search_text, search_number=search_number
-                ),
-                limit_number,
-            )
-
-        if search_name is not None:
-            return self._run_independent_query(
-                SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT.format(
-                    search_text=search_text, search_name=search_name
-                ),
+        if before_number or after_number:
+            params: Dict[str, Any] = {
+                "before_number": before_number or 0,
+                "after_number": after_number or 0,
+            }
+            like_queries, fts_queries = SEARCH_CONTEXT_QUERIES, SEARCH_CONTEXT_FTS_QUERIES
+        else:
+            params = {}
+            like_queries, fts_queries = SEARCH_QUERIES, SEARCH_FTS_QUERIES
+
+        fts_query = to_fts_query(search_text)
+        if fts_query and self._maybe_attach_search_index():
+            return self._search_messages(
+                fts_queries,
+                {**params, "fts_query": fts_query},
+                search_number,
+                search_name,
                 limit_number,
             )
-
-        return self._run_query_with_adb_if_avail(
-            SEARCH_BY_TEXT_WITH_CONTACT.format(search_text=search_text),
-            SEARCH_BY_TEXT_WITHOUT_CONTACT.format(search_text=search_text),
+        return self._search_messages(
+            like_queries,
+            {**params, "search_text": search_text},
+            search_number,
+            search_name,
             limit_number,
         )
 
+    def sync_mirror(self) -> int:
+        """Copies everything new in chat.db into the local mirror.
+        Returns the number of newly synced messages."""
+        if self.use_mirror:
+            raise ValueError("Cannot sync the mirror from itself.")
+        with self.pool.connection() as conn:
+            self._ensure_handle_contact_index(cast(ReadConnection, conn))
+            return MessagesMirror().sync(conn, conn.execute(ALL_HANDLE_CONTACTS).fetchall())
+
+    def refresh_search_index(self, rebuild: bool = False) -> int:
+        """Builds or incrementally refreshes the full-text search index.
+        Returns the number of new messages that were processed."""
+        with self.pool.connection() as conn:
+            if cast(ReadConnection, conn).has_search_index:
+                conn.execute("DETACH fts;")
+                cast(ReadConnection, conn).has_search_index = False
+            return self.search_index.refresh(conn, rebuild=rebuild)
+
     def get_messages(
         self,
         get_number: Optional[str] = None,
         get_name: Optional[str] = None,
         get_date: Optional[datetime] = None,
         limit_number: Optional[int] = None,
-    ) -> List[Any]:
-        """Dumps all messages for a given name or number."""
-        if get_number is None and get_name is None and get_date is None:
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Iterator[Any]:
+        """Dumps all messages for a given name or number, optionally only for a single
+        day (get_date) or an inclusive range of local days (date_from / date_to)."""
+        is_date_filtered = (
+            get_date is not None or date_from is not None or date_to is not None
+        )
+        if get_number is None and get_name is None and not is_date_filtered:
             raise ValueError(
                 "Both get_number and get_name cannot be None at the same time."
             )
@@ -163,104 +393,362 @@ class MessagesDbClient:
                 "Both get_number and get_name cannot be specified at the same time."
             )
 
-        if get_date and (get_name or get_number):
-            converted_date = get_date.strftime("%Y-%m-%d")
+        if get_date is not None and (date_from is not None or date_to is not None):
+            raise ValueError(
+                "get_date cannot be specified at the same time as date_from or date_to."
+            )
+
+        if is_date_filtered:
+            if get_date is not None:
+                date_from = date_to = get_date
+            date_start, date_end = local_date_window_to_apple_ns(date_from, date_to)
+            params: Dict[str, Any] = {"date_start": date_start, "date_end": date_end}
             if get_name:
                 return self._run_independent_query(
-                    GET_BY_NAME_AND_DATE_WITH_CONTACT.format(
-                        get_name=get_name,
-                        get_date=converted_date,
-                    ),
+                    GET_BY_NAME_AND_DATE_WITH_CONTACT,
                     limit_number,
+                    {**params, "get_name": get_name},
                 )
 
             if get_number:
                 return self._run_query_with_adb_if_avail(
-                    GET_BY_NUMBER_AND_DATE_WITH_CONTACT.format(
-                        get_number=get_number, get_date=converted_date
-                    ),
-                    GET_BY_NUMBER_AND_DATE_WITHOUT_CONTACT.format(
-                        get_number=get_number, get_date=converted_date
-                    ),
+                    GET_BY_NUMBER_AND_DATE_WITH_CONTACT,
+                    GET_BY_NUMBER_AND_DATE_WITHOUT_CONTACT,
                     limit_number,
+                    {**params, "get_number": get_number},
                 )
 
             return self._run_query_with_adb_if_avail(
-                GET_BY_DATE_WITH_CONTACT.format(get_date=converted_date),
-                GET_BY_DATE_WITHOUT_CONTACT.format(get_date=converted_date),
+                GET_BY_DATE_WITH_CONTACT,
+                GET_BY_DATE_WITHOUT_CONTACT,
                 limit_number,
+                params,
             )
 
         if get_name and self._does_adb_table_exists():
             return self._run_independent_query(
-                GET_BY_NAME_WITH_CONTACT.format(get_name=get_name), limit_number
+                GET_BY_NAME_WITH_CONTACT, limit_number, {"get_name": get_name}
             )
 
         if get_number:
             return self._run_query_with_adb_if_avail(
-                GET_BY_NUMBER_WITH_CONTACT.format(get_number=get_number),
-                GET_BY_NUMBER_WITHOUT_CONTACT.format(get_number=get_number),
+                GET_BY_NUMBER_WITH_CONTACT,
+                GET_BY_NUMBER_WITHOUT_CONTACT,
+                limit_number,
+                {"get_number": get_number},
+            )
+
+        return iter(())
+
+    def messages_for_generation(
+        self,
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        limit_number: Optional[int] = None,
+    ) -> Iterator[Any]:
+        """All messages for a given name or number in chronological order, like get_messages
+        but with message_date as unix seconds so they can be compared without parsing."""
+        if search_number and search_name:
+            raise ValueError(
+                "Both search_number and search_name cannot be specified at the same time."
+            )
+
+        if search_name and self._does_adb_table_exists():
+            return self._run_independent_query(
+                AGGREGATE_MESSAGES_BY_NAME_WITH_CONTACT,
+                limit_number,
+                {"search_name": search_name},
+            )
+
+        if search_number:
+            return self._run_query_with_adb_if_avail(
+                AGGREGATE_MESSAGES_BY_NUMBER_WITH_CONTACT,
+                AGGREGATE_MESSAGES_BY_NUMBER_WITHOUT_CONTACT,
                 limit_number,
+                {"search_number": search_number},
             )
 
-        return []
+        return iter(())
+
+    def messages_for_generation_by_chat(self, top_chats: Optional[int] = None) -> Iterator[Any]:
+        """Same rows as messages_for_generation, but for the top_chats chats with the most
+        messages (every chat if None) in a single scan, ordered by chat and then by date."""
+        return self._run_query_with_adb_if_avail(
+            AGGREGATE_MESSAGES_BY_CHAT_WITH_CONTACT,
+            AGGREGATE_MESSAGES_BY_CHAT_WITHOUT_CONTACT,
+            top_chats,
+        )
+
+    def max_message_rowid(self) -> int:
+        """Highest message ROWID, it only goes up as messages are added."""
+        return cast(
+            int,
+            next(self._run_independent_query(MESSAGE_MAX_ROWID, needs_contacts=False))[0],
+        )
+
+    def latest_message(self) -> Tuple[int, Optional[str]]:
+        """(ROWID, guid) of the newest message, (0, None) without any. Together they tell this
+        database apart from another one (or a replaced chat.db) at the same path."""
+        row = next(self._run_independent_query(LATEST_MESSAGE, needs_contacts=False), None)
+        return (0, None) if row is None else (cast(int, row[0]), cast(Optional[str], row[1]))
+
+    def chat_identifiers_for_name(self, search_name: str) -> List[str]:
+        """The chats whose contact name matches search_name, like the name filters do."""
+        if not self._does_adb_table_exists():
+            return []
+        return [
+            row[0]
+            for row in self._run_independent_query(
+                CHAT_IDENTIFIERS_BY_NAME, params={"search_name": search_name}
+            )
+        ]
+
+    def message_stats(
+        self, search_number: Optional[str] = None, search_name: Optional[str] = None
+    ) -> Iterator[Any]:
+        """Message volume per (local month, weekday, hour) for a name, a number or everyone.
+        Everything is aggregated inside sqlite, rows are (month, weekday (0 = Sunday), hour,
+        message count, sent count)."""
+        if search_number and search_name:
+            raise ValueError(
+                "Both search_number and search_name cannot be specified at the same time."
+            )
+
+        if search_name:
+            if not self._does_adb_table_exists():
+                return iter(())
+            return self._run_independent_query(
+                STATS_BY_NAME_WITH_CONTACT, params={"search_name": search_name}
+            )
+
+        if search_number:
+            return self._run_independent_query(
+                STATS_BY_NUMBER, params={"search_number": search_number}, needs_contacts=False
+            )
+
+        return self._run_independent_query(STATS_ALL, needs_contacts=False)
 
     ### Private Methods ###
+    def _connect(self) -> sqlite3.Connection:
+        """Opens db_path read-only, so we never take a write lock on a database that
+        Messages.app may be writing to, with the CONNECTION_PRAGMAS tuning applied.
+        The pool passes connections between threads, one thread at a time."""
+        conn = cast(
+            ReadConnection,
+            sqlite3.connect(
+                read_only_uri(self.db_path),
+                uri=True,
+                cached_statements=self.STATEMENT_CACHE_SIZE,
+                check_same_thread=False,
+                factory=ReadConnection,
+            ),
+        )
+        for pragma, value in self.CONNECTION_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value};")
+        conn.has_handle_contacts = self.use_mirror
+        if self._progress_handler is not None:
+            conn.set_progress_handler(*self._progress_handler)
+        return conn
+
+    def _take_snapshot(self) -> None:
+        """Copies the database into a temp dir with the backup API and points the client at the
+        copy, so long analyses never contend with the live writer. Contacts come from the
+        ContactIndex, which only ever briefly opens the AddressBooks read-only."""
+        snapshot_dir = tempfile.mkdtemp(prefix="imessage-cli-snapshot-")
+        self._remove_snapshot = weakref.finalize(
+            self, shutil.rmtree, snapshot_dir, ignore_errors=True
+        )
+        self.snapshot_dir = snapshot_dir
+
+        db_copy_path = os.path.join(snapshot_dir, os.path.basename(self.db_path))
+        backup_database(self.db_path, db_copy_path)
+        self.db_path = db_copy_path
+
+    def _search_messages(
+        self,
+        queries: SearchQueries,
+        params: Dict[str, Any],
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        limit_number: Optional[int] = None,
+    ) -> Iterator[Any]:
+        if search_number is not None:
+            return self._run_query_with_adb_if_avail(
+                queries.by_text_and_number_with_contact,
+                queries.by_text_and_number_without_contact,
+                limit_number,
+                {**params, "search_number": search_number},
+            )
+
+        if search_name is not None:
+            return self._run_independent_query(
+                queries.by_text_and_name_with_contact,
+                limit_number,
+                {**params, "search_name": search_name},
+            )
+
+        return self._run_query_with_adb_if_avail(
+            queries.by_text_with_contact,
+            queries.by_text_without_contact,
+            limit_number,
+            params,
+        )
+
+    def _maybe_attach_search_index(self) -> bool:
+        """Whether the full-text search index can be used, i.e. the user has built one. It's
+        brought up to date whenever messages were received since the last refresh, which a
+        client kept warm by `messages serve` sees all the time. Each connection attaches it as
+        fts when it's next checked out (see _checkout)."""
+        if self._search_index_max_rowid is None and not self.search_index.exists():
+            return False
+
+        max_rowid = self.max_message_rowid()
+        if self._search_index_max_rowid is not None and max_rowid <= self._search_index_max_rowid:
+            return True
+        with self._setup_lock:
+            if self._search_index_max_rowid is None or max_rowid > self._search_index_max_rowid:
+                with self.pool.connection() as conn:
+                    self.search_index.refresh(conn)
+                self._search_index_max_rowid = max_rowid
+        return True
+
     def _run_independent_query(
-        self, query: str, limit_number: Optional[int] = None
-    ) -> List[Any]:
-        if limit_number:
-            query = query.replace(";\n", f"\nLIMIT {limit_number};\n")
-        cursor = self.conn.cursor()
-        return cursor.execute(query).fetchall()
+        self,
+        query: str,
+        limit_number: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+        needs_contacts: bool = True,
+    ) -> Iterator[Any]:
+        return self._stream_query(
+            lambda: query, self._with_limit(params, limit_number), needs_contacts
+        )
 
     def _run_query_with_adb_if_avail(
         self,
         with_contact_query: str,
         without_contact_query: str,
         limit_number: Optional[int] = None,
-    ) -> List[Any]:
-        if limit_number:
-            with_contact_query = with_contact_query.replace(
-                ";\n", f"\nLIMIT {limit_number};\n"
-            )
-            without_contact_query = without_contact_query.replace(
-                ";\n", f"\nLIMIT {limit_number};\n"
-            )
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Any]:
+        return self._stream_query(
+            lambda: with_contact_query if self._does_adb_table_exists() else without_contact_query,
+            self._with_limit(params, limit_number),
+        )
 
-        cursor = self.conn.cursor()
-        if self._does_adb_table_exists():
-            data = cursor.execute(with_contact_query).fetchall()
-        else:
-            data = cursor.execute(without_contact_query).fetchall()
-        return data
+    def _stream_query(
+        self, choose_query: Callable[[], str], params: Dict[str, Any], needs_contacts: bool = True
+    ) -> Iterator[Any]:
+        """Runs the query on a pooled connection and streams its rows. The connection stays
+        checked out until the rows are exhausted or the iterator is closed or dropped."""
+        lease = self.pool.checkout()
+        try:
+            conn = self._checkout(lease.conn, needs_contacts)
+            cursor = self._execute(conn.cursor(), choose_query(), params)
+        except BaseException:
+            self.pool.checkin(lease)
+            raise
+        # An iterator dropped before its first row never runs its finally, the finalizer
+        # returns the connection then. Calling it from the finally makes it a no-op later.
+        release: List[Callable[[], Any]] = []
+        rows = self._iter_rows(cursor, lambda: release[0]())
+        release.append(weakref.finalize(rows, self.pool.checkin, lease))
+        return rows
+
+    def _checkout(self, conn: sqlite3.Connection, needs_contacts: bool) -> ReadConnection:
+        """Sets conn up for a query: the handle_contact table if it needs contacts and the
+        search index once it's in use."""
+        read_conn = cast(ReadConnection, conn)
+        if needs_contacts:
+            self._ensure_handle_contact_index(read_conn)
+        if self._search_index_max_rowid is not None and not read_conn.has_search_index:
+            read_conn.execute("ATTACH ? AS fts;", [read_only_uri(self.search_index.path)])
+            read_conn.has_search_index = True
+        return read_conn
+
+    @staticmethod
+    def _with_limit(
+        params: Optional[Dict[str, Any]], limit_number: Optional[int]
+    ) -> Dict[str, Any]:
+        """Adds :limit_number to params. The limit is bound like everything else so the
+        statement text, and with it the compiled statement, is the same for every limit."""
+        return {**(params or {}), "limit_number": limit_number or NO_LIMIT}
+
+    def _execute(
+        self, cursor: sqlite3.Cursor, query: str, params: QueryParams = ()
+    ) -> sqlite3.Cursor:
+        """Runs query on cursor. While profiling, also records how sqlite plans it."""
+        if not PROFILER.active:
+            return cursor.execute(query, params)
+
+        with PROFILER.stage("sql.explain"):
+            plan = [
+                row[-1]
+                for row in cursor.connection.execute("EXPLAIN QUERY PLAN " + query, params)
+            ]
+        with PROFILER.stage("sql.execute"):
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            execute_seconds = time.perf_counter() - start
+        PROFILER.record_query(query, plan, execute_seconds)
+        return cursor
+
+    @classmethod
+    def _iter_rows(cls, cursor: sqlite3.Cursor, release: Callable[[], Any]) -> Iterator[Any]:
+        """Streams rows off an executed cursor in batches, so callers never hold the
+        whole result set in memory and can start working on the first batch right away.
+        Calls release once the cursor is closed."""
+        try:
+            while True:
+                with PROFILER.stage("sql.fetch"):
+                    rows = cursor.fetchmany(cls.QUERY_BATCH_SIZE)
+                if not rows:
+                    return
+                PROFILER.add_rows("sql.fetch", len(rows))
+                yield from rows
+        finally:
+            cursor.close()
+            release()
 
     # Address Book methods
-    def _get_address_book_filename(self) -> str:
-        """Gets the maximum address book file, which we will then assume
-        to be the corresponding sqlite db file for referencing ContactInfo."""
-        tgt_path = self.ADDRESS_BOOK_DB_PARENT_PATH
-        address_book_files = [
-            os.path.join(tgt_path, f)
-            for f in os.listdir(tgt_path)
-            if os.path.isfile(os.path.join(tgt_path, f))
-        ]
-        max_file = max(address_book_files, key=lambda x: os.stat(x).st_size)
-        return max_file
+    def _ensure_handle_contact_index(self, conn: ReadConnection) -> None:
+        if conn.has_handle_contacts:
+            return
+        if self._cached_does_edb_table_exist is None:
+            # The contacts are loaded once, by whichever thread asks first
+            with self._setup_lock:
+                self._does_adb_table_exists()
+        with PROFILER.stage("contacts.index"):
+            self._build_handle_contact_index(conn)
+        conn.has_handle_contacts = True
+
+    def _build_handle_contact_index(self, conn: sqlite3.Connection) -> None:
+        """Resolves every chat handle to a contact name once per connection and stores it in
+        the handle_contact TEMP table. The _WITH_CONTACT queries join against it on equality,
+        which lets sqlite use the primary key instead of a LIKE over every phone number."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CREATE_HANDLE_CONTACT_TABLE)
+            if not self._does_adb_table_exists():
+                return
+
+            handle_contacts = []
+            for (chat_identifier,) in self._execute(
+                cursor, DISTINCT_CHAT_IDENTIFIERS
+            ).fetchall():
+                full_name = self.contact_index.name_for(chat_identifier)
+                if full_name is not None:
+                    handle_contacts.append((chat_identifier, full_name))
+            cursor.executemany(INSERT_HANDLE_CONTACT, handle_contacts)
+            conn.commit()
+        finally:
+            cursor.close()
 
     def _does_adb_table_exists(self) -> bool:
-        """Ensures that we have the needed table for getting the true contact name"""
-        if self._cached_does_edb_table_exist is not None:
-            return self._cached_does_edb_table_exist
-
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM adb.ZABCDPHONENUMBER LIMIT 1").fetchall()
-        except Exception as _:
-            self._cached_does_edb_table_exist = False
-            return False
-        self._cached_does_edb_table_exist = True
-        return True
+        """Whether there are any contacts to resolve names with, i.e. whether the
+        _WITH_CONTACT queries are worth running."""
+        if self._cached_does_edb_table_exist is None:
+            self._cached_does_edb_table_exist = bool(self.contact_index.names)
+        return self._cached_does_edb_table_exist
 
 
 if __name__ == "__main__":
@@ -1,32 +1,58 @@
 """This manager class differs from the client in a couple key ways. The client is largely just meant to retrieve the data.
     This will add additional features including sentiment analysis, correct casting to specific types, etc."""
 
-from datetime import datetime
+from datetime import date, datetime
+import json
+import threading
+import time
 from typing import (
+    Any,
+    Dict,
+    Iterator,
     List,
     Optional,
     Tuple,
+    Type,
+    TypeVar,
+    Union,
 )
 from messages.messages_db_client import MessagesDbClient
-from messages.model_generator import ModelGenerator, PromptCompletionPair
+from messages.mirror import MessagesMirror
+from messages.model_generator import ModelGenerator
+from messages.profiler import PROFILER
 from messages.sentiment_classifier import (
     OverallSentiment,
     SentimentAnalysisModel,
     SentimentResult,
 )
+from messages.result_set import MessageResultSet
+from messages.sentiment_cache import SentimentCache
+from messages.stats_cache import StatsCache
+from messages.utils import chunked, period_start
 
 from messages.query_types import (
-    AggregateSentimentStats,
+    ActivityStatsType,
     AllContactType,
     GetAllMessageType,
     GetAllMessageWithSentimentType,
+    RunningSentimentStats,
     SearchWithSentimentType,
+    SentimentSeriesType,
     TotalCountType,
     AllMessageType,
     SearchType,
 )
 
 
+MessageRowType = TypeVar("MessageRowType", bound=Union[SearchType, GetAllMessageType])
+
+# Number of messages scored together. Small enough that the first rows print right away.
+SENTIMENT_BATCH_SIZE = 500
+# Monday first, sqlite's %w counts from Sunday
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+HOURS_PER_WEEK = 7 * 24
+
+
 def if_none_return_empty(maybe_empty: Optional[str]) -> str:
     """See name"""
     return "" if maybe_empty is None else maybe_empty
@@ -35,10 +61,62 @@ def if_none_return_empty(maybe_empty: Optional[str]) -> str:
 class MessagesDbManager:
     """Manager for the messages db."""
 
-    def __init__(self) -> None:
-        self.client = MessagesDbClient()
-        self.sentiment_model = SentimentAnalysisModel()
-        self.chatbot_model_generator = ModelGenerator(self.client)
+    def __init__(
+        self,
+        client: Optional[MessagesDbClient] = None,
+        workers: int = 1,
+        use_sentiment_cache: bool = True,
+        use_stats_cache: bool = True,
+    ) -> None:
+        self.client = client if client is not None else MessagesDbClient()
+        # Number of processes used to score sentiment, 1 scores in process
+        self.workers = workers
+        self.use_sentiment_cache = use_sentiment_cache
+        self._sentiment_model: Optional[SentimentAnalysisModel] = None
+        self._sentiment_cache: Optional[SentimentCache] = None
+        self.use_stats_cache = use_stats_cache
+        self._stats_cache: Optional[StatsCache] = None
+        self._chatbot_model_generator: Optional[ModelGenerator] = None
+        # Threads can share a manager, so whatever's built on first use is only built once
+        self._build_lock = threading.RLock()
+
+    @property
+    def sentiment_model(self) -> SentimentAnalysisModel:
+        """Built on first use, loading VADER is the slowest part of starting up."""
+        if self._sentiment_model is None:
+            with self._build_lock:
+                if self._sentiment_model is None:
+                    self._sentiment_model = SentimentAnalysisModel(workers=self.workers)
+        return self._sentiment_model
+
+    @property
+    def sentiment_cache(self) -> Optional[SentimentCache]:
+        """Persisted scores from earlier runs, None if disabled."""
+        if self._sentiment_cache is None and self.use_sentiment_cache:
+            with self._build_lock:
+                if self._sentiment_cache is None:
+                    self._sentiment_cache = SentimentCache(
+                        self.sentiment_model.scorer_version()
+                    )
+        return self._sentiment_cache
+
+    @property
+    def stats_cache(self) -> Optional[StatsCache]:
+        """Persisted `stats` results from earlier runs, None if disabled."""
+        if self._stats_cache is None and self.use_stats_cache:
+            with self._build_lock:
+                if self._stats_cache is None:
+                    self._stats_cache = StatsCache()
+        return self._stats_cache
+
+    @property
+    def chatbot_model_generator(self) -> ModelGenerator:
+        """Built on first use and shares our client (and its connection pool)."""
+        if self._chatbot_model_generator is None:
+            with self._build_lock:
+                if self._chatbot_model_generator is None:
+                    self._chatbot_model_generator = ModelGenerator(self.client)
+        return self._chatbot_model_generator
 
     def total_distinct_convos(self) -> int:
         """Returns the number of distinct iMessage conversations"""
@@ -46,27 +124,43 @@ class MessagesDbManager:
 
     def total_messages_by_contact_or_number_sorted(
         self, limit_number: Optional[int] = None
-    ) -> List[TotalCountType]:
+    ) -> Iterator[TotalCountType]:
         """Returns the total number of messages per each contact"""
-        return [
-            TotalCountType(*x)
-            for x in self.client.total_messages_by_contact_or_number_sorted(
-                limit_number
-            )
-        ]
+        return PROFILER.iter_stage(
+            "manager.rows",
+            (
+                TotalCountType(*x)
+                for x in self.client.total_messages_by_contact_or_number_sorted(
+                    limit_number
+                )
+            ),
+        )
 
-    def all_contacts(self) -> List[AllContactType]:
-        """Returns a list of all contacts."""
-        return [AllContactType(*x) for x in self.client.all_contacts()]
+    def all_contacts(self) -> Iterator[AllContactType]:
+        """Returns all contacts."""
+        return PROFILER.iter_stage(
+            "manager.rows", (AllContactType(*x) for x in self.client.all_contacts())
+        )
 
     def all_messages_sorted(
         self, limit_number: Optional[int] = None
-    ) -> List[AllMessageType]:
+    ) -> Iterator[AllMessageType]:
         """Returns all messages sorted based in chronological order.
         This will be an expensive underlying query."""
-        return [
-            AllMessageType(*x) for x in self.client.all_messages_sorted(limit_number)
-        ]
+        return PROFILER.iter_stage(
+            "manager.rows",
+            (AllMessageType(*x) for x in self.client.all_messages_sorted(limit_number)),
+        )
+
+    def all_messages_result_set(
+        self, limit_number: Optional[int] = None
+    ) -> MessageResultSet:
+        """Same messages as all_messages_sorted, but held in memory in compact column form.
+        Use this over list(all_messages_sorted()) when the whole history has to be kept."""
+        with PROFILER.stage("manager.rows"):
+            return MessageResultSet.from_rows(
+                self.client.all_messages_sorted(limit_number, unix_dates=True)
+            )
 
     def search_messages_by_text(
         self,
@@ -77,38 +171,46 @@ class MessagesDbManager:
         limit_number: Optional[int] = None,
         before_number: Optional[int] = None,
         after_number: Optional[int] = None,
-    ) -> List[SearchWithSentimentType]:
+    ) -> Iterator[SearchWithSentimentType]:
         """Returns all message content filtered on a certain string.
-        If you choose to pass in a phone number or a name, we will search on that as well"""
-        results = [
-            SearchType(*x)
-            for x in self.client.search_messages_by_text(
-                search_text,
-                search_number,
-                search_name,
-                search_date,
-                limit_number,
-                before_number=before_number,
-                after_number=after_number,
-            )
-        ]
+        If you choose to pass in a phone number or a name, we will search on that as well.
+        before_number / after_number add that many messages of context around every match,
+        rows of the same (merged) window share a context_group.
 
-        results_with_sentiment: List[SearchWithSentimentType] = []
-        for result in results:
-            results_with_sentiment.append(
-                SearchWithSentimentType(
-                    result.message_date,
-                    if_none_return_empty(result.message_text),
-                    result.is_from_me,
-                    result.message_number,
-                    self.sentiment_model.get_overall_sentiment_from_message(
-                        result.message_text
-                    ),
-                    result.full_name,
-                )
-            )
+        Results are streamed, nothing is read from sqlite until the iterator is consumed."""
+        rows = self.client.search_messages_by_text(
+            search_text,
+            search_number,
+            search_name,
+            search_date,
+            limit_number,
+            before_number=before_number,
+            after_number=after_number,
+        )
+        return self._iter_search_with_sentiment(rows)
+
+    def sync_mirror(self) -> Tuple[int, int]:
+        """Syncs new messages into the local mirror.
+        Returns the number of newly synced messages and the total in the mirror."""
+        num_new = self.client.sync_mirror()
+        return (num_new, MessagesMirror().count())
+
+    def refresh_search_index(self, rebuild: bool = False) -> Tuple[int, int]:
+        """Builds or incrementally refreshes the full-text search index.
+        Returns the number of newly processed messages and the total indexed."""
+        num_new = self.client.refresh_search_index(rebuild=rebuild)
+        return (num_new, self.client.search_index.count())
+
+    def sentiment_cache_stats(self) -> List[Tuple[str, int]]:
+        """Number of persisted scores per scorer version."""
+        return [] if self.sentiment_cache is None else self.sentiment_cache.count_by_version()
 
-        return results_with_sentiment
+    def invalidate_sentiment_cache(self, all_versions: bool = False) -> int:
+        """Drops persisted scores from older scorer versions (or all of them).
+        Returns the number of scores removed."""
+        if self.sentiment_cache is None:
+            return 0
+        return self.sentiment_cache.invalidate(all_versions=all_versions)
 
     def get_messages(
         self,
@@ -116,27 +218,154 @@ class MessagesDbManager:
         get_name: Optional[str] = None,
         get_date: Optional[datetime] = None,
         limit_number: Optional[int] = None,
-    ) -> Tuple[List[GetAllMessageWithSentimentType], AggregateSentimentStats]:
-        """Dumps all messages for a given name or number."""
-        results = [
-            GetAllMessageType(*x)
-            for x in self.client.get_messages(
-                get_number,
-                get_name,
-                get_date,
-                limit_number,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Tuple[Iterator[GetAllMessageWithSentimentType], RunningSentimentStats]:
+        """Dumps all messages for a given name or number, optionally only for a single
+        day (get_date) or an inclusive range of local days (date_from / date_to).
+
+        Messages are streamed and the returned stats are updated as they're consumed, so
+        only read the aggregate (`to_aggregate()`) once the iterator has been exhausted."""
+        rows = self.client.get_messages(
+            get_number,
+            get_name,
+            get_date,
+            limit_number,
+            date_from=date_from,
+            date_to=date_to,
+        )
+        running_stats = RunningSentimentStats()
+        return (self._iter_get_with_sentiment(rows, running_stats), running_stats)
+
+    def sentiment_series(
+        self,
+        period: str = "month",
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Iterator[SentimentSeriesType]:
+        """Average compound score per day / week / month, for a given name or number or
+        across everyone. Messages without text (attachments, reactions) aren't counted.
+
+        Messages come in date order, so a period is complete as soon as the first message of
+        the next one shows up and only the running sum of the current period is kept."""
+        if search_number or search_name or date_from or date_to:
+            rows = self.client.get_messages(
+                get_number=search_number,
+                get_name=search_name,
+                date_from=date_from,
+                date_to=date_to,
+            )
+        else:
+            rows = self.client.all_messages_sorted()
+        return self._iter_sentiment_series(rows, period)
+
+    def message_stats(
+        self, search_number: Optional[str] = None, search_name: Optional[str] = None
+    ) -> List[ActivityStatsType]:
+        """Message volume in total, per month and per hour of the week, sent and received,
+        for a given name or number or across everyone.
+
+        The aggregation runs inside sqlite and its result is cached until new messages come
+        in (the max ROWID changes), so repeated runs don't scan the history again."""
+        max_rowid, latest_guid = self.client.latest_message()
+        # Buckets are in local time, so the timezone is part of the key as well. The latest
+        # guid tells a replaced chat.db apart that happens to have as many messages. A name
+        # stands for whichever chats the contacts resolve it to right now, so those are too.
+        cache_key = json.dumps(
+            [
+                self.client.source_db_path,
+                latest_guid,
+                search_number,
+                search_name,
+                self.client.chat_identifiers_for_name(search_name) if search_name else None,
+                time.tzname,
+                time.timezone,
+            ]
+        )
+        stats_cache = self.stats_cache
+        rows = None if stats_cache is None else stats_cache.get(cache_key, max_rowid)
+        if rows is None:
+            rows = [list(x) for x in self.client.message_stats(search_number, search_name)]
+            if stats_cache is not None:
+                stats_cache.put(cache_key, max_rowid, rows)
+        return self._to_activity_stats(rows)
+
+    def generate_prompt_completion(
+        self,
+        search_number: Optional[str] = None,
+        search_name: Optional[str] = None,
+        limit_number: Optional[int] = None,
+        output_dir: str = ".",
+    ) -> str:
+        """Generates the prompt completion pairing for GPT3 and writes it to a JSONL file
+        in output_dir. Returns the filename. Pairs are streamed to the file, so memory use stays flat."""
+        # We're going to write lines roughly looking like:
+        # {"prompt": "<prompt text>", "completion": "<ideal generated text>"}
+        results_to_save = self.chatbot_model_generator.generate_prompt_completion(
+            search_number, search_name, limit_number
+        )
+        if search_name:
+            return self.chatbot_model_generator.save_results_to_file(
+                results_to_save, search_name, output_dir
+            )
+        if search_number:
+            return self.chatbot_model_generator.save_results_to_file(
+                results_to_save, search_number, output_dir
             )
-        ]
+        return self.chatbot_model_generator.save_results_to_file(
+            results_to_save, output_dir=output_dir
+        )
 
-        results_with_sentiment: List[GetAllMessageWithSentimentType] = []
-        running_compound_score = 0.0
-        for result in results:
-            score: SentimentResult = self.sentiment_model.analyze_message(
-                result.message_text
+    def generate_prompt_completions_for_chats(
+        self, top_chats: Optional[int] = None, output_dir: str = "."
+    ) -> List[str]:
+        """Like generate_prompt_completion, but for the top_chats chats with the most messages
+        (every chat if None) in one pass over the history, one JSONL file per chat written to
+        output_dir. Chats are processed in `workers` processes. Returns the filenames."""
+        return list(
+            self.chatbot_model_generator.generate_for_top_chats(
+                top_chats, output_dir, self.workers
             )
-            running_compound_score += score.compound
-            results_with_sentiment.append(
-                GetAllMessageWithSentimentType(
+        )
+
+    def close(self) -> None:
+        """Stops the sentiment worker pool, if one was started, and closes the connections."""
+        if self._sentiment_model is not None:
+            self._sentiment_model.shutdown()
+        if self._sentiment_cache is not None:
+            self._sentiment_cache.close()
+        if self._stats_cache is not None:
+            self._stats_cache.close()
+        self.client.close()
+
+    ### Private Methods ###
+    def _iter_search_with_sentiment(
+        self, rows: Iterator[Any]
+    ) -> Iterator[SearchWithSentimentType]:
+        for results, scores in self._iter_scored_batches(rows, SearchType):
+            for result, score in zip(results, scores):
+                yield SearchWithSentimentType(
+                    result.message_date,
+                    if_none_return_empty(result.message_text),
+                    result.is_from_me,
+                    result.message_number,
+                    OverallSentiment.UNKNOWN
+                    if result.message_text is None
+                    else self.sentiment_model.get_overall_sentiment(score),
+                    result.full_name,
+                    bool(result.is_match),
+                    result.context_group,
+                )
+
+    def _iter_get_with_sentiment(
+        self, rows: Iterator[Any], running_stats: RunningSentimentStats
+    ) -> Iterator[GetAllMessageWithSentimentType]:
+        for results, scores in self._iter_scored_batches(rows, GetAllMessageType):
+            for result, score in zip(results, scores):
+                running_stats.add(score.compound)
+                yield GetAllMessageWithSentimentType(
                     result.message_date,
                     if_none_return_empty(result.message_text),
                     result.is_from_me,
@@ -144,55 +373,110 @@ class MessagesDbManager:
                     self.sentiment_model.get_overall_sentiment(score),
                     result.full_name,
                 )
-            )
 
-        if len(results) == 0:
-            aggregate_stats = AggregateSentimentStats(0.0, OverallSentiment.UNKNOWN)
-            return (results_with_sentiment, aggregate_stats)
+    @staticmethod
+    def _to_activity_stats(rows: List[List[Any]]) -> List[ActivityStatsType]:
+        """Folds (month, weekday, hour, count, sent) rows into the total, per month and per
+        hour of the week (every one of them, Monday 00:00 first) views."""
+        total = [0, 0]
+        by_month: Dict[str, List[int]] = {}
+        by_hour_of_week = [[0, 0] for _ in range(HOURS_PER_WEEK)]
+        for message_month, weekday, hour, message_count, sent_count in rows:
+            for counts in (
+                total,
+                by_month.setdefault(message_month, [0, 0]),
+                by_hour_of_week[(weekday + 6) % 7 * 24 + hour],
+            ):
+                counts[0] += message_count
+                counts[1] += sent_count or 0
 
-        averaged_compound_score = running_compound_score / len(results)
-        overall_sentiment = self.sentiment_model.get_sentiment_from_scalar(
-            averaged_compound_score
+        results = [ActivityStatsType("total", "all", total[0], total[1], total[0] - total[1])]
+        results.extend(
+            ActivityStatsType("month", month, count, sent, count - sent)
+            for month, (count, sent) in by_month.items()
         )
-        aggregate_stats = AggregateSentimentStats(
-            averaged_compound_score, overall_sentiment
+        results.extend(
+            ActivityStatsType(
+                "hour_of_week",
+                f"{WEEKDAY_NAMES[idx // 24]} {idx % 24:02d}:00",
+                count,
+                sent,
+                count - sent,
+            )
+            for idx, (count, sent) in enumerate(by_hour_of_week)
         )
+        return results
 
-        return (results_with_sentiment, aggregate_stats)
+    def _iter_sentiment_series(
+        self, rows: Iterator[Any], period: str
+    ) -> Iterator[SentimentSeriesType]:
+        # Filtered before scoring, column 2 is message.text
+        rows_with_text = (x for x in rows if x[2])
+        current_period: Optional[str] = None
+        running_stats = RunningSentimentStats()
+        for results, scores in self._iter_scored_batches(rows_with_text, GetAllMessageType):
+            for result, score in zip(results, scores):
+                result_period = period_start(result.message_date, period)
+                if result_period != current_period:
+                    if current_period is not None:
+                        yield self._to_series_point(current_period, running_stats)
+                    current_period = result_period
+                    running_stats = RunningSentimentStats()
+                running_stats.add(score.compound)
+        if current_period is not None:
+            yield self._to_series_point(current_period, running_stats)
 
-    def generate_prompt_completion(
-        self,
-        search_number: Optional[str] = None,
-        search_name: Optional[str] = None,
-    ) -> List[PromptCompletionPair]:
-        """Generates the prompt completion pairing for GPT3"""
-        # Ok so I thought a bit about the right way to do this.
-        #
-        # I think that it's going to be easier to have more accurate grouping logic in Python
-        # as opposed to performing a more advanced SQL query.
+    @staticmethod
+    def _to_series_point(
+        current_period: str, running_stats: RunningSentimentStats
+    ) -> SentimentSeriesType:
+        aggregate = running_stats.to_aggregate()
+        return SentimentSeriesType(
+            current_period,
+            running_stats.num_messages,
+            aggregate.compound,
+            aggregate.sentiment,
+        )
 
-        # So for aggregating messages, we really just want to aggregate if it's within the
-        # same hour and if it's from the same user.
+    def _iter_scored_batches(
+        self, rows: Iterator[Any], row_type: Type[MessageRowType]
+    ) -> Iterator[Tuple[List[MessageRowType], List[SentimentResult]]]:
+        """Groups rows into batches of row_type and scores each batch's text, in order.
+        Only messages missing from the sentiment cache actually get scored."""
+        sentiment_cache = self.sentiment_cache
 
-        # We're going to build up a list of tuples with each thing roughly looking like:
-        # {"prompt": "<prompt text>", "completion": "<ideal generated text>"}
+        def batches() -> Iterator[
+            Tuple[
+                Tuple[List[MessageRowType], Dict[str, SentimentResult], List[MessageRowType]],
+                List[Optional[str]],
+            ]
+        ]:
+            for batch in chunked(rows, SENTIMENT_BATCH_SIZE):
+                with PROFILER.stage("manager.rows", rows=len(batch)):
+                    results = [row_type(*row) for row in batch]
+                with PROFILER.stage("sentiment.cache"):
+                    cached = (
+                        {}
+                        if sentiment_cache is None
+                        else sentiment_cache.get_many(x.message_guid for x in results)
+                    )
+                uncached = [x for x in results if x.message_guid not in cached]
+                PROFILER.add_rows("sentiment.score", len(uncached))
+                yield ((results, cached, uncached), [x.message_text for x in uncached])
 
-        results_to_save = self.chatbot_model_generator.generate_prompt_completion(
-            search_number, search_name
+        scored_batches = PROFILER.iter_stage(
+            "sentiment.score",
+            self.sentiment_model.analyze_batches(batches()),
+            count_rows=False,
         )
-        if search_name:
-            self.chatbot_model_generator.save_results_to_file(
-                results_to_save, search_name
-            )
-        elif search_number:
-            self.chatbot_model_generator.save_results_to_file(
-                results_to_save, search_number
-            )
-        else:
-            self.chatbot_model_generator.save_results_to_file(results_to_save)
-        return results_to_save
-
+        for (results, cached, uncached), new_scores in scored_batches:
+            newly_scored = {x.message_guid: score for x, score in zip(uncached, new_scores)}
+            if sentiment_cache is not None:
+                with PROFILER.stage("sentiment.cache"):
+                    sentiment_cache.put_many(newly_scored)
+            cached.update(newly_scored)
+            yield (results, [cached[x.message_guid] for x in results])
 
 if __name__ == "__main__":
     x = MessagesDbManager()
-    results = x.generate_prompt_completion("5134901945")
+    filename = x.generate_prompt_completion("5134901945")
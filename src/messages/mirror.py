@@ -0,0 +1,132 @@
+"""Handles the local mirror of chat.db built by `messages sync`.
+
+The mirror is a compact sqlite database holding only the tables and columns this tool reads,
+with the contact names already resolved and indexes on what we filter on. Every subcommand can
+run against it (`messages --mirror ...`), which is faster for repeated queries and doesn't need
+the live chat.db or the AddressBook at all, so a copied mirror works on any machine.
+
+Messages are effectively immutable once written, so each sync only copies the rows above the
+highest message.ROWID synced so far. That only works against the chat.db the mirror was synced
+from, so a sync first checks that the latest mirrored messages have the same guids in the source
+(a few may have been deleted since) and refuses to mix in another database's messages."""
+
+import os
+import sqlite3
+from typing import Iterable, Optional, Tuple, cast
+
+from messages.queries import (
+    CREATE_MIRROR,
+    DELETE_MIRROR_HANDLE_CONTACTS,
+    INSERT_MIRROR_CHAT,
+    INSERT_MIRROR_CHAT_MESSAGE_JOIN,
+    INSERT_MIRROR_HANDLE_CONTACT,
+    INSERT_MIRROR_MESSAGE,
+    MESSAGE_GUID_BY_ROWID,
+    MIRROR_LATEST_MESSAGE_GUIDS,
+    MIRROR_MAX_ROWID,
+    MIRROR_MESSAGE_COUNT,
+    MIRROR_SOURCE_CHATS,
+    MIRROR_SOURCE_CHAT_MESSAGE_JOINS,
+    MIRROR_SOURCE_MESSAGES,
+    UPDATE_MIRROR_MAX_ROWID,
+)
+from messages.utils import CACHE_DIR
+
+MIRROR_FILENAME = "mirror.db"
+MIRROR_PATH = os.getenv("MESSAGES_MIRROR_PATH", os.path.join(CACHE_DIR, MIRROR_FILENAME))
+SYNC_BATCH_SIZE = 10_000
+# Latest mirrored messages looked up in the source to make sure it's the same database
+SOURCE_CHECK_SAMPLE_SIZE = 100
+
+
+class MessagesMirror:
+    """Local, incrementally synced copy of the parts of chat.db we use."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path if path is not None else MIRROR_PATH
+
+    def exists(self) -> bool:
+        """Whether `messages sync` has been run."""
+        return os.path.isfile(self.path)
+
+    def sync(
+        self,
+        source_conn: sqlite3.Connection,
+        handle_contacts: Iterable[Tuple[str, str]],
+    ) -> int:
+        """Copies everything new from source_conn (a chat.db connection) into the mirror.
+        handle_contacts are the resolved (chat_identifier, full_name) pairs.
+        Returns the number of newly synced messages. Raises ValueError if the mirror was
+        synced from a different database."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        mirror_conn = sqlite3.connect(self.path)
+        try:
+            mirror_conn.executescript(CREATE_MIRROR)
+            max_rowid = self._max_rowid(mirror_conn)
+            if max_rowid and not self._is_synced_from(mirror_conn, source_conn):
+                raise ValueError(
+                    f"The mirror at {self.path} was synced from a different chat.db. Remove it, "
+                    "or point MESSAGES_MIRROR_PATH somewhere else, to mirror this one."
+                )
+
+            # Chats and contact names are small, and can change, so they're always copied in full
+            mirror_conn.executemany(
+                INSERT_MIRROR_CHAT, source_conn.execute(MIRROR_SOURCE_CHATS)
+            )
+            mirror_conn.execute(DELETE_MIRROR_HANDLE_CONTACTS)
+            mirror_conn.executemany(INSERT_MIRROR_HANDLE_CONTACT, handle_contacts)
+
+            num_synced = 0
+            new_max_rowid = max_rowid
+            source_cursor = source_conn.execute(MIRROR_SOURCE_MESSAGES, [max_rowid])
+            while True:
+                rows = source_cursor.fetchmany(SYNC_BATCH_SIZE)
+                if not rows:
+                    break
+                mirror_conn.executemany(INSERT_MIRROR_MESSAGE, rows)
+                new_max_rowid = rows[-1][0]
+                num_synced += len(rows)
+            source_cursor.close()
+
+            mirror_conn.executemany(
+                INSERT_MIRROR_CHAT_MESSAGE_JOIN,
+                source_conn.execute(MIRROR_SOURCE_CHAT_MESSAGE_JOINS, [max_rowid]),
+            )
+            mirror_conn.execute(UPDATE_MIRROR_MAX_ROWID, [new_max_rowid])
+            mirror_conn.commit()
+            # Keeps the planner's statistics current so the indexes actually get used. The
+            # analysis limit samples each index instead of scanning it, so this stays cheap.
+            mirror_conn.executescript("PRAGMA analysis_limit = 1000; ANALYZE;")
+            return num_synced
+        finally:
+            mirror_conn.close()
+
+    def count(self) -> int:
+        """Number of messages in the mirror."""
+        mirror_conn = sqlite3.connect(self.path)
+        try:
+            return cast(int, mirror_conn.execute(MIRROR_MESSAGE_COUNT).fetchone()[0])
+        finally:
+            mirror_conn.close()
+
+    ### Private Methods ###
+    @staticmethod
+    def _is_synced_from(mirror_conn: sqlite3.Connection, source_conn: sqlite3.Connection) -> bool:
+        """Whether the latest mirrored messages are in source_conn under the same ROWIDs.
+        Messages deleted from chat.db since are skipped, but at least one has to be found."""
+        num_found = 0
+        for rowid, guid in mirror_conn.execute(
+            MIRROR_LATEST_MESSAGE_GUIDS, [SOURCE_CHECK_SAMPLE_SIZE]
+        ).fetchall():
+            row = source_conn.execute(MESSAGE_GUID_BY_ROWID, [rowid]).fetchone()
+            if row is None:
+                continue
+            if row[0] != guid:
+                return False
+            num_found += 1
+        return num_found > 0
+
+    @staticmethod
+    def _max_rowid(mirror_conn: sqlite3.Connection) -> int:
+        row = mirror_conn.execute(MIRROR_MAX_ROWID).fetchone()
+        return 0 if row is None else cast(int, row[0])
@@ -1,12 +1,33 @@
+import json
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple
 
 import click
 from messages.messages_db_client import MessagesDbClient
-from messages.query_types import GetAllMessageType
+from messages.query_types import UnixDateMessageType
 from messages.utils import cleanse_message
 
+# If the next message is outside of this window, even from the same sender, it starts a new turn
+BREAKING_TIME_WINDOW_SECONDS = 30 * 60
+# Joins the messages of one turn
+TURN_SEPARATOR = ". "
+# Position of chat_identifier in the rows of messages_for_generation(_by_chat)
+CHAT_IDENTIFIER_INDEX = UnixDateMessageType._fields.index("message_number")
+# How many chats per worker we let queue up before waiting for one to finish. Keeps every
+# worker busy without reading far ahead of them.
+PARTITIONS_IN_FLIGHT_PER_WORKER = 2
+
 
 @dataclass
 class PromptCompletionPair:
@@ -14,43 +35,72 @@ class PromptCompletionPair:
     completion: str = ""
 
     def __str__(self) -> str:
-        return f'{{"prompt": "{self.prompt}", "completion": "{self.completion}"}}'
+        return json.dumps({"prompt": self.prompt, "completion": self.completion})
+
+
+def build_prompt_completions(
+    messages: Iterable[UnixDateMessageType],
+) -> Iterator[PromptCompletionPair]:
+    """Turns the messages of one conversation, in chronological order, into prompt / completion
+    pairs, yielding each pair as soon as it's complete. Only the turn being built is held."""
+    # Ok so I thought a bit about the right way to do this.
+    #
+    # I think that it's going to be easier to have more accurate grouping logic in Python
+    # as opposed to performing a more advanced SQL query.
+    #
+    # So for aggregating messages, we really just want to aggregate if it's within the
+    # same half hour and if it's from the same user. A pair is complete once the reply
+    # (completion) turn is over, i.e. when the next turn starts.
+    prompt_parts: List[str] = []
+    completion_parts: List[str] = []
+    last_message: Optional[UnixDateMessageType] = None
+    for message in messages:
+        message_text = cleanse_message(message.message_text, cleanse_emojis=True)
+        if not message_text:
+            # Attachments, reactions, ...
+            continue
+
+        is_new_turn = last_message is None or not _should_aggregate_two_messages(
+            last_message, message
+        )
+        last_message = message
+        if is_new_turn and completion_parts:
+            yield PromptCompletionPair(
+                TURN_SEPARATOR.join(prompt_parts), TURN_SEPARATOR.join(completion_parts)
+            )
+            prompt_parts, completion_parts = [], []
+
+        if message.is_from_me:
+            if is_new_turn:
+                # A new turn of ours that nobody replied to replaces the previous one
+                prompt_parts = []
+            prompt_parts.append(message_text)
+        elif prompt_parts:
+            completion_parts.append(message_text)
+
+    if prompt_parts and completion_parts:
+        yield PromptCompletionPair(
+            TURN_SEPARATOR.join(prompt_parts), TURN_SEPARATOR.join(completion_parts)
+        )
 
 
-def minutes_between(date1: datetime, date2: datetime) -> int:
-    seconds_in_day = 24 * 60 * 60
-    difference = date2 - date1
-    diff_min = divmod(
-        abs(difference.days) * seconds_in_day + abs(difference.seconds), 60
-    )[0]
-    return diff_min
+def write_prompt_completions(
+    prompt_completions: Iterable[PromptCompletionPair], filename: str
+) -> int:
+    """Writes each pair to filename as a JSON line as it comes in. Returns the number of pairs."""
+    num_pairs = 0
+    with open(filename, "w", encoding="utf-8") as f:
+        for prompt in prompt_completions:
+            f.write(str(prompt))
+            f.write("\n")
+            num_pairs += 1
+    return num_pairs
 
 
 class ModelGenerator:
     def __init__(self, client: Optional[MessagesDbClient] = None) -> None:
         self.client = client if client is not None else MessagesDbClient()
 
-    def _should_aggregate_two_messages(
-        self, previous_message: GetAllMessageType, next_message: GetAllMessageType
-    ) -> bool:
-        # if the next message is outside of the time window, and still from sender, we'll break
-        breaking_time_window = 30  # min
-        previous_msg_date = datetime.strptime(
-            previous_message.message_date, "%Y-%m-%d %H:%M:%S"
-        )
-        next_msg_date = datetime.strptime(
-            previous_message.message_date, "%Y-%m-%d %H:%M:%S"
-        )
-
-        is_change_of_sender = previous_message.is_from_me != next_message.is_from_me
-        if is_change_of_sender:
-            return False
-
-        if minutes_between(previous_msg_date, next_msg_date) >= breaking_time_window:
-            return False
-
-        return True
-
     def generate_and_build_model(self) -> None:
         """
         1. Prepare the training dataset
@@ -63,86 +113,108 @@ class ModelGenerator:
         self,
         search_number: Optional[str] = None,
         search_name: Optional[str] = None,
-    ) -> List[PromptCompletionPair]:
-        """Generates a list of {prompt: <txt>, completion: <txt>}.
-        The prompts will all be messages that the user has sent. The completion will be what the model / number getting queried should respond with."""
-        # Ok so I thought a bit about the right way to do this.
-        #
-        # I think that it's going to be easier to have more accurate grouping logic in Python
-        # as opposed to performing a more advanced SQL query.
-        messages = [
-            GetAllMessageType(*x)
-            for x in self.client.get_messages(
-                search_number,
-                search_name,
+        limit_number: Optional[int] = None,
+    ) -> Iterator[PromptCompletionPair]:
+        """Generates {prompt: <txt>, completion: <txt>} pairs, each one as soon as it's complete.
+        The prompts will all be messages that the user has sent. The completion will be what the model / number getting queried should respond with.
+
+        Messages are read from the cursor one at a time, only the turn being built is held."""
+        return build_prompt_completions(
+            UnixDateMessageType(*x)
+            for x in self.client.messages_for_generation(
+                search_number, search_name, limit_number
             )
-        ]
+        )
 
-        # So for aggregating messages, we really just want to aggregate if it's within the
-        # same hour and if it's from the same user.
+    def generate_for_top_chats(
+        self,
+        top_chats: Optional[int] = None,
+        output_dir: str = ".",
+        workers: int = 1,
+    ) -> Iterator[str]:
+        """Writes one JSONL file per chat for the top_chats chats with the most messages (every
+        chat if None), yielding each filename as soon as that chat is done.
+
+        Messages are read in a single scan ordered by chat, so each chat is a contiguous run of
+        rows. In process, each run is written out as it's read, so not even one chat is held in
+        memory. With workers > 1 runs are read into lists and handed to a process pool, only a
+        few per worker are held at a time."""
+        now_str = _now_str()
+        partitions = groupby(
+            self.client.messages_for_generation_by_chat(top_chats),
+            key=itemgetter(CHAT_IDENTIFIER_INDEX),
+        )
+        if workers <= 1:
+            for chat_identifier, rows in partitions:
+                yield _echo_generated(
+                    *_generate_for_chat(chat_identifier, rows, output_dir, now_str)
+                )
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: Set["Future[Tuple[str, int]]"] = set()
+            max_in_flight = workers * PARTITIONS_IN_FLIGHT_PER_WORKER
+            for chat_identifier, rows in partitions:
+                pending.add(
+                    executor.submit(
+                        _generate_for_chat, chat_identifier, list(rows), output_dir, now_str
+                    )
+                )
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield _echo_generated(*future.result())
+            for future in as_completed(pending):
+                yield _echo_generated(*future.result())
 
-        # We're going to build up a list of tuples with each thing roughly looking like:
-        # {"prompt": "<prompt text>", "completion": "<ideal generated text>"}
+    def save_results_to_file(
+        self,
+        prompt_completions: Iterable[PromptCompletionPair],
+        model_identifier: str = "model_identifier",
+        output_dir: str = ".",
+    ) -> str:
+        """Writes each pair to a new JSONL file in output_dir as it comes in. Returns the filename."""
+        filename = os.path.join(output_dir, f"{model_identifier}.{_now_str()}.jsonl")
+        return _echo_generated(filename, write_prompt_completions(prompt_completions, filename))
 
-        finalized_results_to_save: List[PromptCompletionPair] = []
-        running_completion_pair = PromptCompletionPair()
-        last_message: Optional[GetAllMessageType] = None
-        for message in messages:
-            is_sender = message.is_from_me
-            should_we_aggregate = False
-            message_text = cleanse_message(message.message_text, cleanse_emojis=True)
 
-            if last_message is not None:
-                should_we_aggregate = self._should_aggregate_two_messages(
-                    last_message, message
-                )
+### Private Methods ###
+def _should_aggregate_two_messages(
+    previous_message: UnixDateMessageType, next_message: UnixDateMessageType
+) -> bool:
+    is_change_of_sender = previous_message.is_from_me != next_message.is_from_me
+    if is_change_of_sender:
+        return False
 
-            if should_we_aggregate:
-                if is_sender:
-                    print(
-                        f"Aggregating for sender with prompt: {running_completion_pair.prompt}and adding text: {message_text}"
-                    )
-                    running_completion_pair.prompt += f"{message_text}. "
-                else:
-                    print(
-                        f"Aggregating for receiver with prompt: {running_completion_pair.completion} and adding text: {message_text}"
-                    )
-                    running_completion_pair.completion += f"{message_text}. "
-            else:
-                # If we shouldn't aggregate, we can just normally set the fields
-                if is_sender:
-                    running_completion_pair.prompt = message_text
-                else:
-                    running_completion_pair.completion = message_text
+    seconds_between = next_message.message_date - previous_message.message_date
+    if seconds_between >= BREAKING_TIME_WINDOW_SECONDS:
+        return False
 
-                if (
-                    running_completion_pair.prompt != ""
-                    and running_completion_pair.completion != ""
-                ):
-                    finalized_results_to_save.append(running_completion_pair)
-                    running_completion_pair = PromptCompletionPair()
+    return True
 
-            last_message = message
 
-        return finalized_results_to_save
+def _now_str() -> str:
+    return datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
+
+
+def _generate_for_chat(
+    chat_identifier: str, rows: Iterable[Any], output_dir: str, now_str: str
+) -> Tuple[str, int]:
+    """Writes the pairs for one chat's rows as they're read, in process or in the workers."""
+    # Chat identifiers are numbers, emails or chat<id>s, but never trust them as a path
+    model_identifier = chat_identifier.replace(os.sep, "_")
+    filename = os.path.join(output_dir, f"{model_identifier}.{now_str}.jsonl")
+    messages = (UnixDateMessageType(*x) for x in rows)
+    return filename, write_prompt_completions(build_prompt_completions(messages), filename)
 
-    def save_results_to_file(
-        self,
-        prompt_completions: List[PromptCompletionPair],
-        model_identifier: str = "model_identifier",
-    ) -> None:
-        file_base = f"{model_identifier}"
-        now = datetime.now()
-        now_str = now.strftime("%m_%d_%Y_%H_%M_%S")
-        filename = f"{file_base}.{now_str}.jsonl"
-        with open(filename, "w") as f:
-            for prompt in prompt_completions:
-                f.write(str(prompt))
-                f.write("\n")
 
-        click.echo(f"Generated jsonl prompt-completion for model at: {filename}")
+def _echo_generated(filename: str, num_pairs: int) -> str:
+    click.echo(
+        f"Generated jsonl prompt-completion for model at: {filename} ({num_pairs:,} pairs)"
+    )
+    return filename
 
 
 if __name__ == "__main__":
-    x = PromptCompletionPair("test_prompt", "test_completion")
+    x = PromptCompletionPair('test "prompt"', "test_completion\n")
     print(x)
@@ -1,45 +1,107 @@
 """Handles printing to stdout. This should be deprecated for some better tool at some point."""
 
+from contextlib import contextmanager
+import io
 from typing import (
     Any,
+    Dict,
+    Iterable,
+    Iterator,
     List,
+    Optional,
     Union,
 )
 
 import os
+import subprocess
+import sys
 import click
+from messages.profiler import PROFILER
 from messages.query_types import (
+    ActivityStatsType,
     AggregateSentimentStats,
     AllContactType,
     GetAllMessageWithSentimentType,
     SearchWithSentimentType,
+    SentimentSeriesType,
     TotalCountType,
 )
 from messages.utils import cleanse_message, maybe_mask_name, maybe_mask_phone_number, maybe_scramble_string
 
 MASK_PII_DATA = bool(os.getenv("MASK_PII_DATA", None))
 MASK_MESSAGE_TEXT = bool(os.getenv("MASK_MESSAGE_TEXT", None))
+# Heatmap cells from no messages to the busiest hour
+HEATMAP_SHADES = " .:-=+*#%@"
+# Bytes buffered before anything is written to the pipe / pager
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+
+@contextmanager
+def buffered_output(use_pager: bool = True) -> Iterator[None]:
+    """Routes stdout through a large buffer for the duration of the block, and into $PAGER if
+    one is set and stdout is a terminal. The pager is fed as rows are printed, so it shows the
+    first screen right away and the full output is never held in memory.
+
+    Printer writes to sys.stdout directly, click.echo flushes on every call."""
+    pager = os.getenv("PAGER") if use_pager and sys.stdout.isatty() else None
+    if not pager and (sys.stdout.isatty() or not _has_fileno(sys.stdout)):
+        # Nothing to gain, a terminal is line buffered either way and streams that aren't backed
+        # by a file (e.g. a `messages serve` response) do their own buffering
+        yield
+        return
+
+    original_stdout = sys.stdout
+    original_stdout.flush()
+    pager_process: Optional["subprocess.Popen[bytes]"] = None
+    if pager:
+        # Through the shell so $PAGER can carry arguments, e.g. "less -S"
+        pager_process = subprocess.Popen(  # pylint: disable=consider-using-with
+            pager, shell=True, stdin=subprocess.PIPE, bufsize=OUTPUT_BUFFER_SIZE
+        )
+        assert pager_process.stdin is not None
+        raw_output: Any = pager_process.stdin
+    else:
+        raw_output = open(  # pylint: disable=consider-using-with
+            original_stdout.fileno(), "wb", buffering=OUTPUT_BUFFER_SIZE, closefd=False
+        )
+    sys.stdout = io.TextIOWrapper(
+        raw_output, encoding=original_stdout.encoding, errors="replace"
+    )
+    try:
+        yield
+    except BrokenPipeError:
+        # The pager was quit (or `| head` had enough) before everything was written
+        pass
+    finally:
+        try:
+            sys.stdout.close()
+        except BrokenPipeError:
+            pass
+        sys.stdout = original_stdout
+        if pager_process is not None:
+            pager_process.wait()
+
+
+def _has_fileno(stream: Any) -> bool:
+    try:
+        stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
 
 class Printer:
     """Handles printing returned data results from sqlite."""
 
     @staticmethod
     def split_text_shorter(text: str, column_start_pos: int, column_length: int) -> str:
-        """We want to pad every line with the column start and then have new lines when we've hit the right length"""
-        # How many lines will we need?
-        num_lines = len(text) // column_length
-        line_builder = ""
-        for idx in range(num_lines + 1):
-            init_padding = " " * column_start_pos if idx != 0 else ""
-            offset = column_length
-            line_content = text[idx * offset : (idx + 1) * offset]
-            rest_of_line_padding = " " * (column_length - len(line_content))
-            line_builder += init_padding + line_content + rest_of_line_padding + "|\n"
-
-        line_builder = line_builder[
-            :-2
-        ]  # take off last two things these will get put on later
-        return line_builder
+        """We want to pad every line with the column start and then have new lines when we've hit the right length.
+        The trailing "|" of the last line is left off, it gets put on with the rest of the row."""
+        lines = [
+            text[idx : idx + column_length].ljust(column_length)
+            for idx in range(0, max(len(text), 1), column_length)
+        ]
+        return ("|\n" + " " * column_start_pos).join(lines)
 
     @staticmethod
     def show_title(*kwargs: Any) -> None:
@@ -55,38 +117,44 @@ class Printer:
 
         # Get rid of final |
         title = title[:-2]
-        click.echo(title)
-        click.echo("-" * len(title))
+        sys.stdout.write(f"{title}\n{'-' * len(title)}\n")
 
     @staticmethod
-    def print_total_messages_data(results: List[TotalCountType]) -> None:
+    @PROFILER.profiled("print")
+    def print_total_messages_data(results: Iterable[TotalCountType]) -> None:
         """Prints message data. (Rank, Name/Number, Message Count)"""
         column1 = "Rank"
         column2 = "Name / Number"
         column2_spacing = 50
         column3 = "Message Count"
         Printer.show_title(column1, (column2, column2_spacing), column3)
+        write = sys.stdout.write
         for idx, result in enumerate(results):
             contact_number = maybe_mask_phone_number(result.message_number, MASK_PII_DATA)
             contact_msg_count = result.message_count
             contact_name = result.full_name if result.full_name is not None else ""
             contact_name = maybe_mask_name(contact_name, MASK_PII_DATA)
             if result.full_name:
-                click.echo(
-                    f"{idx+1:^5}| {contact_name + ' (' + contact_number + ')':^{column2_spacing}}| {contact_msg_count:^{len(column3)},}"
+                write(
+                    f"{idx+1:^5}| {contact_name + ' (' + contact_number + ')':^{column2_spacing}}| {contact_msg_count:^{len(column3)},}\n"
                 )
             else:
-                click.echo(
-                    f"{idx+1:<5}. {contact_number:^{column2_spacing}}|{contact_msg_count:^{len(column3)},}"
+                write(
+                    f"{idx+1:<5}. {contact_number:^{column2_spacing}}|{contact_msg_count:^{len(column3)},}\n"
                 )
+        sys.stdout.flush()
 
     @staticmethod
+    @PROFILER.profiled("print")
     def print_generic_message_data(
         results: Union[
-            List[SearchWithSentimentType], List[GetAllMessageWithSentimentType]
+            Iterable[SearchWithSentimentType], Iterable[GetAllMessageWithSentimentType]
         ]
     ) -> None:
-        """Prints search data. (Idx, Date, Name/Number, Message, Sent/Received)"""
+        """Prints search data. (Idx, Date, Name/Number, Message, Sent/Received)
+
+        Rows are printed as they come in, so results can be streamed straight from the manager.
+        Search results with context are printed window by window, matches marked with a *."""
         # pylint: disable=too-many-locals
         column1 = "Idx"
         column1_spacing = 5
@@ -108,50 +176,65 @@ class Printer:
             (column5, column5_spacing),
             (column6, column6_spacing),
         )
+        # Everything that doesn't depend on the row is worked out once up front
+        row_format = (
+            f"{{:^{column1_spacing}}}| {{:^{column2_spacing}}}| {{:^{column3_spacing}}}| "
+            f"{{:<{column4_spacing}}}| {{:^{column5_spacing}}}| {{:^{column6_spacing}}}\n"
+        ).format
+        # Wrapped lines of a long message start under its column
+        wrap_start_pos = column1_spacing + column2_spacing + column3_spacing + 6
+        group_separator = "-" * 60 + "\n"
+        write = sys.stdout.write
+
+        context_group: Optional[int] = None
         for idx, result in enumerate(results):
-            message_date = result.message_date
-            message_text: str = (
-                result.message_text if result.message_text is not None else ""
-            )
-            sent_by = result.is_from_me
-            number = maybe_mask_phone_number(result.message_number, MASK_PII_DATA)
-            sentiment = result.sentiment
+            if result.context_group is not None:
+                if context_group is not None and result.context_group != context_group:
+                    write(group_separator)
+                context_group = result.context_group
+            row_label = f"{idx+1}*" if result.is_match and context_group is not None else f"{idx+1}"
+
+            number = result.message_number
             name = result.full_name if result.full_name is not None else ""
-            name = maybe_mask_name(name, MASK_PII_DATA)
+            if MASK_PII_DATA:
+                number = maybe_mask_phone_number(number, MASK_PII_DATA)
+                name = maybe_mask_name(name, MASK_PII_DATA)
 
             # Clean message_text or \n or \r\n
-            message_text = cleanse_message(message_text)
-            message_text = maybe_scramble_string(message_text, MASK_MESSAGE_TEXT)
-
+            message_text = cleanse_message(result.message_text)
+            if MASK_MESSAGE_TEXT:
+                message_text = maybe_scramble_string(message_text, MASK_MESSAGE_TEXT)
             if len(message_text) > column4_spacing:
                 # Try to fit everything on screen
-                all_col_spacing = column1_spacing + column2_spacing + column3_spacing
-                all_col_spacing += 6
                 message_text = Printer.split_text_shorter(
-                    message_text, all_col_spacing, column4_spacing
+                    message_text, wrap_start_pos, column4_spacing
                 )
 
-            click.echo(
-                f"{idx+1:^{column1_spacing}}| "
-                + f"{message_date:^{column2_spacing}}| "
-                + f"{name + ' (' + number + ')':^{column3_spacing}}| "
-                + f"{message_text:<{column4_spacing}}| "
-                + f"{sentiment:^{column5_spacing}}| "
-                + f"{sent_by:^{column6_spacing}}"
+            write(
+                row_format(
+                    row_label,
+                    result.message_date,
+                    f"{name} ({number})",
+                    message_text,
+                    result.sentiment,
+                    result.is_from_me,
+                )
             )
+        sys.stdout.flush()
 
     @staticmethod
-    def print_search_data(results: List[SearchWithSentimentType]) -> None:
+    def print_search_data(results: Iterable[SearchWithSentimentType]) -> None:
         """Print search data"""
         Printer.print_generic_message_data(results)
 
     @staticmethod
-    def print_get_data(results: List[GetAllMessageWithSentimentType]) -> None:
+    def print_get_data(results: Iterable[GetAllMessageWithSentimentType]) -> None:
         """Print get data"""
         Printer.print_generic_message_data(results)
 
     @staticmethod
-    def print_all_contacts(results: List[AllContactType]) -> None:
+    @PROFILER.profiled("print")
+    def print_all_contacts(results: Iterable[AllContactType]) -> None:
         """Print all contact info"""
         column1 = "Idx"
         column1_spacing = 5
@@ -164,23 +247,165 @@ class Printer:
             (column2, column2_spacing),
             (column3, column3_spacing),
         )
+        write = sys.stdout.write
         for idx, result in enumerate(results):
-            click.echo(
+            write(
                 f"{idx+1:^{column1_spacing}}| "
                 + f"{result.contact_number:^{column2_spacing}}"
-                + f"{result.contact_name:^{column3_spacing}}"
+                + f"{result.contact_name:^{column3_spacing}}\n"
+            )
+        sys.stdout.flush()
+
+    @staticmethod
+    @PROFILER.profiled("print")
+    def print_sentiment_series(results: Iterable[SentimentSeriesType]) -> None:
+        """Print a sentiment time series, one row per period with a bar for its compound score"""
+        column1 = "Period"
+        column1_spacing = 12
+        column2 = "Messages"
+        column2_spacing = 10
+        column3 = "Compound"
+        column3_spacing = 10
+        column4 = "Sentiment"
+        column4_spacing = 10
+        # Characters for a compound score of 1.0 (or -1.0)
+        bar_length = 20
+        Printer.show_title(
+            (column1, column1_spacing),
+            (column2, column2_spacing),
+            (column3, column3_spacing),
+            (column4, column4_spacing),
+            "-1 ... +1",
+        )
+        write = sys.stdout.write
+        for result in results:
+            bar_size = round(abs(result.compound) * bar_length)
+            if result.compound < 0:
+                bar = f"{'-' * bar_size:>{bar_length}}|"
+            else:
+                bar = f"{'':>{bar_length}}|{'+' * bar_size}"
+            write(
+                f"{result.period_start:^{column1_spacing}}| "
+                + f"{result.message_count:^{column2_spacing},}| "
+                + f"{result.compound:^{column3_spacing}.3f}| "
+                + f"{result.sentiment:^{column4_spacing}}| "
+                + f"{bar}\n"
             )
+        sys.stdout.flush()
+
+    @staticmethod
+    @PROFILER.profiled("print")
+    def print_activity_stats(results: Iterable[ActivityStatsType]) -> None:
+        """Print message volume: sent vs received, an hour of the week heatmap and a per month table"""
+        by_view: Dict[str, List[ActivityStatsType]] = {}
+        for result in results:
+            by_view.setdefault(result.view, []).append(result)
+        write = sys.stdout.write
+
+        for total in by_view.get("total", []):
+            sent_share = total.sent_count / total.message_count if total.message_count else 0.0
+            write(
+                f"Messages: {total.message_count:,} (sent {total.sent_count:,} / "
+                f"received {total.received_count:,}, {sent_share:.1%} sent)\n\n"
+            )
+
+        hours = by_view.get("hour_of_week", [])
+        if hours:
+            busiest = max(hours, key=lambda x: x.message_count)
+            write(f"Messages by hour of the week (busiest: {busiest.bucket}, {busiest.message_count:,})\n")
+            write("    " + "".join(f"{hour:<3}" for hour in range(0, 24)) + "\n")
+            max_shade = len(HEATMAP_SHADES) - 1
+            for day_start in range(0, len(hours), 24):
+                cells = [
+                    HEATMAP_SHADES[
+                        -(-x.message_count * max_shade // busiest.message_count)
+                        if busiest.message_count
+                        else 0
+                    ]
+                    for x in hours[day_start : day_start + 24]
+                ]
+                write(f"{hours[day_start].bucket[:3]} " + "".join(f"{x * 2} " for x in cells) + "\n")
+            write("\n")
+
+        months = by_view.get("month", [])
+        if months:
+            column1 = "Month"
+            column1_spacing = 9
+            column2 = "Messages"
+            column2_spacing = 10
+            column3 = "Sent"
+            column3_spacing = 10
+            column4 = "Received"
+            column4_spacing = 10
+            bar_length = 30
+            Printer.show_title(
+                (column1, column1_spacing),
+                (column2, column2_spacing),
+                (column3, column3_spacing),
+                (column4, column4_spacing),
+                "Volume",
+            )
+            most_messages = max(x.message_count for x in months) or 1
+            for month in months:
+                bar = "#" * round(month.message_count * bar_length / most_messages)
+                write(
+                    f"{month.bucket:^{column1_spacing}}| "
+                    + f"{month.message_count:^{column2_spacing},}| "
+                    + f"{month.sent_count:^{column3_spacing},}| "
+                    + f"{month.received_count:^{column4_spacing},}| "
+                    + f"{bar}\n"
+                )
+        sys.stdout.flush()
 
     @staticmethod
     def print_aggregate_sentiment(aggregated: AggregateSentimentStats) -> None:
         """Print aggregate sentiment"""
-        divider = "="
-        divider_length = 50
-        click.echo(divider * divider_length)
+        divider = "=" * 50
+        sys.stdout.write(
+            f"{divider}\nOverall sentiment: {aggregated.sentiment} with a compound VADER score of {aggregated.compound}\n{divider}\n"
+        )
+        sys.stdout.flush()
+
+    @staticmethod
+    def print_profile(report: Dict[str, Any]) -> None:
+        """Prints a `--profile` report to stderr, so it never mixes with the command's output."""
+        total_seconds = report["total_seconds"]
+        click.echo("", err=True)
         click.echo(
-            f"Overall sentiment: {aggregated.sentiment} with a compound VADER score of {aggregated.compound}"
+            f"{'Stage':<20}| {'Calls':^8}| {'Rows':^10}| {'Seconds':^10}| {'%':^6}", err=True
         )
-        click.echo(divider * divider_length)
+        click.echo("-" * 60, err=True)
+        for stage in report["stages"] + [
+            {"name": "(other)", "calls": "", "rows": "", "seconds": report["unaccounted_seconds"]}
+        ]:
+            share = stage["seconds"] / total_seconds if total_seconds else 0.0
+            click.echo(
+                f"{stage['name']:<20}| {stage['calls']:^8}| {stage['rows']:^10}"
+                f"| {stage['seconds']:^10.4f}| {share:^6.1%}",
+                err=True,
+            )
+        click.echo(f"Total: {total_seconds:.4f}s", err=True)
+
+        counters: Dict[str, int] = report["counters"]
+        if counters:
+            click.echo("", err=True)
+        for name, count in counters.items():
+            line = f"{name:<30}| {count:>10,}"
+            # name.hits next to name.misses also gets the hit rate
+            if name.endswith(".hits"):
+                misses = counters.get(name[: -len("hits")] + "misses", 0)
+                if count + misses:
+                    line += f" ({count / (count + misses):.1%} hit rate)"
+            click.echo(line, err=True)
+
+        for idx, query in enumerate(report["queries"]):
+            click.echo("", err=True)
+            click.echo(
+                f"Query {idx + 1} ({query['execute_seconds']:.4f}s to first row): {query['sql']}",
+                err=True,
+            )
+            for step in query["plan"]:
+                click.echo(f"    {step}", err=True)
 
 
 if __name__ == "__main__":
@@ -188,3 +413,4 @@ if __name__ == "__main__":
     Printer.show_title("test1", ("test2", 50), "test3", "test4")
     Printer.show_title("test1", "test2", ("test3", 50), "test4")
     Printer.print_search_data([])
+    print(Printer.split_text_shorter("x" * 160, 10, 75))
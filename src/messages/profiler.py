@@ -0,0 +1,213 @@
+"""Per-stage profiling behind `messages --profile`.
+
+Stages nest: time spent in an inner stage (e.g. sqlite fetching the next batch while the printer
+pulls its next row) only counts towards the inner one, so the self times of all stages add up to
+the time spent in the command. Everything is a no-op until profiling is enabled or a hook subscribes.
+"""
+
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class StageStats:
+    """Accumulated self time and row count for a stage."""
+
+    calls: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class QueryProfile:
+    """A SQL statement the client ran and how sqlite planned it.
+    execute_seconds is the time to the first row, fetching the rest is in the sql.fetch stage."""
+
+    sql: str
+    plan: List[str]
+    execute_seconds: float
+
+
+@dataclass
+class ProfileEvent:
+    """What hooks get called with, once per finished stage or query."""
+
+    kind: str  # "stage" or "query"
+    name: str
+    seconds: float
+    rows: int = 0
+    plan: List[str] = field(default_factory=list)
+
+
+ProfileHook = Callable[[ProfileEvent], None]
+
+
+class Profiler:
+    """Collects stage timings and query plans for the current process."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stages: Dict[str, StageStats] = {}
+        self.queries: List[QueryProfile] = []
+        # Plain event counts that aren't tied to a stage, e.g. memo hits
+        self.counters: Dict[str, int] = {}
+        self._hooks: List[ProfileHook] = []
+        # Time spent in nested stages, one entry per currently open stage
+        self._child_seconds: List[float] = []
+        self._started_at = time.perf_counter()
+
+    @property
+    def active(self) -> bool:
+        """Whether anything is listening, callers skip the extra work (e.g. EXPLAIN) if not."""
+        return self.enabled or bool(self._hooks)
+
+    def enable(self) -> None:
+        """Starts collecting, from a clean slate."""
+        self.enabled = True
+        self.reset()
+
+    def disable(self) -> None:
+        """Stops collecting, what was collected so far is kept."""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Drops everything collected so far."""
+        self.stages = {}
+        self.queries = []
+        self.counters = {}
+        self._started_at = time.perf_counter()
+
+    def subscribe(self, hook: ProfileHook) -> Callable[[], None]:
+        """Calls hook with every ProfileEvent from now on. Returns a function that unsubscribes."""
+        self._hooks.append(hook)
+        return lambda: self._hooks.remove(hook)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0) -> Iterator[None]:
+        """Times the block as one call of stage name."""
+        if not self.active:
+            yield
+            return
+        start = self._push()
+        try:
+            yield
+        finally:
+            self._record(name, self._pop(start), rows)
+
+    def profiled(self, name: str) -> Callable[[F], F]:
+        """Decorator version of stage()."""
+
+        def decorator(func: F) -> F:
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.stage(name):
+                    return func(*args, **kwargs)
+
+            return wrapper  # type: ignore
+
+        return decorator
+
+    def iter_stage(self, name: str, items: Iterable[T], count_rows: bool = True) -> Iterator[T]:
+        """Wraps a (lazy) iterable so the time spent producing each item counts towards stage
+        name. Recorded as a single call once the iterator is exhausted or closed."""
+        if not self.active:
+            return iter(items)
+        return self._iter_stage(name, iter(items), count_rows)
+
+    def add_rows(self, name: str, rows: int) -> None:
+        """Counts rows towards stage name without timing anything."""
+        if self.active:
+            self.stages.setdefault(name, StageStats()).rows += rows
+
+    def count(self, name: str, num: int = 1) -> None:
+        """Adds num to counter name, e.g. memo hits."""
+        if self.active:
+            self.counters[name] = self.counters.get(name, 0) + num
+
+    def record_query(self, sql: str, plan: List[str], execute_seconds: float) -> None:
+        """Records a query's plan and how long executing it took."""
+        sql = " ".join(sql.split())
+        self.queries.append(QueryProfile(sql, plan, execute_seconds))
+        self._emit(ProfileEvent("query", sql, execute_seconds, plan=plan))
+
+    def report(self) -> Dict[str, Any]:
+        """Everything collected so far, JSON serializable. Stages are sorted slowest first."""
+        total_seconds = time.perf_counter() - self._started_at
+        stages = sorted(self.stages.items(), key=lambda item: -item[1].seconds)
+        return {
+            "total_seconds": total_seconds,
+            "unaccounted_seconds": total_seconds - sum(x.seconds for _, x in stages),
+            "stages": [{"name": name, **asdict(stats)} for name, stats in stages],
+            "queries": [asdict(x) for x in self.queries],
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    ### Private Methods ###
+    def _push(self) -> float:
+        self._child_seconds.append(0.0)
+        return time.perf_counter()
+
+    def _pop(self, start: float) -> float:
+        """Closes the innermost stage, returns its self time."""
+        elapsed = time.perf_counter() - start
+        child_seconds = self._child_seconds.pop()
+        if self._child_seconds:
+            self._child_seconds[-1] += elapsed
+        return elapsed - child_seconds
+
+    def _iter_stage(self, name: str, iterator: Iterator[T], count_rows: bool) -> Iterator[T]:
+        seconds = 0.0
+        rows = 0
+        try:
+            while True:
+                # Only time next(), whatever the consumer does between items isn't ours
+                start = self._push()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += self._pop(start)
+                rows += 1
+                yield item
+        finally:
+            self._record(name, seconds, rows if count_rows else 0)
+
+    def _record(self, name: str, seconds: float, rows: int) -> None:
+        stats = self.stages.setdefault(name, StageStats())
+        stats.calls += 1
+        stats.rows += rows
+        stats.seconds += seconds
+        self._emit(ProfileEvent("stage", name, seconds, rows))
+
+    def _emit(self, event: ProfileEvent) -> None:
+        for hook in list(self._hooks):
+            hook(event)
+
+
+# Process wide profiler, enabled by `messages --profile`
+PROFILER = Profiler()
+
+
+if __name__ == "__main__":
+
+    def slow_range(num: int) -> Iterator[int]:
+        """Yields num items, slowly."""
+        for idx in range(num):
+            time.sleep(0.01)
+            yield idx
+
+    events: List[ProfileEvent] = []
+    unsubscribe = PROFILER.subscribe(events.append)
+    with PROFILER.stage("outer"):
+        for _ in PROFILER.iter_stage("inner", slow_range(3)):
+            time.sleep(0.01)
+    unsubscribe()
+    print(PROFILER.report())
+    print(events)
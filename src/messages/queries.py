@@ -1,4 +1,10 @@
-"""Houses all the queries for the sqlite database."""
+"""Houses all the queries for the sqlite database.
+
+User input is always bound as a parameter, never formatted into the SQL, so every statement
+text here is fixed and sqlite3's statement cache can reuse the compiled statement across calls.
+Queries that can be limited take :limit_number, where NO_LIMIT (any negative number) means no limit."""
+
+NO_LIMIT = -1
 
 TOTAL_DISTINCT_CONVO_QUERY = """
 SELECT
@@ -7,6 +13,54 @@ FROM
     chat;
 """
 
+### Contact index
+# The AddressBook stores numbers however the user typed them, e.g. "+1 (513) 490-1945",
+# while chat.db uses the normalized handle, e.g. "+15134901945". Rather than matching those
+# with a LIKE per (chat, phone number) pair, we resolve every chat handle once per session
+# and keep the result in an indexed TEMP table that the queries below can join on equality.
+CREATE_HANDLE_CONTACT_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS handle_contact (
+    chat_identifier TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+INSERT_HANDLE_CONTACT = """
+INSERT OR IGNORE INTO handle_contact (chat_identifier, full_name) VALUES (?, ?);
+"""
+
+# Run against each AddressBook database on its own connection, see contact_index.py
+ADDRESS_BOOK_PHONE_NUMBERS = """
+SELECT
+    adb_phone.ZFULLNUMBER,
+    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+FROM
+    ZABCDPHONENUMBER adb_phone
+JOIN ZABCDRECORD adb_record
+    ON adb_phone.ZOWNER = adb_record.Z_PK
+ORDER BY
+    adb_phone.Z_PK ASC;
+"""
+
+ADDRESS_BOOK_EMAIL_ADDRESSES = """
+SELECT
+    adb_email.ZADDRESS,
+    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+FROM
+    ZABCDEMAILADDRESS adb_email
+JOIN ZABCDRECORD adb_record
+    ON adb_email.ZOWNER = adb_record.Z_PK
+ORDER BY
+    adb_email.Z_PK ASC;
+"""
+
+DISTINCT_CHAT_IDENTIFIERS = """
+SELECT DISTINCT
+    chat.chat_identifier
+FROM
+    chat;
+"""
+
 ### Total count grouped
 TOTAL_COUNT_WITHOUT_CONTACT_QUERY = """
 SELECT
@@ -21,7 +75,8 @@ JOIN message
 GROUP BY
     chat.chat_identifier
 ORDER BY
-    message_count DESC;
+    message_count DESC
+LIMIT :limit_number;
 """
 
 
@@ -29,33 +84,30 @@ TOTAL_COUNT_WITH_CONTACT_QUERY = """
 SELECT
     chat.chat_identifier,
     count(chat.chat_identifier) AS message_count,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join
     ON chat.ROWID = chat_message_join.chat_id
 JOIN message 
     ON chat_message_join.message_id = message.ROWID     
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 GROUP BY
-    chat.chat_identifier, adb_record.ZFIRSTNAME || ' ' || adb_record.ZLASTNAME
+    chat.chat_identifier, handle_contact.full_name
 ORDER BY
-    message_count DESC;
+    message_count DESC
+LIMIT :limit_number;
 """
 
 ALL_CONTACT_BY_NAME = """
 SELECT
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A') as fullname 
+    IFNULL(handle_contact.full_name, 'N/A N/A') as fullname 
 FROM
     chat
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE 1=1
 AND chat.chat_identifier not like 'chat%'
 AND LENGTH(chat.chat_identifier) != 5
@@ -69,6 +121,7 @@ ORDER BY
 ### All messages
 ALL_MESSAGES_BY_DATE = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -78,52 +131,65 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 ALL_MESSAGES_WITH_CONTACT_BY_DATE = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 ORDER BY
-    message_date ASC
+    message.date ASC
+LIMIT :limit_number;
 """
 
+# Same as above but with message_date as unix seconds, for result_set.MessageResultSet
+MESSAGE_DATE_COLUMN = 'datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date'
+MESSAGE_UNIX_DATE_COLUMN = "message.date / 1000000000 + 978307200 AS message_date"
+
+ALL_MESSAGES_BY_DATE_UNIX = ALL_MESSAGES_BY_DATE.replace(
+    MESSAGE_DATE_COLUMN, MESSAGE_UNIX_DATE_COLUMN
+)
+ALL_MESSAGES_WITH_CONTACT_BY_DATE_UNIX = ALL_MESSAGES_WITH_CONTACT_BY_DATE.replace(
+    MESSAGE_DATE_COLUMN, MESSAGE_UNIX_DATE_COLUMN
+)
+
 ### Search logic
 SEARCH_BY_TEXT_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    message.text like '%{search_text}%'
+    message.text like '%' || :search_text || '%'
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 SEARCH_BY_TEXT_WITHOUT_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -133,35 +199,37 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    message.text like '%{search_text}%'
+    message.text like '%' || :search_text || '%'
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    message.text like '%{search_text}%'
-    and chat.chat_identifier like '%{search_number}'
+    message.text like '%' || :search_text || '%'
+    and chat.chat_identifier like '%' || :search_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -171,58 +239,717 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    message.text like '%{search_text}%'
-    and chat.chat_identifier like '%{search_number}'
+    message.text like '%' || :search_text || '%'
+    and chat.chat_identifier like '%' || :search_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    message.text like '%{search_text}%'
-    and IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A') like '%{search_name}%'
+    message.text like '%' || :search_text || '%'
+    and IFNULL(handle_contact.full_name, 'N/A N/A') like '%' || :search_name || '%'
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
+"""
+
+### Full-text search logic
+# When the optional FTS5 sidecar index (see search_index.py) is attached as `fts`, the search
+# queries above swap their LIKE filter for an index lookup. Everything else stays the same.
+SEARCH_TEXT_LIKE_FILTER = "message.text like '%' || :search_text || '%'"
+SEARCH_TEXT_FTS_FILTER = "message.ROWID IN (SELECT rowid FROM fts.message_fts WHERE message_fts MATCH :fts_query)"
+
+SEARCH_BY_TEXT_WITH_CONTACT_FTS = SEARCH_BY_TEXT_WITH_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_BY_TEXT_WITHOUT_CONTACT_FTS = SEARCH_BY_TEXT_WITHOUT_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS = SEARCH_BY_TEXT_AND_NUMBER_WITH_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS = SEARCH_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT_FTS = SEARCH_BY_TEXT_AND_NAME_WITH_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+
+### Search with context logic
+# `search -b N -a M` returns every match plus up to N messages before and M after it in the
+# same chat, in a single query:
+#   matches: the (limited) matching messages, like the search queries above
+#   chat_messages: every message of the chats with a match, numbered in date order, flagged
+#     if it's a match itself and if a match is within :after_number positions before or
+#     :before_number positions after it. The latter is a sliding window over the same order,
+#     so it's one sort of each chat however many matches there are.
+#   windowed: the messages near a match. Overlapping windows are merged for free since each
+#     message is only selected once.
+#   grouped: consecutive positions form one group (gaps and islands), and groups are
+#     numbered in order of their first message so the printer can show them together.
+# {match_filter} and {chat_filter} are filled in below. The WITHOUT_CONTACT variants select
+# NULL for the name so the columns line up either way.
+SEARCH_CONTEXT_TEMPLATE = """
+WITH matches AS (
+    SELECT
+        chat_message_join.chat_id,
+        chat_message_join.message_id
+    FROM
+        chat
+    JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+    JOIN message ON chat_message_join.message_id = message. "ROWID"
+    {contact_join}
+    WHERE
+        {match_filter}
+        AND {chat_filter}
+    ORDER BY
+        message.date ASC
+    LIMIT :limit_number
+),
+chat_messages AS (
+    SELECT
+        chat_message_join.chat_id,
+        message. "ROWID" AS message_id,
+        message.date,
+        ROW_NUMBER() OVER chat_order AS position,
+        matches.message_id IS NOT NULL AS is_match,
+        MAX(matches.message_id IS NOT NULL) OVER (
+            chat_order ROWS BETWEEN :after_number PRECEDING AND :before_number FOLLOWING
+        ) AS is_near_match
+    FROM
+        chat_message_join
+    JOIN message ON chat_message_join.message_id = message. "ROWID"
+    LEFT JOIN matches
+        ON matches.chat_id = chat_message_join.chat_id
+        AND matches.message_id = chat_message_join.message_id
+    WHERE
+        chat_message_join.chat_id IN (SELECT chat_id FROM matches)
+    WINDOW chat_order AS (
+        PARTITION BY chat_message_join.chat_id
+        ORDER BY message.date ASC, message. "ROWID" ASC
+    )
+),
+windowed AS (
+    SELECT
+        chat_messages.chat_id,
+        chat_messages.message_id,
+        chat_messages.date,
+        chat_messages.position,
+        chat_messages.is_match,
+        chat_messages.position - ROW_NUMBER() OVER (
+            PARTITION BY chat_messages.chat_id ORDER BY chat_messages.position
+        ) AS island
+    FROM
+        chat_messages
+    WHERE
+        chat_messages.is_near_match
+),
+grouped AS (
+    SELECT
+        windowed.*,
+        MIN(windowed.date) OVER (PARTITION BY windowed.chat_id, windowed.island) AS group_start
+    FROM
+        windowed
+)
+SELECT
+    message.guid,
+    datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
+    message.text,
+    message.is_from_me,
+    chat.chat_identifier,
+    {full_name_column},
+    grouped.is_match,
+    DENSE_RANK() OVER (
+        ORDER BY grouped.group_start, grouped.chat_id, grouped.island
+    ) AS context_group
+FROM
+    grouped
+JOIN message ON message. "ROWID" = grouped.message_id
+JOIN chat ON chat. "ROWID" = grouped.chat_id
+{contact_join}
+ORDER BY
+    grouped.group_start ASC,
+    grouped.chat_id ASC,
+    grouped.position ASC;
+"""
+
+SEARCH_CONTEXT_CONTACT_JOIN = """LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier"""
+SEARCH_CONTEXT_NO_CHAT_FILTER = "1 = 1"
+SEARCH_CONTEXT_NUMBER_FILTER = "chat.chat_identifier like '%' || :search_number"
+SEARCH_CONTEXT_NAME_FILTER = (
+    "IFNULL(handle_contact.full_name, 'N/A N/A') like '%' || :search_name || '%'"
+)
+
+SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT = SEARCH_CONTEXT_TEMPLATE.format(
+    contact_join=SEARCH_CONTEXT_CONTACT_JOIN,
+    full_name_column="IFNULL(handle_contact.full_name, 'N/A N/A')",
+    match_filter=SEARCH_TEXT_LIKE_FILTER,
+    chat_filter=SEARCH_CONTEXT_NO_CHAT_FILTER,
+)
+SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT = SEARCH_CONTEXT_TEMPLATE.format(
+    contact_join="",
+    full_name_column="NULL",
+    match_filter=SEARCH_TEXT_LIKE_FILTER,
+    chat_filter=SEARCH_CONTEXT_NO_CHAT_FILTER,
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT = SEARCH_CONTEXT_TEMPLATE.format(
+    contact_join=SEARCH_CONTEXT_CONTACT_JOIN,
+    full_name_column="IFNULL(handle_contact.full_name, 'N/A N/A')",
+    match_filter=SEARCH_TEXT_LIKE_FILTER,
+    chat_filter=SEARCH_CONTEXT_NUMBER_FILTER,
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT = SEARCH_CONTEXT_TEMPLATE.format(
+    contact_join="",
+    full_name_column="NULL",
+    match_filter=SEARCH_TEXT_LIKE_FILTER,
+    chat_filter=SEARCH_CONTEXT_NUMBER_FILTER,
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT = SEARCH_CONTEXT_TEMPLATE.format(
+    contact_join=SEARCH_CONTEXT_CONTACT_JOIN,
+    full_name_column="IFNULL(handle_contact.full_name, 'N/A N/A')",
+    match_filter=SEARCH_TEXT_LIKE_FILTER,
+    chat_filter=SEARCH_CONTEXT_NAME_FILTER,
+)
+
+SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT_FTS = SEARCH_CONTEXT_BY_TEXT_WITH_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT_FTS = SEARCH_CONTEXT_BY_TEXT_WITHOUT_CONTACT.replace(
+    SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT_FTS = (
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITH_CONTACT.replace(
+        SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+    )
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT_FTS = (
+    SEARCH_CONTEXT_BY_TEXT_AND_NUMBER_WITHOUT_CONTACT.replace(
+        SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+    )
+)
+SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT_FTS = (
+    SEARCH_CONTEXT_BY_TEXT_AND_NAME_WITH_CONTACT.replace(
+        SEARCH_TEXT_LIKE_FILTER, SEARCH_TEXT_FTS_FILTER
+    )
+)
+
+### Search index (sidecar) logic
+CREATE_SEARCH_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    text,
+    content='',
+    prefix='2 3',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS search_index_meta (
+    key TEXT PRIMARY KEY,
+    value NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_index_sample (
+    rowid INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL
+);
+"""
+
+DROP_SEARCH_INDEX = """
+DROP TABLE IF EXISTS message_fts;
+DROP TABLE IF EXISTS search_index_meta;
+DROP TABLE IF EXISTS search_index_sample;
+"""
+
+# The only key is 'max_rowid', the highest message.ROWID indexed
+SEARCH_INDEX_META = """
+SELECT
+    value
+FROM
+    search_index_meta
+WHERE
+    key = ?;
+"""
+
+UPDATE_SEARCH_INDEX_META = """
+INSERT OR REPLACE INTO search_index_meta (key, value) VALUES (?, ?);
+"""
+
+# The latest indexed messages, (ROWID, guid) as they were in the database the index was built from
+SEARCH_INDEX_SAMPLE = """
+SELECT
+    rowid,
+    guid
+FROM
+    search_index_sample;
+"""
+
+DELETE_SEARCH_INDEX_SAMPLE = """
+DELETE FROM search_index_sample;
+"""
+
+INSERT_SEARCH_INDEX_SAMPLE = """
+INSERT INTO search_index_sample (rowid, guid) VALUES (?, ?);
+"""
+
+LATEST_MESSAGE_GUIDS_UP_TO_ROWID = """
+SELECT
+    message.ROWID,
+    message.guid
+FROM
+    message
+WHERE
+    message.ROWID <= ?
+ORDER BY
+    message.ROWID DESC
+LIMIT ?;
+"""
+
+INSERT_SEARCH_INDEX = """
+INSERT INTO message_fts (rowid, text) VALUES (?, ?);
+"""
+
+SEARCH_INDEX_COUNT = """
+SELECT
+    COUNT(*)
+FROM
+    message_fts;
+"""
+
+MESSAGE_GUID_BY_ROWID = """
+SELECT
+    message.guid
+FROM
+    message
+WHERE
+    message.ROWID = ?;
+"""
+
+MESSAGES_ABOVE_ROWID = """
+SELECT
+    message.ROWID,
+    message.text
+FROM
+    message
+WHERE
+    message.ROWID > ?
+ORDER BY
+    message.ROWID ASC;
+"""
+
+### Stats logic
+MESSAGE_MAX_ROWID = """
+SELECT
+    IFNULL(MAX(message.ROWID), 0)
+FROM
+    message;
+"""
+
+LATEST_MESSAGE = """
+SELECT
+    message.ROWID,
+    message.guid
+FROM
+    message
+ORDER BY
+    message.ROWID DESC
+LIMIT 1;
+"""
+
+# Volume per (local month, weekday, hour). Messages are first counted per quarter hour of
+# message.date, with integer division only, and only those buckets are converted to local time,
+# so sqlite runs the timezone conversion once per quarter hour that had messages instead of
+# once per message. Quarter hours line up with every UTC offset in use.
+STATS_BUCKET_NANOSECONDS = 900 * 1000000000
+STATS_TEMPLATE = """
+WITH buckets AS (
+    SELECT
+        message.date / {bucket_nanoseconds} AS bucket,
+        COUNT(*) AS message_count,
+        SUM(message.is_from_me) AS sent_count
+    FROM
+        {message_source}
+    WHERE
+        {chat_filter}
+    GROUP BY
+        bucket
+),
+local_buckets AS (
+    SELECT
+        datetime (bucket * {bucket_seconds} + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS local_date,
+        message_count,
+        sent_count
+    FROM
+        buckets
+)
+SELECT
+    substr(local_date, 1, 7) AS message_month,
+    CAST(strftime ("%w", local_date) AS INTEGER) AS weekday,
+    CAST(substr(local_date, 12, 2) AS INTEGER) AS hour,
+    SUM(message_count),
+    SUM(sent_count)
+FROM
+    local_buckets
+GROUP BY
+    message_month,
+    weekday,
+    hour
+ORDER BY
+    message_month ASC,
+    weekday ASC,
+    hour ASC;
+"""
+
+STATS_CHAT_MESSAGES = """chat
+    JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+    JOIN message ON chat_message_join.message_id = message. "ROWID"
+"""
+
+# Across everyone there's no chat to filter on, counting straight off message skips the joins
+STATS_ALL = STATS_TEMPLATE.format(
+    bucket_nanoseconds=STATS_BUCKET_NANOSECONDS,
+    bucket_seconds=STATS_BUCKET_NANOSECONDS // 1000000000,
+    message_source="message",
+    chat_filter=SEARCH_CONTEXT_NO_CHAT_FILTER,
+)
+STATS_BY_NUMBER = STATS_TEMPLATE.format(
+    bucket_nanoseconds=STATS_BUCKET_NANOSECONDS,
+    bucket_seconds=STATS_BUCKET_NANOSECONDS // 1000000000,
+    message_source=STATS_CHAT_MESSAGES,
+    chat_filter=SEARCH_CONTEXT_NUMBER_FILTER,
+)
+STATS_BY_NAME_WITH_CONTACT = STATS_TEMPLATE.format(
+    bucket_nanoseconds=STATS_BUCKET_NANOSECONDS,
+    bucket_seconds=STATS_BUCKET_NANOSECONDS // 1000000000,
+    message_source=STATS_CHAT_MESSAGES + "    " + SEARCH_CONTEXT_CONTACT_JOIN,
+    chat_filter=SEARCH_CONTEXT_NAME_FILTER,
+)
+
+# The chats STATS_BY_NAME_WITH_CONTACT counts, which change along with the contacts
+CHAT_IDENTIFIERS_BY_NAME = """
+SELECT DISTINCT
+    chat.chat_identifier
+FROM
+    chat
+{contact_join}
+WHERE
+    {chat_filter}
+ORDER BY
+    chat.chat_identifier ASC;
+""".format(
+    contact_join=SEARCH_CONTEXT_CONTACT_JOIN, chat_filter=SEARCH_CONTEXT_NAME_FILTER
+)
+
+### Contact cache logic
+# The merged contact map of every AddressBook database under a directory (the root), along with
+# the mtime and size of each database it was built from. It's only reused while those match.
+CREATE_CONTACT_CACHE = """
+CREATE TABLE IF NOT EXISTS contact_source (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS contact (
+    root TEXT NOT NULL,
+    contact_key TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    PRIMARY KEY (root, contact_key)
+) WITHOUT ROWID;
+"""
+
+CONTACT_CACHE_SOURCES = """
+SELECT
+    path,
+    mtime_ns,
+    size
+FROM
+    contact_source
+WHERE
+    root = ?
+ORDER BY
+    path ASC;
+"""
+
+CONTACT_CACHE_NAMES = """
+SELECT
+    contact_key,
+    full_name
+FROM
+    contact
+WHERE
+    root = ?;
+"""
+
+DELETE_CONTACT_CACHE_SOURCES = """
+DELETE FROM contact_source WHERE root = ?;
+"""
+
+DELETE_CONTACT_CACHE_NAMES = """
+DELETE FROM contact WHERE root = ?;
+"""
+
+INSERT_CONTACT_CACHE_SOURCE = """
+INSERT INTO contact_source (root, path, mtime_ns, size) VALUES (?, ?, ?, ?);
+"""
+
+INSERT_CONTACT_CACHE_NAME = """
+INSERT INTO contact (root, contact_key, full_name) VALUES (?, ?, ?);
+"""
+
+### Stats cache logic
+CREATE_STATS_CACHE = """
+CREATE TABLE IF NOT EXISTS stats_cache (
+    cache_key TEXT PRIMARY KEY,
+    max_rowid INTEGER NOT NULL,
+    result TEXT NOT NULL
+);
+"""
+
+STATS_CACHE_BY_KEY = """
+SELECT
+    result
+FROM
+    stats_cache
+WHERE
+    cache_key = ?
+    AND max_rowid = ?;
+"""
+
+INSERT_STATS_CACHE = """
+INSERT OR REPLACE INTO stats_cache (cache_key, max_rowid, result) VALUES (?, ?, ?);
+"""
+
+### Sentiment cache logic
+CREATE_SENTIMENT_CACHE = """
+CREATE TABLE IF NOT EXISTS sentiment_cache (
+    id INTEGER PRIMARY KEY,
+    message_guid TEXT NOT NULL UNIQUE,
+    scorer_version TEXT NOT NULL,
+    neg REAL NOT NULL,
+    neu REAL NOT NULL,
+    pos REAL NOT NULL,
+    compound REAL NOT NULL
+);
+"""
+
+# {placeholders} is filled in with one ? per guid, always the same number of them (see
+# sentiment_cache.py) so this is still a single statement
+SENTIMENT_CACHE_BY_GUIDS = """
+SELECT
+    message_guid,
+    neg,
+    neu,
+    pos,
+    compound
+FROM
+    sentiment_cache
+WHERE
+    scorer_version = ?
+    AND message_guid IN ({placeholders});
+"""
+
+INSERT_SENTIMENT_CACHE = """
+INSERT OR REPLACE INTO sentiment_cache (message_guid, scorer_version, neg, neu, pos, compound)
+VALUES (?, ?, ?, ?, ?, ?);
+"""
+
+SENTIMENT_CACHE_COUNT_BY_VERSION = """
+SELECT
+    scorer_version,
+    COUNT(*)
+FROM
+    sentiment_cache
+GROUP BY
+    scorer_version
+ORDER BY
+    scorer_version ASC;
+"""
+
+# Entries are evicted oldest first. Messages never change, so age is as good a signal as any.
+EVICT_SENTIMENT_CACHE = """
+DELETE FROM sentiment_cache
+WHERE id <= (
+    SELECT id FROM sentiment_cache ORDER BY id DESC LIMIT 1 OFFSET ?
+);
+"""
+
+DELETE_SENTIMENT_CACHE_OTHER_VERSIONS = """
+DELETE FROM sentiment_cache
+WHERE scorer_version != ?;
+"""
+
+DELETE_SENTIMENT_CACHE = """
+DELETE FROM sentiment_cache;
+"""
+
+### Mirror logic
+# The mirror keeps the subset of chat.db's schema this tool reads (same table and column names,
+# so every query above runs unchanged against it) plus the resolved contact names.
+CREATE_MIRROR = """
+CREATE TABLE IF NOT EXISTS chat (
+    ROWID INTEGER PRIMARY KEY,
+    chat_identifier TEXT
+);
+CREATE TABLE IF NOT EXISTS message (
+    ROWID INTEGER PRIMARY KEY,
+    guid TEXT,
+    text TEXT,
+    date INTEGER,
+    is_from_me INTEGER
+);
+CREATE TABLE IF NOT EXISTS chat_message_join (
+    chat_id INTEGER,
+    message_id INTEGER,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS handle_contact (
+    chat_identifier TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mirror_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_idx_chat_identifier ON chat (chat_identifier);
+CREATE INDEX IF NOT EXISTS message_idx_date ON message (date);
+CREATE INDEX IF NOT EXISTS chat_message_join_idx_message_id ON chat_message_join (message_id);
+"""
+
+MIRROR_MAX_ROWID = """
+SELECT
+    value
+FROM
+    mirror_meta
+WHERE
+    key = 'max_rowid';
+"""
+
+UPDATE_MIRROR_MAX_ROWID = """
+INSERT OR REPLACE INTO mirror_meta (key, value) VALUES ('max_rowid', ?);
+"""
+
+MIRROR_LATEST_MESSAGE_GUIDS = """
+SELECT
+    message.ROWID,
+    message.guid
+FROM
+    message
+ORDER BY
+    message.ROWID DESC
+LIMIT ?;
+"""
+
+MIRROR_SOURCE_CHATS = """
+SELECT
+    chat.ROWID,
+    chat.chat_identifier
+FROM
+    chat;
+"""
+
+INSERT_MIRROR_CHAT = """
+INSERT OR REPLACE INTO chat (ROWID, chat_identifier) VALUES (?, ?);
+"""
+
+MIRROR_SOURCE_MESSAGES = """
+SELECT
+    message.ROWID,
+    message.guid,
+    message.text,
+    message.date,
+    message.is_from_me
+FROM
+    message
+WHERE
+    message.ROWID > ?
+ORDER BY
+    message.ROWID ASC;
+"""
+
+INSERT_MIRROR_MESSAGE = """
+INSERT OR REPLACE INTO message (ROWID, guid, text, date, is_from_me) VALUES (?, ?, ?, ?, ?);
+"""
+
+MIRROR_SOURCE_CHAT_MESSAGE_JOINS = """
+SELECT
+    chat_message_join.chat_id,
+    chat_message_join.message_id
+FROM
+    chat_message_join
+WHERE
+    chat_message_join.message_id > ?;
+"""
+
+INSERT_MIRROR_CHAT_MESSAGE_JOIN = """
+INSERT OR IGNORE INTO chat_message_join (chat_id, message_id) VALUES (?, ?);
+"""
+
+ALL_HANDLE_CONTACTS = """
+SELECT
+    handle_contact.chat_identifier,
+    handle_contact.full_name
+FROM
+    handle_contact;
+"""
+
+DELETE_MIRROR_HANDLE_CONTACTS = """
+DELETE FROM handle_contact;
+"""
+
+INSERT_MIRROR_HANDLE_CONTACT = """
+INSERT OR REPLACE INTO handle_contact (chat_identifier, full_name) VALUES (?, ?);
+"""
+
+MIRROR_MESSAGE_COUNT = """
+SELECT
+    COUNT(*)
+FROM
+    message;
 """
 
 ### Get By Name Logic
+# The date filters below compare the raw message.date (nanoseconds since 2001-01-01 UTC) against
+# bounds computed in Python, so sqlite can use the index on message.date instead of formatting
+# every row's date.
 GET_BY_NUMBER_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    chat.chat_identifier like '%{get_number}'
+    chat.chat_identifier like '%' || :get_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_NUMBER_WITHOUT_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -232,59 +959,61 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    chat.chat_identifier like '%{get_number}'
+    chat.chat_identifier like '%' || :get_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_NAME_AND_DATE_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A') like '%{get_name}%'
+    IFNULL(handle_contact.full_name, 'N/A N/A') like '%' || :get_name || '%'
 AND
-    date(message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") = '{get_date}'
+    message.date BETWEEN :date_start AND :date_end
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_NUMBER_AND_DATE_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    chat.chat_identifier like '%{get_number}'
+    chat.chat_identifier like '%' || :get_number
 AND
-    date(message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") = '{get_date}'
+    message.date BETWEEN :date_start AND :date_end
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_NUMBER_AND_DATE_WITHOUT_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -294,36 +1023,38 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    chat.chat_identifier like '%{get_number}'
+    chat.chat_identifier like '%' || :get_number
 AND
-    date(message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") = '{get_date}'
+    message.date BETWEEN :date_start AND :date_end
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_DATE_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    date(message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") = '{get_date}'
+    message.date BETWEEN :date_start AND :date_end
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 GET_BY_DATE_WITHOUT_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
@@ -333,58 +1064,61 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    date(message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") = '{get_date}'
+    message.date BETWEEN :date_start AND :date_end
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 
 GET_BY_NAME_WITH_CONTACT = """
 SELECT
+    message.guid,
     datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A') like '%{get_name}%'
+    IFNULL(handle_contact.full_name, 'N/A N/A') like '%' || :get_name || '%'
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 ### Generate logic
+# ModelGenerator only compares timestamps, so message_date is unix seconds here
 AGGREGATE_MESSAGES_BY_NUMBER_WITH_CONTACT = """
 SELECT
-    datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
+    message.guid,
+    message.date / 1000000000 + 978307200 AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    chat.chat_identifier like '%{search_number}'
+    chat.chat_identifier like '%' || :search_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
 AGGREGATE_MESSAGES_BY_NUMBER_WITHOUT_CONTACT = """
 SELECT
-    datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
+    message.guid,
+    message.date / 1000000000 + 978307200 AS message_date,
     message.text,
     message.is_from_me,
     chat.chat_identifier
@@ -393,31 +1127,94 @@ FROM
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
 WHERE
-    chat.chat_identifier like '%{search_number}'
+    chat.chat_identifier like '%' || :search_number
 ORDER BY
-    message_date ASC;
+    message.date ASC
+LIMIT :limit_number;
 """
 
-
 AGGREGATE_MESSAGES_BY_NAME_WITH_CONTACT = """
 SELECT
-    datetime (message.date / 1000000000 + strftime ("%s", "2001-01-01"), "unixepoch", "localtime") AS message_date,
-    GROUP_CONCAT(message.text, ". "),
+    message.guid,
+    message.date / 1000000000 + 978307200 AS message_date,
+    message.text,
     message.is_from_me,
     chat.chat_identifier,
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A')
+    IFNULL(handle_contact.full_name, 'N/A N/A')
 FROM
     chat
 JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
 JOIN message ON chat_message_join.message_id = message. "ROWID"
-LEFT JOIN adb.ZABCDPHONENUMBER adb_phone
-    ON chat.chat_identifier like '%' || replace(replace(replace(replace(adb_phone.ZFULLNUMBER, ' ', ''), '+', ''), ')', ''), '(', '')
-LEFT JOIN adb.ZABCDRECORD adb_record
-    ON adb_phone.ZOWNER = adb_record.Z_PK
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
 WHERE
-    IFNULL(adb_record.ZFIRSTNAME, 'N/A') || ' ' || IFNULL(adb_record.ZLASTNAME, 'N/A') like '%{search_name}%'
+    IFNULL(handle_contact.full_name, 'N/A N/A') like '%' || :search_name || '%'
+ORDER BY
+    message.date ASC
+LIMIT :limit_number;
+"""
+
+# Every message of the :limit_number chats with the most messages (all of them for NO_LIMIT) in
+# one scan, grouped by chat so `generate --top / --all` can split it into one partition per chat
+AGGREGATE_MESSAGES_BY_CHAT_WITH_CONTACT = """
+WITH top_chats AS (
+    SELECT
+        chat.chat_identifier
+    FROM
+        chat
+    JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+    GROUP BY
+        chat.chat_identifier
+    ORDER BY
+        COUNT(*) DESC
+    LIMIT :limit_number
+)
+SELECT
+    message.guid,
+    message.date / 1000000000 + 978307200 AS message_date,
+    message.text,
+    message.is_from_me,
+    chat.chat_identifier,
+    IFNULL(handle_contact.full_name, 'N/A N/A')
+FROM
+    top_chats
+JOIN chat ON chat.chat_identifier = top_chats.chat_identifier
+JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+JOIN message ON chat_message_join.message_id = message. "ROWID"
+LEFT JOIN handle_contact
+    ON handle_contact.chat_identifier = chat.chat_identifier
+ORDER BY
+    chat.chat_identifier ASC,
+    message.date ASC;
+"""
+
+AGGREGATE_MESSAGES_BY_CHAT_WITHOUT_CONTACT = """
+WITH top_chats AS (
+    SELECT
+        chat.chat_identifier
+    FROM
+        chat
+    JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+    GROUP BY
+        chat.chat_identifier
+    ORDER BY
+        COUNT(*) DESC
+    LIMIT :limit_number
+)
+SELECT
+    message.guid,
+    message.date / 1000000000 + 978307200 AS message_date,
+    message.text,
+    message.is_from_me,
+    chat.chat_identifier
+FROM
+    top_chats
+JOIN chat ON chat.chat_identifier = top_chats.chat_identifier
+JOIN chat_message_join ON chat. "ROWID" = chat_message_join.chat_id
+JOIN message ON chat_message_join.message_id = message. "ROWID"
 ORDER BY
-    message_date ASC;
+    chat.chat_identifier ASC,
+    message.date ASC;
 """
 
 if __name__ == "__main__":
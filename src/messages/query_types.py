@@ -1,28 +1,29 @@
 """Contains all the types that we return from our query object."""
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import NamedTuple, Optional
 
-from messages.sentiment_classifier import OverallSentiment
+from messages.sentiment_classifier import OverallSentiment, SentimentAnalysisModel
 
 # pylint: disable=missing-class-docstring
 
+# Row types are NamedTuples rather than dataclasses: we build one per row, and a tuple is a
+# fraction of the size of an object with a __dict__. See result_set.py for whole dumps.
 
-@dataclass
-class TotalCountType:
+
+class TotalCountType(NamedTuple):
     message_number: str
     message_count: int
     full_name: Optional[str] = None
 
 
-@dataclass
-class AllContactType:
+class AllContactType(NamedTuple):
     contact_number: str
     contact_name: Optional[str] = None
 
 
-@dataclass
-class AllMessageType:
+class AllMessageType(NamedTuple):
+    message_guid: str
     message_date: str
     message_text: Optional[str]
     is_from_me: bool
@@ -30,17 +31,30 @@ class AllMessageType:
     full_name: Optional[str] = None
 
 
-@dataclass
-class SearchType:
+class UnixDateMessageType(NamedTuple):
+    message_guid: str
+    # Unix seconds
+    message_date: int
+    message_text: Optional[str]
+    is_from_me: bool
+    message_number: str
+    full_name: Optional[str] = None
+
+
+class SearchType(NamedTuple):
+    message_guid: str
     message_date: str
     message_text: Optional[str]
     is_from_me: bool
     message_number: str
     full_name: Optional[str] = None
+    # Only selected with --before / --after, context rows aren't matches themselves
+    is_match: bool = True
+    context_group: Optional[int] = None
 
 
-@dataclass
-class GetAllMessageType:
+class GetAllMessageType(NamedTuple):
+    message_guid: str
     message_date: str
     message_text: Optional[str]
     is_from_me: bool
@@ -48,14 +62,33 @@ class GetAllMessageType:
     full_name: Optional[str] = None
 
 
-@dataclass
-class BaseMessageWithSentimentType:
+class BaseMessageWithSentimentType(NamedTuple):
     message_date: str
     message_text: Optional[str]
     is_from_me: bool
     message_number: str
     sentiment: OverallSentiment
     full_name: Optional[str] = None
+    is_match: bool = True
+    context_group: Optional[int] = None
+
+
+class SentimentSeriesType(NamedTuple):
+    # First day of the day / week / month, YYYY-MM-DD
+    period_start: str
+    message_count: int
+    compound: float
+    sentiment: OverallSentiment
+
+
+class ActivityStatsType(NamedTuple):
+    # "total", "month" or "hour_of_week"
+    view: str
+    # "all" for the total, YYYY-MM for a month, e.g. "Mon 09:00" for an hour of the week
+    bucket: str
+    message_count: int
+    sent_count: int
+    received_count: int
 
 
 @dataclass
@@ -64,5 +97,29 @@ class AggregateSentimentStats:
     sentiment: OverallSentiment
 
 
+@dataclass
+class RunningSentimentStats:
+    """Accumulates the compound score while messages stream past, so the aggregate
+    is available once they've all been consumed without having to keep them around."""
+
+    total_compound: float = 0.0
+    num_messages: int = 0
+
+    def add(self, compound: float) -> None:
+        """Counts one more message with this compound score."""
+        self.total_compound += compound
+        self.num_messages += 1
+
+    def to_aggregate(self) -> AggregateSentimentStats:
+        """The average compound score so far and its overall sentiment."""
+        if self.num_messages == 0:
+            return AggregateSentimentStats(0.0, OverallSentiment.UNKNOWN)
+        averaged_compound_score = self.total_compound / self.num_messages
+        return AggregateSentimentStats(
+            averaged_compound_score,
+            SentimentAnalysisModel.get_sentiment_from_scalar(averaged_compound_score),
+        )
+
+
 GetAllMessageWithSentimentType = BaseMessageWithSentimentType
 SearchWithSentimentType = BaseMessageWithSentimentType
@@ -0,0 +1,91 @@
+"""Compact, column oriented container for large message dumps.
+
+A list of row objects costs well over a hundred bytes per message before counting the text
+itself: the object, a reference per field and a fresh date string each. MessageResultSet keeps
+every column in the tightest container that fits instead (dates as int64 unix seconds,
+is_from_me as a byte, each chat identifier and contact name stored once) and only builds
+a row object when one is asked for."""
+
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from messages.query_types import AllMessageType
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class MessageResultSet:
+    """Messages in column form, rows are built on access."""
+
+    def __init__(self) -> None:
+        self.guids: List[str] = []
+        # Unix seconds, as selected by the *_UNIX queries
+        self.dates = array("q")
+        self.texts: List[Optional[str]] = []
+        self.is_from_me = bytearray()
+        # Index into chat_identifiers / full_names
+        self.chat_codes = array("L")
+        self.chat_identifiers: List[str] = []
+        self.full_names: List[Optional[str]] = []
+        self._chat_code_by_identifier: Dict[str, int] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]]) -> "MessageResultSet":
+        """Builds a result set from (guid, unix date, text, is_from_me, chat_identifier
+        [, full_name]) rows, e.g. straight off ALL_MESSAGES_BY_DATE_UNIX."""
+        result_set = cls()
+        for row in rows:
+            result_set.append(*row)
+        return result_set
+
+    def append(
+        self,
+        guid: str,
+        unix_date: int,
+        text: Optional[str],
+        is_from_me: int,
+        chat_identifier: str,
+        full_name: Optional[str] = None,
+    ) -> None:
+        """Adds one message, its chat is stored once and referenced by code."""
+        chat_code = self._chat_code_by_identifier.get(chat_identifier)
+        if chat_code is None:
+            chat_code = len(self.chat_identifiers)
+            self._chat_code_by_identifier[chat_identifier] = chat_code
+            self.chat_identifiers.append(chat_identifier)
+            self.full_names.append(full_name)
+
+        self.guids.append(guid)
+        self.dates.append(unix_date)
+        self.texts.append(text)
+        self.is_from_me.append(1 if is_from_me else 0)
+        self.chat_codes.append(chat_code)
+
+    def __len__(self) -> int:
+        return len(self.guids)
+
+    def __getitem__(self, idx: int) -> AllMessageType:
+        chat_code = self.chat_codes[idx]
+        return AllMessageType(
+            self.guids[idx],
+            datetime.fromtimestamp(self.dates[idx]).strftime(DATE_FORMAT),
+            self.texts[idx],
+            bool(self.is_from_me[idx]),
+            self.chat_identifiers[chat_code],
+            self.full_names[chat_code],
+        )
+
+    def __iter__(self) -> Iterator[AllMessageType]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+if __name__ == "__main__":
+    result_set = MessageResultSet.from_rows(
+        [
+            ("guid-1", 1678309600, "love you", 1, "+15134901940", "Ann Lee"),
+            ("guid-2", 1678310200, None, 0, "+15134901940", "Ann Lee"),
+        ]
+    )
+    print(len(result_set), result_set.chat_identifiers, list(result_set))
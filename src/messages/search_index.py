@@ -0,0 +1,160 @@
+"""Handles the optional FTS5 full-text index used by `messages search`.
+
+chat.db has to stay read-only, so the index lives in a sidecar sqlite database in the
+cache dir. It only stores the tokenized text keyed on message.ROWID (contentless FTS5),
+and is refreshed incrementally by indexing every message above the highest ROWID seen so far.
+
+ROWIDs only mean something in the database they came from, so there's one index per source
+database (named after its path), and it also remembers the guids of the latest messages it
+indexed. If any of them is a different message now, or none of them is left, chat.db was
+replaced (or the index copied over from elsewhere) and the index is rebuilt instead of
+refreshed. Messages deleted since are skipped, deleting the newest message is common."""
+
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Any, List, Optional, cast
+
+from messages.queries import (
+    CREATE_SEARCH_INDEX,
+    DELETE_SEARCH_INDEX_SAMPLE,
+    DROP_SEARCH_INDEX,
+    INSERT_SEARCH_INDEX,
+    INSERT_SEARCH_INDEX_SAMPLE,
+    LATEST_MESSAGE_GUIDS_UP_TO_ROWID,
+    MESSAGE_GUID_BY_ROWID,
+    MESSAGES_ABOVE_ROWID,
+    SEARCH_INDEX_COUNT,
+    SEARCH_INDEX_META,
+    SEARCH_INDEX_SAMPLE,
+    UPDATE_SEARCH_INDEX_META,
+)
+from messages.utils import get_cache_dir
+
+SEARCH_INDEX_FILENAME = "search_index.db"
+SEARCH_INDEX_FILENAME_TEMPLATE = "search_index-{}.db"
+INDEX_BATCH_SIZE = 5000
+# How many of the latest indexed messages are checked against the source before refreshing
+SOURCE_CHECK_SAMPLE_SIZE = 100
+
+# Either a "quoted phrase" (optionally followed by * for a prefix) or a bare word
+FTS_TOKEN_PATTERN = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def to_fts_query(search_text: str) -> str:
+    """Converts user search text into an FTS5 MATCH expression.
+
+    Every word has to match, "quoted text" is matched as a phrase, and a trailing *
+    turns a word or phrase into a prefix query, e.g. `"on my" wa*`. Everything else is
+    quoted so punctuation like apostrophes can't be read as FTS5 syntax."""
+    terms: List[str] = []
+    for phrase, phrase_prefix, word in FTS_TOKEN_PATTERN.findall(search_text):
+        if word:
+            is_prefix = word.endswith("*") and len(word) > 1
+            term = word.rstrip("*") if is_prefix else word
+            suffix = "*" if is_prefix else ""
+        else:
+            term, suffix = phrase, phrase_prefix
+        if term.strip():
+            terms.append('"' + term.replace('"', '""') + '"' + suffix)
+    return " ".join(terms)
+
+
+def search_index_filename(source_db_path: Optional[str] = None) -> str:
+    """The index's file name in the cache dir, one per source database."""
+    if source_db_path is None:
+        return SEARCH_INDEX_FILENAME
+    path_hash = hashlib.sha1(os.path.realpath(source_db_path).encode()).hexdigest()
+    return SEARCH_INDEX_FILENAME_TEMPLATE.format(path_hash[:16])
+
+
+class MessageSearchIndex:
+    """Sidecar FTS5 index over message.text of the database at source_db_path."""
+
+    def __init__(self, path: Optional[str] = None, source_db_path: Optional[str] = None) -> None:
+        self.path = (
+            path
+            if path is not None
+            else os.path.join(get_cache_dir(), search_index_filename(source_db_path))
+        )
+
+    def exists(self) -> bool:
+        """Whether the index has been built. Searching only uses it once it exists."""
+        return os.path.isfile(self.path)
+
+    def refresh(self, source_conn: sqlite3.Connection, rebuild: bool = False) -> int:
+        """Indexes every message in source_conn above the last indexed ROWID, or all of them
+        if the index wasn't built from source_conn's database.
+        Returns the number of new messages that were processed."""
+        index_conn = sqlite3.connect(self.path)
+        try:
+            index_conn.executescript(CREATE_SEARCH_INDEX)
+            max_rowid = self._meta(index_conn, "max_rowid") or 0
+            if max_rowid and not rebuild:
+                rebuild = not self._is_built_from(index_conn, source_conn)
+            if rebuild:
+                index_conn.executescript(DROP_SEARCH_INDEX)
+                index_conn.executescript(CREATE_SEARCH_INDEX)
+                max_rowid = 0
+
+            num_indexed = 0
+            source_cursor = source_conn.cursor()
+            source_cursor.execute(MESSAGES_ABOVE_ROWID, [max_rowid])
+            while True:
+                rows = source_cursor.fetchmany(INDEX_BATCH_SIZE)
+                if not rows:
+                    break
+                max_rowid = rows[-1][0]
+                index_conn.executemany(
+                    INSERT_SEARCH_INDEX, [row for row in rows if row[1]]
+                )
+                num_indexed += len(rows)
+            source_cursor.close()
+
+            index_conn.execute(UPDATE_SEARCH_INDEX_META, ["max_rowid", max_rowid])
+            index_conn.execute(DELETE_SEARCH_INDEX_SAMPLE)
+            index_conn.executemany(
+                INSERT_SEARCH_INDEX_SAMPLE,
+                source_conn.execute(
+                    LATEST_MESSAGE_GUIDS_UP_TO_ROWID, [max_rowid, SOURCE_CHECK_SAMPLE_SIZE]
+                ).fetchall(),
+            )
+            index_conn.commit()
+            return num_indexed
+        finally:
+            index_conn.close()
+
+    def count(self) -> int:
+        """Number of messages with text in the index."""
+        index_conn = sqlite3.connect(self.path)
+        try:
+            return cast(int, index_conn.execute(SEARCH_INDEX_COUNT).fetchone()[0])
+        finally:
+            index_conn.close()
+
+    ### Private Methods ###
+    @staticmethod
+    def _meta(index_conn: sqlite3.Connection, key: str) -> Any:
+        row = index_conn.execute(SEARCH_INDEX_META, [key]).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def _is_built_from(index_conn: sqlite3.Connection, source_conn: sqlite3.Connection) -> bool:
+        """Whether the latest indexed messages are in source_conn under the same ROWIDs.
+        Messages deleted from chat.db since are skipped, but at least one has to be found."""
+        num_found = 0
+        for rowid, guid in index_conn.execute(SEARCH_INDEX_SAMPLE).fetchall():
+            row = source_conn.execute(MESSAGE_GUID_BY_ROWID, [rowid]).fetchone()
+            if row is None:
+                continue
+            if row[0] != guid:
+                return False
+            num_found += 1
+        return num_found > 0
+
+
+if __name__ == "__main__":
+    print(to_fts_query('absolute stud'))
+    print(to_fts_query('"on my way" hom*'))
+    print(to_fts_query("don't"))
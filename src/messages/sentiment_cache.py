@@ -0,0 +1,116 @@
+"""Persists sentiment scores across runs.
+
+Messages in chat.db don't change once they're sent, so there's no reason to run VADER over the
+same message twice. Scores are stored in a sqlite database in the cache dir, keyed on
+message.guid (stable across chat.db copies, unlike ROWID) plus the scorer version, so upgrading
+the scoring logic or nltk simply stops matching the old entries.
+
+One connection serves every thread sharing the manager, a lock keeps them taking turns."""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from messages.queries import (
+    CREATE_SENTIMENT_CACHE,
+    DELETE_SENTIMENT_CACHE,
+    DELETE_SENTIMENT_CACHE_OTHER_VERSIONS,
+    EVICT_SENTIMENT_CACHE,
+    INSERT_SENTIMENT_CACHE,
+    SENTIMENT_CACHE_BY_GUIDS,
+    SENTIMENT_CACHE_COUNT_BY_VERSION,
+)
+from messages.sentiment_classifier import SentimentResult
+from messages.utils import chunked, get_cache_dir
+
+SENTIMENT_CACHE_FILENAME = "sentiment_cache.db"
+# Roughly 100 bytes an entry on disk
+DEFAULT_MAX_ENTRIES = 2_000_000
+# Stay well under sqlite's limit on bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+# Short batches are padded with NULLs (which never match) so every lookup is the same statement
+LOOKUP_QUERY = SENTIMENT_CACHE_BY_GUIDS.format(
+    placeholders=", ".join("?" * LOOKUP_BATCH_SIZE)
+)
+
+
+class SentimentCache:
+    """On disk cache of SentimentResults keyed on message guid and scorer version."""
+
+    def __init__(
+        self,
+        scorer_version: str,
+        path: Optional[str] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.scorer_version = scorer_version
+        self.path = (
+            path
+            if path is not None
+            else os.path.join(get_cache_dir(), SENTIMENT_CACHE_FILENAME)
+        )
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(CREATE_SENTIMENT_CACHE)
+        # Enforcing the cap once per session means we can overshoot it by at most one run
+        self.enforce_size_cap()
+
+    def get_many(self, message_guids: Iterable[str]) -> Dict[str, SentimentResult]:
+        """Returns the cached results for whichever of message_guids we have."""
+        cached: Dict[str, SentimentResult] = {}
+        for guids in chunked(message_guids, LOOKUP_BATCH_SIZE):
+            padding = [None] * (LOOKUP_BATCH_SIZE - len(guids))
+            with self._lock:
+                rows = self.conn.execute(
+                    LOOKUP_QUERY, [self.scorer_version, *guids, *padding]
+                ).fetchall()
+            for guid, neg, neu, pos, compound in rows:
+                cached[guid] = SentimentResult(neg, neu, pos, compound)
+        return cached
+
+    def put_many(self, results: Dict[str, SentimentResult]) -> None:
+        """Stores results keyed on message guid."""
+        if not results:
+            return
+        with self._lock:
+            self.conn.executemany(
+                INSERT_SENTIMENT_CACHE,
+                [
+                    (guid, self.scorer_version, x.neg, x.neu, x.pos, x.compound)
+                    for guid, x in results.items()
+                ],
+            )
+            self.conn.commit()
+
+    def enforce_size_cap(self) -> None:
+        """Evicts the oldest entries beyond max_entries."""
+        with self._lock:
+            self.conn.execute(EVICT_SENTIMENT_CACHE, [self.max_entries])
+            self.conn.commit()
+
+    def count_by_version(self) -> List[Tuple[str, int]]:
+        """Number of entries per scorer version."""
+        with self._lock:
+            return list(self.conn.execute(SENTIMENT_CACHE_COUNT_BY_VERSION))
+
+    def invalidate(self, all_versions: bool = False) -> int:
+        """Drops entries from other scorer versions, or every entry if all_versions.
+        Returns the number of entries removed."""
+        with self._lock:
+            if all_versions:
+                cursor = self.conn.execute(DELETE_SENTIMENT_CACHE)
+            else:
+                cursor = self.conn.execute(
+                    DELETE_SENTIMENT_CACHE_OTHER_VERSIONS, [self.scorer_version]
+                )
+            self.conn.commit()
+            num_removed = cursor.rowcount
+            self.conn.execute("VACUUM;")
+            return num_removed
+
+    def close(self) -> None:
+        """Closes the cache's connection."""
+        with self._lock:
+            self.conn.close()
@@ -1,12 +1,37 @@
 """This is a helper class to analyze sentiment of various text messages."""
 
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import (
     auto,
     Enum,
 )
-from typing import Optional
-from nltk.sentiment import SentimentIntensityAnalyzer
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from messages.profiler import PROFILER
+
+if sys.version_info >= (3, 8):
+    from importlib.metadata import PackageNotFoundError, version
+else:
+    from importlib_metadata import PackageNotFoundError, version
+
+# Upper bound on distinct texts we keep scores for. iMessage text repeats a lot ("ok", "lol",
+# "on my way"), so even a modest memo skips most of the VADER work.
+DEFAULT_MEMO_SIZE = 50_000
+# How many batches per worker we let queue up before waiting on the oldest one. Keeps every
+# worker busy without reading the whole result set ahead of the consumer.
+BATCHES_IN_FLIGHT_PER_WORKER = 2
+
+# Bump whenever a change here would change scores, so persisted scores get invalidated.
+# The nltk version is folded in as well since the VADER lexicon ships with it.
+SCORER_VERSION = "vader-1"
+
+T = TypeVar("T")
+# What a worker sends back for a batch: the results and its memo hits and misses scoring them
+WorkerResult = Tuple[List["SentimentResult"], int, int]
 
 
 @dataclass
@@ -23,6 +48,29 @@ class SentimentResult:
         return SentimentResult(0, 0, 0, 0)
 
 
+@dataclass
+class SentimentMemoStats:
+    """Hit / miss counts for the sentiment memo."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups that were hits, 0 before any."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.hits:,} hits / {self.misses:,} misses ({self.hit_rate:.1%} hit rate)"
+
+
+def normalize_text(message: str) -> str:
+    """Collapses whitespace. VADER tokenizes on whitespace, so this never changes the score
+    but lets "ok " and "ok" share a memo entry."""
+    return " ".join(message.split())
+
+
 class OverallSentiment(Enum):
     """Enum for summary of ."""
 
@@ -44,8 +92,38 @@ class SentimentAnalysisModel:
     compound score). It understands emphasis of capitalization and punctuation.
     """
 
-    def __init__(self) -> None:
-        self.model = SentimentIntensityAnalyzer()
+    def __init__(self, memo_size: int = DEFAULT_MEMO_SIZE, workers: int = 1) -> None:
+        self._model: Optional[Any] = None
+        self.memo_size = memo_size
+        self.memo_stats = SentimentMemoStats()
+        self._memo: "OrderedDict[str, SentimentResult]" = OrderedDict()
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Threads sharing a manager share its model. The memo and the lazily built VADER and
+        # worker pool are only touched holding this, VADER holds the GIL anyway.
+        self._lock = threading.RLock()
+
+    @property
+    def model(self) -> Any:
+        """The VADER SentimentIntensityAnalyzer. nltk is slow to import and VADER loads its
+        lexicon on construction, so we only pay for it once something actually needs scoring."""
+        if self._model is None:
+            with self._lock, PROFILER.stage("sentiment.load"):
+                # pylint: disable=import-outside-toplevel
+                from nltk.sentiment import SentimentIntensityAnalyzer
+
+                if self._model is None:
+                    self._model = SentimentIntensityAnalyzer()
+        return self._model
+
+    @staticmethod
+    def scorer_version() -> str:
+        """Identifies the scoring logic, used to invalidate persisted scores."""
+        try:
+            nltk_version = version("nltk")
+        except PackageNotFoundError:
+            nltk_version = "unknown"
+        return f"{SCORER_VERSION}/nltk-{nltk_version}"
 
     def analyze_message(self, message: Optional[str]) -> SentimentResult:
         """Analyzes a message and returns a numeric value showing scores.
@@ -64,10 +142,54 @@ class SentimentAnalysisModel:
         """
         if not message:
             return SentimentResult.empty()
-        scores = self.model.polarity_scores(message)
-        return SentimentResult(
-            scores["neg"], scores["neu"], scores["pos"], scores["compound"]
-        )
+        return self.analyze_many([message])[0]
+
+    def analyze_many(self, messages: Iterable[Optional[str]]) -> List[SentimentResult]:
+        """Analyzes a batch of messages, returning results in the same order.
+
+        Scores are memoized (LRU, bounded by memo_size) on the normalized text, so text that
+        repeats within the batch or across calls is only run through VADER once."""
+        with self._lock:
+            return self._analyze_many(messages)
+
+    def analyze_batches(
+        self, batches: Iterable[Tuple[T, List[Optional[str]]]]
+    ) -> Iterator[Tuple[T, List[SentimentResult]]]:
+        """Analyzes a stream of (payload, messages) batches, yielding (payload, results) in the
+        original order. The payload is passed through untouched, e.g. the rows the messages came from.
+
+        With workers > 1 the batches are scored in a process pool where each worker loads VADER
+        once (and keeps its own memo, its hits and misses are added to ours). Only a few batches
+        per worker are in flight at a time, so memory stays flat."""
+        if self.workers <= 1:
+            for payload, messages in batches:
+                yield (payload, self.analyze_many(messages))
+            return
+
+        executor = self._get_executor()
+        pending: Deque[Tuple[T, "Future[WorkerResult]"]] = deque()
+        max_in_flight = self.workers * BATCHES_IN_FLIGHT_PER_WORKER
+        for payload, messages in batches:
+            if messages:
+                future = executor.submit(_analyze_in_worker, messages)
+            else:
+                # Nothing to score (e.g. everything was cached), don't bother a worker
+                future = Future()
+                future.set_result(([], 0, 0))
+            pending.append((payload, future))
+            if len(pending) >= max_in_flight:
+                oldest_payload, oldest_future = pending.popleft()
+                yield (oldest_payload, self._collect(oldest_future))
+        while pending:
+            oldest_payload, oldest_future = pending.popleft()
+            yield (oldest_payload, self._collect(oldest_future))
+
+    def shutdown(self) -> None:
+        """Stops the worker pool, if one was started."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
 
     @classmethod
     def get_overall_sentiment(cls, score: SentimentResult) -> OverallSentiment:
@@ -90,9 +212,88 @@ class SentimentAnalysisModel:
         scores = self.analyze_message(message)
         return self.get_overall_sentiment(scores)
 
+    ### Private Methods ###
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.memo_size,),
+                )
+            return self._executor
+
+    def _score(self, message: str) -> SentimentResult:
+        scores = self.model.polarity_scores(message)
+        return SentimentResult(
+            scores["neg"], scores["neu"], scores["pos"], scores["compound"]
+        )
+
+    def _analyze_many(self, messages: Iterable[Optional[str]]) -> List[SentimentResult]:
+        results: List[SentimentResult] = []
+        scored_in_batch: Dict[str, SentimentResult] = {}
+        hits = misses = 0
+        for message in messages:
+            if not message:
+                results.append(SentimentResult.empty())
+                continue
+
+            key = normalize_text(message)
+            result = scored_in_batch.get(key)
+            if result is None:
+                result = self._memo.get(key)
+                if result is None:
+                    misses += 1
+                    result = self._score(key)
+                    self._remember(key, result)
+                else:
+                    hits += 1
+                    self._memo.move_to_end(key)
+                scored_in_batch[key] = result
+            else:
+                hits += 1
+            results.append(result)
+        self._count_memo(hits, misses)
+        return results
+
+    def _collect(self, future: "Future[WorkerResult]") -> List[SentimentResult]:
+        results, hits, misses = future.result()
+        self._count_memo(hits, misses)
+        return results
+
+    def _count_memo(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.memo_stats.hits += hits
+            self.memo_stats.misses += misses
+        PROFILER.count("sentiment.memo.hits", hits)
+        PROFILER.count("sentiment.memo.misses", misses)
+
+    def _remember(self, key: str, result: SentimentResult) -> None:
+        self._memo[key] = result
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+
+# Each worker process keeps its own model (and memo) for its whole lifetime
+_worker_model: Optional[SentimentAnalysisModel] = None
+
+
+def _init_worker(memo_size: int) -> None:
+    global _worker_model  # pylint: disable=global-statement
+    _worker_model = SentimentAnalysisModel(memo_size=memo_size)
+
+
+def _analyze_in_worker(messages: List[Optional[str]]) -> WorkerResult:
+    if _worker_model is None:
+        raise RuntimeError("Sentiment worker was not initialized")
+    stats = _worker_model.memo_stats
+    hits, misses = stats.hits, stats.misses
+    results = _worker_model.analyze_many(messages)
+    return (results, stats.hits - hits, stats.misses - misses)
+
 
 if __name__ == "__main__":
-    model = SentimentIntensityAnalyzer()
+    model = SentimentAnalysisModel().model
     text = "This was a great movie"
     scores = model.polarity_scores(text)
     print(f"Text: {text} Scores: {scores}")
@@ -108,3 +309,7 @@ if __name__ == "__main__":
     text = "This was NOT a great movie"
     scores = model.polarity_scores(text)
     print(f"Text: {text} Scores: {scores}")
+
+    memoized_model = SentimentAnalysisModel()
+    memoized_model.analyze_many(["ok", "lol", "ok ", "on my way", "lol"])
+    print(f"Memo: {memoized_model.memo_stats}")
@@ -0,0 +1,46 @@
+"""Persists `messages stats` results across runs.
+
+Aggregating the whole history is a full scan of chat.db, while finding out whether anything
+changed since is a single lookup of the max message ROWID. Results are stored in a sqlite
+database in the cache dir and only reused while that ROWID is the same. Threads sharing the
+manager share the connection, taking turns."""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, List, Optional
+
+from messages.queries import CREATE_STATS_CACHE, INSERT_STATS_CACHE, STATS_CACHE_BY_KEY
+from messages.utils import get_cache_dir
+
+STATS_CACHE_FILENAME = "stats_cache.db"
+
+
+class StatsCache:
+    """On disk cache of aggregated rows, keyed on a caller chosen key and the max ROWID."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = (
+            path if path is not None else os.path.join(get_cache_dir(), STATS_CACHE_FILENAME)
+        )
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(CREATE_STATS_CACHE)
+
+    def get(self, cache_key: str, max_rowid: int) -> Optional[List[List[Any]]]:
+        """Returns the rows stored for cache_key, if they were computed at max_rowid."""
+        with self._lock:
+            row = self.conn.execute(STATS_CACHE_BY_KEY, [cache_key, max_rowid]).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, cache_key: str, max_rowid: int, rows: List[List[Any]]) -> None:
+        """Stores rows for cache_key, replacing whatever was computed at an older max_rowid."""
+        with self._lock:
+            self.conn.execute(INSERT_STATS_CACHE, [cache_key, max_rowid, json.dumps(rows)])
+            self.conn.commit()
+
+    def close(self) -> None:
+        """Closes the cache's connection."""
+        with self._lock:
+            self.conn.close()
@@ -1,7 +1,39 @@
 """Helpful utils for message parsing"""
 
-from typing import Optional
+import os
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeVar
 from random import shuffle
+from urllib.parse import quote
+
+T = TypeVar("T")
+
+# US numbers are 10 digits once the country code is dropped. Comparing on the trailing digits
+# lets "+15134901945", "15134901945" and "(513) 490-1945" all resolve to the same contact.
+CANONICAL_NUMBER_LENGTH = 10
+PHONE_NUMBER_PATTERN = re.compile(r"^[+\d\s().-]+$")
+
+# chat.db stores message.date as nanoseconds since 2001-01-01 00:00:00 UTC
+APPLE_EPOCH_UNIX_SECONDS = 978307200
+NANOSECONDS_PER_SECOND = 1_000_000_000
+MIN_APPLE_DATE = -(2**63)
+MAX_APPLE_DATE = 2**63 - 1
+
+# Buckets time series can be grouped into, see period_start
+PERIODS = ["day", "week", "month"]
+
+# Where we keep anything derived from chat.db, since chat.db itself must stay read-only
+CACHE_DIR = os.getenv(
+    "MESSAGES_CACHE_DIR",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "imessage-cli",
+    ),
+)
 
 
 def cleanse_message(message_text: Optional[str], cleanse_emojis: bool = False) -> str:
@@ -18,6 +50,83 @@ def cleanse_message(message_text: Optional[str], cleanse_emojis: bool = False) -
 
     return message_text.strip().replace("\r", "").replace("\n", "")
 
+def canonical_number(handle: Optional[str]) -> Optional[str]:
+    """Returns the canonical form of a phone number or chat handle so that the two can be
+    compared on equality. Returns None for anything that isn't a phone number (emails, group chats)."""
+    if not handle or not PHONE_NUMBER_PATTERN.match(handle):
+        return None
+
+    digits = "".join(ch for ch in handle if ch.isdigit())
+    if not digits:
+        return None
+    return digits[-CANONICAL_NUMBER_LENGTH:]
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yields lists of up to size items from iterable, without reading ahead any further."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def local_datetime_to_apple_ns(local_datetime: datetime) -> int:
+    """Converts a naive local datetime to chat.db's message.date representation."""
+    unix_seconds = int(local_datetime.timestamp())
+    return (unix_seconds - APPLE_EPOCH_UNIX_SECONDS) * NANOSECONDS_PER_SECOND
+
+def local_date_window_to_apple_ns(
+    date_from: Optional[date], date_to: Optional[date]
+) -> Tuple[int, int]:
+    """Returns inclusive message.date bounds covering every local day from date_from through date_to.
+    A missing bound leaves that side of the window open."""
+    start = MIN_APPLE_DATE
+    if date_from is not None:
+        start = local_datetime_to_apple_ns(
+            datetime(date_from.year, date_from.month, date_from.day)
+        )
+    end = MAX_APPLE_DATE
+    if date_to is not None:
+        day_after = datetime(date_to.year, date_to.month, date_to.day) + timedelta(days=1)
+        end = local_datetime_to_apple_ns(day_after) - 1
+    return (start, end)
+
+def period_start(message_date: str, period: str) -> str:
+    """Returns the first day (YYYY-MM-DD) of the day / week (starting Monday) / month a
+    "YYYY-MM-DD HH:MM:SS" message date falls in."""
+    if period == "day":
+        return message_date[:10]
+    if period == "month":
+        return message_date[:7] + "-01"
+    if period == "week":
+        return _week_start(message_date[:10])
+    raise ValueError(f"Unknown period {period}, expected one of {PERIODS}")
+
+@lru_cache(maxsize=1024)
+def _week_start(day: str) -> str:
+    parsed = date.fromisoformat(day)
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+def read_only_uri(path: str) -> str:
+    """sqlite URI that opens path read-only, for databases some other app owns."""
+    return "file:" + quote(os.path.abspath(path)) + "?mode=ro"
+
+def backup_database(source_path: str, dest_path: str) -> None:
+    """Copies source_path to dest_path with sqlite's backup API. Unlike copying the file,
+    this gives a consistent copy (WAL included) even while another process is writing."""
+    source_conn = sqlite3.connect(read_only_uri(source_path), uri=True)
+    dest_conn = sqlite3.connect(dest_path)
+    try:
+        source_conn.backup(dest_conn)
+    finally:
+        dest_conn.close()
+        source_conn.close()
+
+def get_cache_dir() -> str:
+    """Returns the cache directory for derived data, creating it if needed."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return CACHE_DIR
+
 # name
 def mask_name(name_str: str) -> str:
     """If should_mask is enabled, masks the given name string. 
@@ -72,3 +181,5 @@ if __name__ == '__main__':
     print(maybe_mask_phone_number("5131234567", True))
     print(maybe_mask_phone_number("+15131234567", True))
     print(scramble_string("Sydney Larkin"))
+    print(canonical_number("+1 (513) 123-4567"))
+    print([period_start("2023-03-08 20:56:40", x) for x in PERIODS])
@@ -0,0 +1,30 @@
+"""Shared fixtures. The databases come from benchmarks/synthetic_db.py, kept small."""
+
+import os
+import sys
+from typing import Iterator, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+
+from synthetic_db import SyntheticConfig, generate  # pylint: disable=wrong-import-position
+
+NUM_MESSAGES = 5000
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    """Keeps every sidecar database (search index, caches) out of the real cache dir."""
+    path = os.path.join(str(tmp_path), "cache")
+    monkeypatch.setattr("messages.utils.CACHE_DIR", path)
+    yield path
+
+
+@pytest.fixture(scope="session")
+def synthetic_db(tmp_path_factory: pytest.TempPathFactory) -> Tuple[str, str]:
+    """(chat.db path, AddressBook dir) shared by the whole session, never written to."""
+    return generate(
+        SyntheticConfig(num_messages=NUM_MESSAGES, num_contacts=50, num_unknown_chats=20),
+        str(tmp_path_factory.mktemp("synthetic")),
+    )
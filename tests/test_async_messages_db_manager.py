@@ -0,0 +1,95 @@
+import asyncio
+from typing import Tuple
+
+from messages.async_messages_db_manager import AsyncMessagesDbManager
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+
+# Never finishes on its own, only cancelling stops it
+ENDLESS_QUERY = """
+WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter)
+SELECT COUNT(*) FROM counter;
+"""
+# How long a cancelled query gets to stop before the test fails instead of hanging
+TIMEOUT_SECONDS = 30
+
+
+def run_endless_query(manager: MessagesDbManager) -> int:
+    with manager.client.pool.connection() as conn:
+        return int(conn.execute(ENDLESS_QUERY).fetchone()[0])
+
+
+def test_results_match_the_sync_manager(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+    sync_manager = MessagesDbManager(
+        client=MessagesDbClient(db_path=db_path, address_book_path=address_book_path),
+        use_sentiment_cache=False,
+    )
+    expected = list(sync_manager.search_messages_by_text("dinner"))
+    sync_manager.close()
+
+    async def search() -> list:
+        async with AsyncMessagesDbManager(
+            workers=1,
+            use_sentiment_cache=False,
+            batch_size=100,
+            db_path=db_path,
+            address_book_path=address_book_path,
+        ) as manager:
+            return [row async for row in manager.search_messages_by_text("dinner")]
+
+    assert asyncio.run(search()) == expected
+
+
+def test_cancelling_a_call_leaves_other_streams_alone(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    num_messages = sum(1 for _ in client.all_messages_sorted())
+    client.close()
+
+    async def run() -> int:
+        async with AsyncMessagesDbManager(
+            workers=1,
+            use_sentiment_cache=False,
+            batch_size=100,
+            db_path=db_path,
+            address_book_path=address_book_path,
+        ) as manager:
+            stream = manager.all_messages_sorted().__aiter__()
+            num_rows = 0
+            # Partly consumed, its cursor is open on the sqlite thread's connection
+            for _ in range(150):
+                await stream.__anext__()
+                num_rows += 1
+
+            endless = asyncio.ensure_future(manager._run(run_endless_query))
+            await asyncio.sleep(0.2)
+            endless.cancel()
+            # Only stops once the query is aborted, the sqlite thread is busy until then
+            assert await asyncio.wait_for(manager.total_distinct_convos(), TIMEOUT_SECONDS) > 0
+
+            async for _ in stream:
+                num_rows += 1
+            return num_rows
+
+    assert asyncio.run(run()) == num_messages
+
+
+def test_cancelled_query_raises_interrupted(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+
+    async def run() -> None:
+        async with AsyncMessagesDbManager(
+            use_sentiment_cache=False, db_path=db_path, address_book_path=address_book_path
+        ) as manager:
+            endless = asyncio.ensure_future(manager._run(run_endless_query))
+            await asyncio.sleep(0.2)
+            endless.cancel()
+            try:
+                await endless
+            except asyncio.CancelledError:
+                pass
+            # The sqlite thread is free again and the connection still works
+            assert await asyncio.wait_for(manager.total_distinct_convos(), TIMEOUT_SECONDS) > 0
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import os
+from typing import List, Optional, Tuple
+
+import pytest
+
+from messages import cli
+
+
+@pytest.fixture(autouse=True)
+def fresh_manager() -> None:
+    cli.close_manager()
+
+
+def test_run_command_closes_the_manager_it_replaces(
+    synthetic_db: Tuple[str, str], capsys: pytest.CaptureFixture[str]
+) -> None:
+    db_path, address_book_path = synthetic_db
+    options = ["--no-pager", "--db-path", db_path, "--address-book-path", address_book_path]
+
+    assert cli.run_command([*options, "convos", "-t"]) == 0
+    first = cli.get_manager()
+    # Same options, the warm manager is reused
+    assert cli.run_command([*options, "convos", "-t"]) == 0
+    assert cli.get_manager() is first
+    assert first.client.pool.num_open > 0
+
+    assert cli.run_command([*options, "--workers", "2", "convos", "-t"]) == 0
+    second = cli.get_manager()
+    assert second is not first
+    assert first.client.pool.num_open == 0
+    cli.close_manager()
+    assert second.client.pool.num_open == 0
+    capsys.readouterr()
+
+
+def test_snapshot_runs_remove_their_copy(
+    synthetic_db: Tuple[str, str], capsys: pytest.CaptureFixture[str]
+) -> None:
+    db_path, address_book_path = synthetic_db
+    snapshot_dirs: List[Optional[str]] = []
+    original = cli.MessagesDbManager.close
+
+    def close(manager: cli.MessagesDbManager) -> None:
+        snapshot_dirs.append(manager.client.snapshot_dir)
+        original(manager)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(cli.MessagesDbManager, "close", close)
+        exit_code = cli.run_command(
+            [
+                "--no-pager",
+                "--db-path",
+                db_path,
+                "--address-book-path",
+                address_book_path,
+                "--snapshot",
+                "convos",
+                "-t",
+            ]
+        )
+    assert exit_code == 0
+    assert len(snapshot_dirs) == 1 and snapshot_dirs[0] is not None
+    assert not os.path.exists(snapshot_dirs[0])
+    capsys.readouterr()
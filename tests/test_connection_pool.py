@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Tuple
+
+import pytest
+
+from messages.connection_pool import ConnectionPool
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+
+SEARCH_TEXTS = ["dinner", "love", "late", "birthday"]
+
+
+def memory_pool(max_size: int, timeout: Any = None) -> ConnectionPool:
+    return ConnectionPool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False), max_size, timeout
+    )
+
+
+def test_same_thread_reuses_its_connection() -> None:
+    pool = memory_pool(1)
+    with pool.connection() as outer, pool.connection() as inner:
+        assert outer is inner
+    assert pool.num_open == 1
+    # Returned with the last checkin, so another thread gets it without waiting
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(lambda: pool.checkin(pool.checkout())).result(timeout=5)
+
+
+def test_checkout_blocks_until_a_connection_comes_back() -> None:
+    pool = memory_pool(1, timeout=0.1)
+    lease = pool.checkout()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(TimeoutError):
+            executor.submit(pool.checkout).result(timeout=5)
+
+        pool.timeout = None
+        waiting = executor.submit(pool.checkout)
+        assert not waiting.done()
+        # A streamed result can be finished on any thread
+        threading.Thread(target=pool.checkin, args=(lease,)).start()
+        other = waiting.result(timeout=5)
+    assert other.conn is lease.conn
+    assert pool.num_open == 1
+
+
+def test_close_refuses_new_checkouts_and_closes_returned_connections() -> None:
+    pool = memory_pool(2)
+    lease = pool.checkout()
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(pool.checkout).result(timeout=5)
+    lease.conn.execute("SELECT 1")
+    pool.checkin(lease)
+    with pytest.raises(sqlite3.ProgrammingError):
+        lease.conn.execute("SELECT 1")
+    assert pool.num_open == 0
+
+
+def test_dropped_stream_gives_its_connection_back(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path, pool_size=1)
+    try:
+        rows = client.all_messages_sorted()
+        next(rows)
+        del rows
+        # Otherwise this waits forever on the only connection
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(lambda: list(client.search_messages_by_text("dinner")))
+            assert future.result(timeout=30)
+    finally:
+        client.close()
+
+
+def test_threads_sharing_a_client_see_serial_results(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path, pool_size=2)
+    try:
+        serial = [list(client.search_messages_by_text(text)) for text in SEARCH_TEXTS]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            threaded = list(
+                executor.map(lambda x: list(client.search_messages_by_text(x)), SEARCH_TEXTS * 3)
+            )
+        assert threaded == serial * 3
+        assert client.pool.num_open <= 2
+    finally:
+        client.close()
+
+
+def test_threads_sharing_a_manager(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+
+    def run(manager: MessagesDbManager, text: str) -> Tuple[List[Any], Any]:
+        return (list(manager.search_messages_by_text(text)), manager.message_stats())
+
+    serial_manager = MessagesDbManager(
+        client=MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    )
+    try:
+        serial = [run(serial_manager, text) for text in SEARCH_TEXTS]
+    finally:
+        serial_manager.close()
+
+    # Fresh manager, so the caches and the model are built by whichever thread gets there first
+    manager = MessagesDbManager(
+        client=MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            threaded = list(executor.map(lambda x: run(manager, x), SEARCH_TEXTS * 2))
+    finally:
+        manager.close()
+    assert threaded == serial * 2
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+from typing import List, Tuple
+
+from messages.contact_index import ContactIndex
+
+from synthetic_db import ADDRESS_BOOK_SCHEMA
+
+
+def address_book(root: str, numbers: List[Tuple[str, str, str]]) -> str:
+    """An AddressBook under root with a record per (first name, last name, number)."""
+    os.makedirs(root)
+    conn = sqlite3.connect(os.path.join(root, "AddressBook-v22.abcddb"))
+    conn.executescript(ADDRESS_BOOK_SCHEMA)
+    for pk, (first_name, last_name, number) in enumerate(numbers, start=1):
+        conn.execute(
+            "INSERT INTO ZABCDRECORD (Z_PK, ZFIRSTNAME, ZLASTNAME) VALUES (?, ?, ?)",
+            [pk, first_name, last_name],
+        )
+        conn.execute(
+            "INSERT INTO ZABCDPHONENUMBER (Z_PK, ZOWNER, ZFULLNUMBER) VALUES (?, ?, ?)",
+            [pk, pk, number],
+        )
+    conn.commit()
+    conn.close()
+    return root
+
+
+def test_numbers_match_however_they_were_saved(tmp_path: str) -> None:
+    index = ContactIndex(
+        address_book(
+            os.path.join(str(tmp_path), "AddressBook"),
+            [
+                ("Full", "Number", "(513) 490-1945"),
+                ("No", "AreaCode", "490-1946"),
+                ("Short", "Code", "1947"),
+                ("Longer", "Suffix", "331-1947"),
+                ("Shared", "First", "+1 513 490 1948"),
+                ("Shared", "Second", "513.490.1948"),
+            ],
+        ),
+        use_cache=False,
+    )
+    assert index.name_for("+15134901945") == "Full Number"
+    assert index.name_for("5134901945") == "Full Number"
+    # Saved without an area code, matches any number ending in it
+    assert index.name_for("+15134901946") == "No AreaCode"
+    assert index.name_for("+14084901946") == "No AreaCode"
+    assert index.name_for("+15134901949") is None
+    # The longest number that fits wins
+    assert index.name_for("+15133311947") == "Longer Suffix"
+    assert index.name_for("+15134901947") == "Short Code"
+    # One name per number, the first record that has it
+    assert index.name_for("+15134901948") == "Shared First"
+    assert index.name_for("someone@example.com") is None
@@ -0,0 +1,139 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator, List, Tuple
+
+import pytest
+
+import messages
+from messages import daemon
+
+# Stands in for the CLI: echoes its arguments, complains on stderr and exits with argv[0]
+SERVER_SCRIPT = """
+import os
+import sys
+
+from messages.daemon import serve
+
+
+def run(argv):
+    if argv[0] == "raise":
+        raise ValueError("boom")
+    print(" ".join(argv[1:]))
+    print(os.getcwd(), file=sys.stderr)
+    print("x" * int(os.getenv("BIG_OUTPUT", "0")), end="")
+    return int(argv[0])
+
+
+serve(run, sys.argv[1])
+"""
+BIG_OUTPUT = 3 * daemon.FRAME_BUFFER_SIZE + 5
+TIMEOUT_SECONDS = 30
+
+
+def read_frames(conn: socket.socket) -> List[Tuple[bytes, bytes]]:
+    frames: List[Tuple[bytes, bytes]] = []
+    with conn.makefile("rb") as response:
+        while True:
+            header = response.read(daemon.FRAME_HEADER.size)
+            if not header:
+                return frames
+            kind, length = daemon.FRAME_HEADER.unpack(header)
+            frames.append((kind, response.read(length)))
+
+
+@pytest.fixture
+def socket_path() -> Iterator[str]:
+    # Unix socket paths are limited to ~100 bytes, pytest's tmp_path can be longer
+    workdir = tempfile.mkdtemp(prefix="messages-")
+    yield os.path.join(workdir, "messages.sock")
+    if os.path.exists(os.path.join(workdir, "messages.sock")):
+        os.remove(os.path.join(workdir, "messages.sock"))
+    os.rmdir(workdir)
+
+
+@pytest.fixture
+def server(socket_path: str) -> Iterator[str]:
+    """A daemon running SERVER_SCRIPT in its own process, yields its socket path."""
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.path.dirname(os.path.dirname(messages.__file__)),
+        "BIG_OUTPUT": str(BIG_OUTPUT),
+    }
+    process = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, socket_path], env=env)
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    while not daemon.is_running(socket_path):
+        assert process.poll() is None, "the daemon exited before listening"
+        assert time.monotonic() < deadline, "the daemon never started listening"
+        time.sleep(0.05)
+    yield socket_path
+    process.send_signal(signal.SIGINT)
+    assert process.wait(TIMEOUT_SECONDS) == 0
+    # serve cleans up after itself
+    assert not os.path.exists(socket_path)
+
+
+def test_frame_writer_frames_what_it_is_given() -> None:
+    ours, theirs = socket.socketpair()
+    with theirs:
+        writer = daemon._FrameWriter(theirs, daemon.STDOUT_FRAME)
+        assert writer.write(b"hello") == 5
+        assert writer.write(memoryview(b"")) == 0
+    with ours:
+        assert read_frames(ours) == [(b"o", b"hello"), (b"o", b"")]
+
+
+def test_handle_routes_output_into_frames(tmp_path: str) -> None:
+    def run(argv: List[str]) -> int:
+        print("out", *argv)
+        print("err", file=sys.stderr)
+        print(os.getcwd())
+        return 3
+
+    ours, theirs = socket.socketpair()
+    original_stdout, original_cwd = sys.stdout, os.getcwd()
+    with ours:
+        ours.sendall(f'{{"argv": ["a", "b"], "cwd": "{tmp_path}"}}\n'.encode())
+        with theirs:
+            daemon._handle(theirs, run)
+        frames = read_frames(ours)
+    assert sys.stdout is original_stdout
+    assert os.getcwd() == original_cwd
+    assert frames == [
+        (daemon.STDERR_FRAME, b"err\n"),
+        (daemon.STDOUT_FRAME, f"out a b\n{tmp_path}\n".encode()),
+        (daemon.EXIT_FRAME, b"3"),
+    ]
+
+
+def test_forward_without_a_daemon(socket_path: str) -> None:
+    assert not daemon.is_running(socket_path)
+    assert daemon.forward(["search", "dinner"], socket_path) is None
+
+
+def test_forward_round_trip(
+    server: str,
+    tmp_path: str,
+    monkeypatch: pytest.MonkeyPatch,
+    capfdbinary: pytest.CaptureFixture[bytes],
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    assert daemon.forward(["7", "héllo", "world"], server) == 7
+    out, err = capfdbinary.readouterr()
+    assert out == "héllo world\n".encode() + b"x" * BIG_OUTPUT
+    assert err == f"{os.path.realpath(str(tmp_path))}\n".encode()
+
+    # The daemon keeps answering, a failing run reports its traceback and exits 1
+    assert daemon.forward(["raise"], server) == 1
+    out, err = capfdbinary.readouterr()
+    assert out == b""
+    assert b"ValueError: boom" in err
+
+
+def test_serve_refuses_a_second_daemon(server: str) -> None:
+    with pytest.raises(OSError):
+        daemon.serve(lambda argv: 0, server)
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+from typing import Tuple
+
+import pytest
+from messages.mirror import MessagesMirror
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def sync(mirror: MessagesMirror, db_path: str) -> int:
+    source_conn = sqlite3.connect(db_path)
+    try:
+        return mirror.sync(source_conn, [])
+    finally:
+        source_conn.close()
+
+
+def test_sync_only_copies_new_messages(synthetic_db: Tuple[str, str], tmp_path: str) -> None:
+    db_path, _ = synthetic_db
+    mirror = MessagesMirror(os.path.join(str(tmp_path), "mirror.db"))
+    assert sync(mirror, db_path) == mirror.count() > 0
+    assert sync(mirror, db_path) == 0
+
+
+def test_sync_tolerates_deleted_messages(synthetic_db: Tuple[str, str], tmp_path: str) -> None:
+    db_path, _ = synthetic_db
+    mirror = MessagesMirror(os.path.join(str(tmp_path), "mirror.db"))
+    sync(mirror, db_path)
+
+    copy_path = os.path.join(str(tmp_path), "chat.db")
+    source_conn = sqlite3.connect(db_path)
+    copy_conn = sqlite3.connect(copy_path)
+    source_conn.backup(copy_conn)
+    source_conn.close()
+    copy_conn.execute("DELETE FROM message WHERE ROWID = (SELECT MAX(ROWID) FROM message)")
+    copy_conn.commit()
+    copy_conn.close()
+    assert sync(mirror, copy_path) == 0
+
+
+def test_sync_refuses_another_database(synthetic_db: Tuple[str, str], tmp_path: str) -> None:
+    db_path, _ = synthetic_db
+    other_db_path, _ = generate(
+        SyntheticConfig(num_messages=1000, seed=7), os.path.join(str(tmp_path), "other")
+    )
+    mirror = MessagesMirror(os.path.join(str(tmp_path), "mirror.db"))
+    sync(mirror, db_path)
+    num_mirrored = mirror.count()
+
+    with pytest.raises(ValueError, match="different chat.db"):
+        sync(mirror, other_db_path)
+    assert mirror.count() == num_mirrored
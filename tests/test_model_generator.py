@@ -0,0 +1,46 @@
+import os
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Tuple
+
+import pytest
+
+from messages import model_generator
+from messages.messages_db_client import MessagesDbClient
+from messages.model_generator import ModelGenerator
+
+
+def generated(client: MessagesDbClient, output_dir: str, workers: int) -> Dict[str, str]:
+    """File contents by chat, the file names carry a timestamp."""
+    os.makedirs(output_dir)
+    contents = {}
+    for filename in ModelGenerator(client).generate_for_top_chats(3, output_dir, workers):
+        with open(filename, encoding="utf-8") as f:
+            contents[os.path.basename(filename).split(".")[0]] = f.read()
+    return contents
+
+
+def test_serial_streams_each_chat_and_matches_the_workers(
+    synthetic_db: Tuple[str, str],
+    tmp_path: str,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    row_types: List[type] = []
+    generate_for_chat = model_generator._generate_for_chat
+
+    def spy(chat_identifier: str, rows: Iterable[Any], *args: Any) -> Tuple[str, int]:
+        row_types.append(type(rows))
+        return generate_for_chat(chat_identifier, rows, *args)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(model_generator, "_generate_for_chat", spy)
+        serial = generated(client, os.path.join(str(tmp_path), "serial"), workers=1)
+    # The rows come straight off the cursor, never collected into a list
+    assert row_types == [type(next(groupby([0]))[1])] * 3
+
+    assert generated(client, os.path.join(str(tmp_path), "workers"), workers=2) == serial
+    assert all(serial.values())
+    client.close()
+    capsys.readouterr()
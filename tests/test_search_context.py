@@ -0,0 +1,46 @@
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+import pytest
+from messages.messages_db_client import MessagesDbClient
+
+
+def expected_context(db_path: str, text: str, before: int, after: int) -> Set[Tuple[str, bool]]:
+    """(guid, is_match) of every match and the messages around it, the slow way."""
+    conn = sqlite3.connect(db_path)
+    chats: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+    for chat_id, guid, message_text in conn.execute(
+        "SELECT chat_message_join.chat_id, message.guid, IFNULL(message.text, '') "
+        "FROM chat_message_join JOIN message ON message.ROWID = chat_message_join.message_id "
+        "ORDER BY message.date, message.ROWID"
+    ):
+        chats[chat_id].append((guid, message_text))
+    conn.close()
+
+    rows: Set[Tuple[str, bool]] = set()
+    for messages in chats.values():
+        matches = [idx for idx, (_, body) in enumerate(messages) if text in body.lower()]
+        for idx, (guid, _) in enumerate(messages):
+            if any(match - before <= idx <= match + after for match in matches):
+                rows.add((guid, idx in matches))
+    return rows
+
+
+@pytest.mark.parametrize("before,after", [(2, 2), (0, 3), (4, 0)])
+def test_context_windows(synthetic_db: Tuple[str, str], before: int, after: int) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    rows = list(
+        client.search_messages_by_text("dinner", before_number=before, after_number=after)
+    )
+    client.close()
+
+    assert {(row[0], bool(row[6])) for row in rows} == expected_context(
+        db_path, "dinner", before, after
+    )
+    # Every message shows up once, even where windows overlap
+    assert len(rows) == len({row[0] for row in rows})
+    # Groups are numbered in the order they're returned
+    groups = [row[7] for row in rows]
+    assert groups == sorted(groups)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import sqlite3
+from typing import List, Tuple
+
+from messages.messages_db_client import MessagesDbClient
+from messages.search_index import MessageSearchIndex, to_fts_query
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def search_guids(client: MessagesDbClient, text: str) -> List[str]:
+    # Columns are (guid, message_date, text, ...), see SEARCH_BY_TEXT_WITH_CONTACT in queries.py
+    return sorted(row[0] for row in client.search_messages_by_text(text))
+
+
+def like_guids(db_path: str, text: str) -> List[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(
+            guid
+            for (guid,) in conn.execute(
+                "SELECT guid FROM message WHERE text LIKE ?", ["%" + text + "%"]
+            )
+        )
+    finally:
+        conn.close()
+
+
+def test_to_fts_query_quotes_words_and_keeps_phrases_and_prefixes() -> None:
+    assert to_fts_query("absolute stud") == '"absolute" "stud"'
+    assert to_fts_query('"on my way" hom*') == '"on my way" "hom"*'
+    assert to_fts_query("don't") == '"don\'t"'
+
+
+def test_index_is_per_source_database(synthetic_db: Tuple[str, str], tmp_path: str) -> None:
+    db_path, _ = synthetic_db
+    copy_path = os.path.join(str(tmp_path), "chat.db")
+    shutil.copy(db_path, copy_path)
+    assert MessageSearchIndex(source_db_path=db_path).path != MessageSearchIndex(
+        source_db_path=copy_path
+    ).path
+
+
+def test_index_is_rebuilt_when_chat_db_is_replaced(tmp_path: str) -> None:
+    data_dir = os.path.join(str(tmp_path), "data")
+    db_path, address_book_path = generate(SyntheticConfig(num_messages=2000, seed=1), data_dir)
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    assert client.refresh_search_index() == 2000
+    client.close()
+
+    # Same path and the same number of messages, different history
+    generate(SyntheticConfig(num_messages=2000, seed=2), data_dir)
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    assert client.search_index.exists()
+    fts_guids = search_guids(client, '"see you"')
+    assert fts_guids and fts_guids == like_guids(db_path, "see you")
+    client.close()
+
+
+def test_index_is_refreshed_incrementally_otherwise(synthetic_db: Tuple[str, str]) -> None:
+    db_path, address_book_path = synthetic_db
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    assert client.refresh_search_index() > 0
+    assert client.refresh_search_index() == 0
+    client.close()
+
+
+def test_deleting_the_newest_message_does_not_rebuild(tmp_path: str) -> None:
+    db_path, address_book_path = generate(
+        SyntheticConfig(num_messages=2000), os.path.join(str(tmp_path), "data")
+    )
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    assert client.refresh_search_index() == 2000
+    client.close()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM message WHERE ROWID = (SELECT MAX(ROWID) FROM message)")
+    conn.commit()
+    conn.close()
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    assert client.refresh_search_index() == 0
+    client.close()
+
+
+def test_a_warm_client_indexes_messages_received_since(tmp_path: str) -> None:
+    db_path, address_book_path = generate(
+        SyntheticConfig(num_messages=2000), os.path.join(str(tmp_path), "data")
+    )
+    client = MessagesDbClient(db_path=db_path, address_book_path=address_book_path)
+    client.refresh_search_index()
+    assert search_guids(client, "zyzzyva") == []
+
+    # A message arrives while the client (e.g. the one `messages serve` keeps) is open
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO message (guid, text, handle_id, service, date, is_from_me) "
+        "SELECT 'NEW-MESSAGE', 'a zyzzyva!', handle_id, service, date + 1, is_from_me "
+        "FROM message ORDER BY ROWID DESC LIMIT 1"
+    )
+    conn.execute(
+        "INSERT INTO chat_message_join (chat_id, message_id, message_date) "
+        "SELECT chat_id, last_insert_rowid(), message_date + 1 "
+        "FROM chat_message_join ORDER BY message_id DESC LIMIT 1"
+    )
+    conn.commit()
+    conn.close()
+    assert search_guids(client, "zyzzyva") == ["NEW-MESSAGE"]
+    client.close()
@@ -0,0 +1,33 @@
+from typing import List, Optional, Tuple
+
+from messages.profiler import PROFILER
+from messages.sentiment_classifier import SentimentAnalysisModel
+
+MESSAGES: List[Optional[str]] = ["ok", "lol", "ok ", "on my way", None, "lol"]
+
+
+def test_memo_counts_repeats_as_hits() -> None:
+    model = SentimentAnalysisModel()
+    model.analyze_many(MESSAGES)
+    model.analyze_many(["lol"])
+    assert (model.memo_stats.hits, model.memo_stats.misses) == (3, 3)
+
+
+def test_worker_memo_counts_are_added_up_and_profiled() -> None:
+    batches: List[Tuple[int, List[Optional[str]]]] = [(0, MESSAGES), (1, MESSAGES)]
+    serial = SentimentAnalysisModel()
+    pooled = SentimentAnalysisModel(workers=2)
+    PROFILER.enable()
+    try:
+        pooled_results = list(pooled.analyze_batches(batches))
+        counters = PROFILER.report()["counters"]
+    finally:
+        PROFILER.disable()
+        pooled.shutdown()
+
+    assert pooled_results == list(serial.analyze_batches(batches))
+    # Each batch may land on a different worker, with its own memo
+    assert pooled.memo_stats.hits + pooled.memo_stats.misses == 10
+    assert pooled.memo_stats.hits >= 4
+    assert counters["sentiment.memo.hits"] == pooled.memo_stats.hits
+    assert counters["sentiment.memo.misses"] == pooled.memo_stats.misses
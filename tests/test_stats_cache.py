@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+from messages.messages_db_client import MessagesDbClient
+from messages.messages_db_manager import MessagesDbManager
+
+from synthetic_db import SyntheticConfig, generate
+
+
+def test_name_stats_follow_contact_changes(tmp_path: str) -> None:
+    db_path, address_book_dir = generate(
+        SyntheticConfig(num_messages=3000, num_contacts=50, num_unknown_chats=20),
+        os.path.join(str(tmp_path), "data"),
+    )
+    address_book_path = os.path.join(address_book_dir, os.listdir(address_book_dir)[0])
+    conn = sqlite3.connect(address_book_path)
+    first_name, last_name = conn.execute(
+        "SELECT ZFIRSTNAME, ZLASTNAME FROM ZABCDRECORD ORDER BY Z_PK LIMIT 1"
+    ).fetchone()
+    conn.close()
+    full_name = f"{first_name} {last_name}"
+
+    def stats() -> object:
+        manager = MessagesDbManager(
+            client=MessagesDbClient(db_path=db_path, address_book_path=address_book_dir),
+            use_sentiment_cache=False,
+        )
+        try:
+            return manager.message_stats(search_name=full_name)
+        finally:
+            manager.close()
+
+    before = stats()
+    assert before == stats()
+
+    # The contact is renamed, nothing else changes
+    conn = sqlite3.connect(address_book_path)
+    conn.execute("UPDATE ZABCDRECORD SET ZFIRSTNAME = 'Someone', ZLASTNAME = 'Else'")
+    conn.commit()
+    conn.close()
+    assert stats() != before